@@ -0,0 +1,25 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Header, Request
+from fastapi.responses import ORJSONResponse
+
+from services.aggregate import DASHBOARD_PARTS, aggregate
+from services.upstream import UpstreamClient, get_upstreams
+
+router = APIRouter()
+
+
+@router.get('/dashboard/')
+async def dashboard(
+        request: Request, user_agent: Annotated[str | None, Header()] = None,
+        upstreams: dict[str, UpstreamClient] = Depends(get_upstreams)
+):
+    '''
+    Метод возвращает данные для страницы пользователя одним запросом: user (get_user),
+    profile (self_data) и history (get_history). Части запрашиваются параллельно.
+    '''
+    headers = {
+        'User-Agent': user_agent,
+    }
+    status, content = await aggregate(upstreams, DASHBOARD_PARTS, headers, request.cookies)
+    return ORJSONResponse(status_code=status, content=content)
@@ -1,22 +1,30 @@
+from http import HTTPStatus
 from typing import Annotated
 
-from fastapi import APIRouter, Header, Response, Request
-import requests
+from fastapi import APIRouter, Depends, Header, Response, Request
 
 from core.config import app_settings
 from schemas.entity import UserLogin, UserCreate
+from services.single_flight import SingleFlight, get_single_flight
+from services.token_cache import TokenCache, get_token_cache
+from services.upstream import UpstreamClient, get_upstream
 
 router = APIRouter()
 
 
 @router.post('/login/')
-async def login(response: Response, data: UserLogin, user_agent: Annotated[str | None, Header()] = None):
-    url = f'{app_settings.auth_url}/api/v1/auth/login/'
+async def login(
+        request: Request, response: Response, data: UserLogin, user_agent: Annotated[str | None, Header()] = None,
+        upstream: UpstreamClient = Depends(get_upstream)
+):
+    url = '/api/v1/auth/login/'
     headers = {
         'User-Agent': user_agent,
+        # по нему сервис ограничивает число попыток входа
+        'X-Real-IP': request.headers.get('x-real-ip'),
     }
 
-    response_auth = requests.post(url=url, json=data.dict(), headers=headers)
+    response_auth = await upstream.request('POST', url, json=data.dict(), headers=headers)
 
     for cookie in response_auth.cookies.items():
         response.set_cookie(key=cookie[0], value=cookie[1])
@@ -25,33 +33,77 @@ async def login(response: Response, data: UserLogin, user_agent: Annotated[str |
 
 
 @router.post('/sign_up/')
-async def sign_up(data: UserCreate):
-    url = f'{app_settings.auth_url}/api/v1/auth/sign_up/'
-    response_auth = requests.post(url=url, json=data.dict())
+async def sign_up(data: UserCreate, upstream: UpstreamClient = Depends(get_upstream)):
+    url = '/api/v1/auth/sign_up/'
+    response_auth = await upstream.request('POST', url, json=data.dict())
     body = response_auth.json()
     return body
 
 
 @router.get('/get_user/')
-async def get_user(request: Request, user_agent: Annotated[str | None, Header()] = None):
-    url = f'{app_settings.auth_url}/api/v1/auth/get_user/'
+async def get_user(
+        request: Request, user_agent: Annotated[str | None, Header()] = None,
+        upstream: UpstreamClient = Depends(get_upstream),
+        token_cache: TokenCache = Depends(get_token_cache),
+        single_flight: SingleFlight = Depends(get_single_flight)
+):
+    url = '/api/v1/auth/get_user/'
     headers = {
         'User-Agent': user_agent,
     }
+    access_token = request.cookies.get(app_settings.access_cookie_key)
+    if access_token:
+        body = token_cache.get(access_token, user_agent)
+        if body is not None:
+            return body
 
-    response_auth = requests.get(url=url, headers=headers, cookies=request.cookies)
+    key = single_flight.make_key('GET', url, request.cookies, (app_settings.access_cookie_key,), user_agent)
+    response_auth = await single_flight.do(
+        key, lambda: upstream.request('GET', url, headers=headers, cookies=request.cookies)
+    )
     body = response_auth.json()
+    if access_token:
+        if response_auth.status_code == HTTPStatus.OK:
+            token_cache.put(access_token, user_agent, body)
+        else:
+            # токен отозван или помечен как небезопасный - ответы для других User-Agent тоже неактуальны
+            token_cache.evict_token(access_token)
     return body
 
 
 @router.post('/refresh/')
-async def refresh(request: Request, response: Response, user_agent: Annotated[str | None, Header()] = None):
-    url = f'{app_settings.auth_url}/api/v1/auth/refresh/'
+async def refresh(
+        request: Request, response: Response, user_agent: Annotated[str | None, Header()] = None,
+        upstream: UpstreamClient = Depends(get_upstream),
+        token_cache: TokenCache = Depends(get_token_cache)
+):
+    url = '/api/v1/auth/refresh/'
     headers = {
         'User-Agent': user_agent,
+        'X-Real-IP': request.headers.get('x-real-ip'),
     }
-    response_auth = requests.post(url=url, headers=headers, cookies=request.cookies)
+    token_cache.evict_token(request.cookies.get(app_settings.access_cookie_key))
+    response_auth = await upstream.request('POST', url, headers=headers, cookies=request.cookies)
     for cookie in response_auth.cookies.items():
         response.set_cookie(key=cookie[0], value=cookie[1])
     body = response_auth.json()
     return body
+
+
+@router.get('/logout/')
+async def logout(
+        request: Request, response: Response, user_agent: Annotated[str | None, Header()] = None,
+        upstream: UpstreamClient = Depends(get_upstream),
+        token_cache: TokenCache = Depends(get_token_cache)
+):
+    url = '/api/v1/auth/logout/'
+    headers = {
+        'User-Agent': user_agent,
+    }
+    token_cache.evict_token(request.cookies.get(app_settings.access_cookie_key))
+    response_auth = await upstream.request('GET', url, headers=headers, cookies=request.cookies)
+    if response_auth.status_code == HTTPStatus.OK:
+        response.delete_cookie(key=app_settings.access_cookie_key)
+        response.delete_cookie(key=app_settings.refresh_cookie_key)
+    body = response_auth.json()
+    return body
@@ -0,0 +1,49 @@
+from fastapi import APIRouter, Depends, Request
+
+from core.config import app_settings
+from services.proxy import cached_token_request, proxy_request
+from services.single_flight import SingleFlight, get_single_flight
+from services.token_cache import TokenCache, get_token_cache
+from services.upstream import UpstreamClient, get_upstream
+
+router = APIRouter()
+
+
+@router.post('/login/')
+async def login(request: Request, upstream: UpstreamClient = Depends(get_upstream)):
+    return await proxy_request(request, upstream, '/api/v1/auth/login/')
+
+
+@router.post('/sign_up/')
+async def sign_up(request: Request, upstream: UpstreamClient = Depends(get_upstream)):
+    return await proxy_request(request, upstream, '/api/v1/auth/sign_up/')
+
+
+@router.get('/get_user/')
+async def get_user(
+        request: Request,
+        upstream: UpstreamClient = Depends(get_upstream),
+        token_cache: TokenCache = Depends(get_token_cache),
+        single_flight: SingleFlight = Depends(get_single_flight)
+):
+    return await cached_token_request(request, upstream, '/api/v1/auth/get_user/', token_cache, single_flight)
+
+
+@router.post('/refresh/')
+async def refresh(
+        request: Request,
+        upstream: UpstreamClient = Depends(get_upstream),
+        token_cache: TokenCache = Depends(get_token_cache)
+):
+    token_cache.evict_token(request.cookies.get(app_settings.access_cookie_key))
+    return await proxy_request(request, upstream, '/api/v1/auth/refresh/')
+
+
+@router.get('/logout/')
+async def logout(
+        request: Request,
+        upstream: UpstreamClient = Depends(get_upstream),
+        token_cache: TokenCache = Depends(get_token_cache)
+):
+    token_cache.evict_token(request.cookies.get(app_settings.access_cookie_key))
+    return await proxy_request(request, upstream, '/api/v1/auth/logout/')
@@ -0,0 +1,81 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask, BackgroundTasks
+
+from core.config import app_settings
+from core.metrics import metrics
+from core.routes import CachePolicy, RouteState, route_table
+from services.proxy import cached_token_request, proxy_request
+from services.single_flight import SingleFlight, get_single_flight
+from services.token_cache import TokenCache, get_token_cache
+from services.upstream import UpstreamClient, get_upstreams
+
+router = APIRouter()
+
+
+@router.api_route(
+    '/{path:path}', methods=['GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'HEAD', 'OPTIONS'], include_in_schema=False
+)
+async def reverse_proxy(
+        request: Request,
+        upstreams: dict[str, UpstreamClient] = Depends(get_upstreams),
+        token_cache: TokenCache = Depends(get_token_cache),
+        single_flight: SingleFlight = Depends(get_single_flight)
+):
+    '''
+    Проксирует запрос в пул сервисов по таблице маршрутов core.routes.
+    '''
+    state = route_table.match(request.url.path)
+    if state is None:
+        raise HTTPException(status_code=404, detail='Not Found')
+    route = state.route
+    if route.max_concurrency is not None and state.in_flight >= route.max_concurrency:
+        metrics.inc(f'route_rejected_total:{route.prefix}')
+        raise HTTPException(status_code=503, detail='Сервис перегружен')
+    metrics.inc(f'route_requests_total:{route.prefix}')
+    if route.evict_token:
+        token_cache.evict_token(request.cookies.get(app_settings.access_cookie_key))
+
+    upstream = upstreams[route.upstream]
+    state.in_flight += 1
+    try:
+        if route.cache is CachePolicy.token and request.method == 'GET':
+            response = await cached_token_request(
+                request, upstream, request.url.path, token_cache, single_flight, timeout=route.timeout
+            )
+        else:
+            response = await proxy_request(request, upstream, request.url.path, timeout=route.timeout)
+    except BaseException:
+        state.in_flight -= 1
+        raise
+    if isinstance(response, StreamingResponse):
+        release_after_body(response, state)
+    else:
+        state.in_flight -= 1
+    return response
+
+
+def release_after_body(response: StreamingResponse, state: RouteState) -> None:
+    '''
+    Освобождает место маршрута, когда тело ответа отправлено клиенту, а не когда обработчик вернул ответ:
+    max_concurrency ограничивает и долгие потоковые ответы. Место освобождается один раз - после отправки тела
+    (background) или при обрыве отправки (закрытие итератора тела).
+    '''
+    released = False
+
+    def release() -> None:
+        nonlocal released
+        if not released:
+            released = True
+            state.in_flight -= 1
+
+    async def body(iterator):
+        try:
+            async for chunk in iterator:
+                yield chunk
+        finally:
+            release()
+
+    response.body_iterator = body(response.body_iterator)
+    tasks = [response.background] if response.background is not None else []
+    response.background = BackgroundTasks(tasks + [BackgroundTask(release)])
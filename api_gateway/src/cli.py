@@ -0,0 +1,63 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import typer
+
+from core.config import app_settings
+from main import app as gateway_app
+from services.benchmark import measure_request_cpu, measure_throughput
+
+app = typer.Typer()
+
+
+@app.callback()
+def main():
+    '''
+    Служебные команды шлюза.
+    '''
+
+
+@app.command(name='measure_throughput')
+def measure_proxy_throughput(
+        path: str = '/api/v1/get_user/',
+        count: int = 2000,
+        concurrency: int = 50,
+        latency_ms: float = 20
+):
+    '''
+    Замеряет пропускную способность шлюза: заглушка сервиса авторизации с задержкой latency_ms
+    запускается в отдельном процессе на свободном порту. Запускать с теми же переменными окружения,
+    что и шлюз (пул соединений, таймауты, GATEWAY_PASS_THROUGH).
+    '''
+    rps = asyncio.run(measure_throughput(gateway_app, path, count, concurrency, latency_ms / 1000))
+    print(f'{path}: {rps} req/s')
+
+
+@app.command(name='measure_request_cpu')
+def measure_login_cpu(count: int = 3000, reply_size: int = 1024):
+    '''
+    Замеряет процессорное время шлюза на POST /api/v1/login/ в режиме, заданном GATEWAY_PASS_THROUGH.
+    '''
+    mode = 'pass-through' if app_settings.pass_through else 'parse'
+    cpu = asyncio.run(measure_request_cpu(gateway_app, count, reply_size))
+    print(f'{mode}: {cpu} us CPU per request')
+
+
+@app.command(name='compare_pass_through')
+def compare_pass_through(count: int = 3000, reply_size: int = 1024):
+    '''
+    Сравнивает процессорное время на запрос в режиме разбора тел и в режиме прозрачного проксирования.
+    Режим выбирается при импорте приложения, поэтому каждый замер идет в отдельном процессе.
+    '''
+    for pass_through in ('false', 'true'):
+        subprocess.run(
+            [sys.executable, __file__, 'measure_request_cpu', '--count', str(count), '--reply-size', str(reply_size)],
+            env={**os.environ, 'GATEWAY_PASS_THROUGH': pass_through},
+            check=True,
+        )
+
+
+if __name__ == "__main__":
+    app()
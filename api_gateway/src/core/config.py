@@ -9,10 +9,33 @@ class Settings(BaseModel):
     project_name: str = os.getenv('PROJECT_NAME')
     auth_port: str = os.getenv('URL_PORT')
     auth_url: str = os.getenv('URL_AUTH')
+    # экземпляры сервиса авторизации через запятую (host:port), по умолчанию URL_AUTH:URL_PORT
+    auth_upstreams: list[str] = [url for url in os.getenv('AUTH_UPSTREAMS', '').split(',') if url]
+    # бюджет времени на обработку запроса, передается в сервисы заголовком X-Request-Deadline-Ms
+    request_deadline: float = float(os.getenv('REQUEST_DEADLINE', 10))
+    upstream_timeout: float = float(os.getenv('UPSTREAM_TIMEOUT', 5))
+    upstream_connect_timeout: float = float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', 1))
+    upstream_max_connections: int = int(os.getenv('UPSTREAM_MAX_CONNECTIONS', 100))
+    upstream_max_keepalive: int = int(os.getenv('UPSTREAM_MAX_KEEPALIVE', 20))
+    upstream_keepalive_expiry: float = float(os.getenv('UPSTREAM_KEEPALIVE_EXPIRY', 30))
+    upstream_max_retries: int = int(os.getenv('UPSTREAM_MAX_RETRIES', 1))
+    circuit_failure_threshold: int = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', 5))
+    circuit_recovery_time: float = float(os.getenv('CIRCUIT_RECOVERY_TIME', 10))
+    # режим прозрачного проксирования: тела запросов и ответов не разбираются
+    pass_through: bool = os.getenv('GATEWAY_PASS_THROUGH', 'false').lower() == 'true'
+    access_cookie_key: str = 'access_token_cookie'
+    refresh_cookie_key: str = 'refresh_token_cookie'
+    get_user_cache_ttl: float = float(os.getenv('GET_USER_CACHE_TTL', 30))
+    get_user_cache_size: int = int(os.getenv('GET_USER_CACHE_SIZE', 10000))
 
     def __init__(self, **data):
         super().__init__(**data)
         self.auth_url = f'http://{self.auth_url}:{self.auth_port}'
+        self.auth_upstreams = [f'http://{url.strip()}' for url in self.auth_upstreams] or [self.auth_url]
+
+    @property
+    def upstream_pools(self) -> dict[str, list[str]]:
+        return {'auth': self.auth_upstreams}
 
     class Config:
         env_file = '.env'
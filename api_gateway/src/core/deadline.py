@@ -0,0 +1,39 @@
+from contextvars import ContextVar
+from time import monotonic
+
+# оставшийся бюджет запроса в миллисекундах на момент отправки
+DEADLINE_HEADER = 'X-Request-Deadline-Ms'
+
+request_deadline: ContextVar[float | None] = ContextVar('request_deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    '''
+    Бюджет времени запроса исчерпан.
+    '''
+
+
+def set_deadline(budget: float) -> None:
+    request_deadline.set(monotonic() + budget)
+
+
+def parse_budget(header: str | None) -> float | None:
+    try:
+        return int(header) / 1000
+    except (TypeError, ValueError):
+        return None
+
+
+def remaining_budget() -> float | None:
+    """
+    :return:
+    float | None: Оставшийся бюджет в секундах или None, если у запроса нет дедлайна.
+                  Если бюджет исчерпан, выбрасывает DeadlineExceeded.
+    """
+    deadline = request_deadline.get()
+    if deadline is None:
+        return None
+    budget = deadline - monotonic()
+    if budget <= 0:
+        raise DeadlineExceeded
+    return budget
@@ -0,0 +1,57 @@
+from bisect import bisect_left
+from collections import defaultdict
+
+
+class Histogram:
+    '''
+    Гистограмма с фиксированными границами корзин (в секундах).
+    '''
+
+    buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def as_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'buckets': dict(zip([*map(str, self.buckets), '+Inf'], self.counts)),
+        }
+
+
+class Metrics:
+    '''
+    Счетчики, значения и гистограммы одного воркера.
+    '''
+
+    def __init__(self):
+        self.counters: dict[str, int] = defaultdict(int)
+        self.gauges: dict[str, float] = {}
+        self.histograms: dict[str, Histogram] = defaultdict(Histogram)
+
+    def inc(self, name: str, value: int = 1) -> None:
+        self.counters[name] += value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        self.gauges[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        self.histograms[name].observe(value)
+
+    def snapshot(self) -> dict:
+        return {
+            'counters': dict(self.counters),
+            'gauges': dict(self.gauges),
+            'histograms': {name: hist.as_dict() for name, hist in self.histograms.items()},
+        }
+
+
+metrics = Metrics()
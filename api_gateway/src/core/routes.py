@@ -0,0 +1,65 @@
+import re
+from enum import Enum
+
+from pydantic import BaseModel
+
+
+class CachePolicy(Enum):
+    none = 'none'
+    # ответ зависит только от access токена и User-Agent, кешируется в TokenCache
+    token = 'token'
+
+
+class Route(BaseModel):
+    prefix: str
+    upstream: str
+    timeout: float = 5
+    cache: CachePolicy = CachePolicy.none
+    max_concurrency: int | None = None
+    # запрос делает access токен недействительным (logout, refresh)
+    evict_token: bool = False
+    # внутренний метод сервиса: наружу не проксируется, даже если попадает под более короткий префикс
+    internal: bool = False
+
+
+class RouteState:
+    def __init__(self, route: Route):
+        self.route = route
+        self.in_flight = 0
+
+
+# порядок не важен: при совпадении нескольких префиксов выбирается самый длинный
+ROUTES = [
+    Route(prefix='/api/v1/auth/get_user/', upstream='auth', timeout=2, cache=CachePolicy.token),
+    Route(prefix='/api/v1/auth/logout/', upstream='auth', evict_token=True),
+    Route(prefix='/api/v1/auth/logout_all/', upstream='auth', evict_token=True),
+    Route(prefix='/api/v1/auth/refresh/', upstream='auth', evict_token=True),
+    Route(prefix='/api/v1/auth/introspect/', upstream='auth', internal=True),
+    Route(prefix='/api/v1/auth/', upstream='auth', max_concurrency=200),
+    Route(prefix='/api/v1/profil/', upstream='auth', max_concurrency=200),
+    Route(prefix='/api/v1/admin/', upstream='auth', max_concurrency=20),
+    Route(prefix='/api/v1/authz/', upstream='auth', timeout=1),
+]
+
+
+class RouteTable:
+    '''
+    Таблица маршрутов с заранее скомпилированным поиском по префиксу пути.
+    '''
+
+    def __init__(self, routes: list[Route]):
+        self.states = sorted((RouteState(route) for route in routes), key=lambda state: -len(state.route.prefix))
+        # одно регулярное выражение на все префиксы, длинные префиксы проверяются первыми
+        self.pattern = re.compile('|'.join(
+            f'(?P<r{index}>{re.escape(state.route.prefix)})' for index, state in enumerate(self.states)
+        ))
+
+    def match(self, path: str) -> RouteState | None:
+        found = self.pattern.match(path)
+        if found is None:
+            return None
+        state = self.states[int(found.lastgroup[1:])]
+        return None if state.route.internal else state
+
+
+route_table = RouteTable(ROUTES)
@@ -1,10 +1,15 @@
+import httpx
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.responses import ORJSONResponse
 
 from core.config import app_settings as settings
+from core.deadline import DEADLINE_HEADER, DeadlineExceeded, parse_budget, set_deadline
+from core.metrics import metrics as gateway_metrics
+from services import token_cache, upstream
+from services.balancer import LoadBalancer, NoUpstreamAvailable
 
-from api.v1 import gateway
+from api.v1 import dashboard, gateway, metrics, proxy, reverse_proxy
 
 
 app = FastAPI(
@@ -14,7 +19,88 @@ app = FastAPI(
     default_response_class=ORJSONResponse,
 )
 
-app.include_router(gateway.router, prefix='/api/v1', tags=['login'])
+
+@app.middleware('http')
+async def request_deadline(request: Request, call_next):
+    budget = settings.request_deadline
+    incoming = parse_budget(request.headers.get(DEADLINE_HEADER))
+    if incoming is not None:
+        budget = min(budget, incoming)
+    if budget <= 0:
+        return deadline_exceeded_handler(request, DeadlineExceeded())
+    set_deadline(budget)
+    return await call_next(request)
+
+
+@app.exception_handler(DeadlineExceeded)
+def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded):
+    gateway_metrics.inc('deadline_exceeded_total')
+    return ORJSONResponse(
+        status_code=504,
+        content={"detail": "Истекло время обработки запроса"}
+    )
+
+
+@app.exception_handler(httpx.TimeoutException)
+def upstream_timeout_handler(request: Request, exc: httpx.TimeoutException):
+    return ORJSONResponse(
+        status_code=504,
+        content={"detail": "Сервис не ответил вовремя"}
+    )
+
+
+@app.exception_handler(httpx.TransportError)
+def upstream_error_handler(request: Request, exc: httpx.TransportError):
+    return ORJSONResponse(
+        status_code=502,
+        content={"detail": "Сервис недоступен"}
+    )
+
+
+@app.exception_handler(NoUpstreamAvailable)
+def no_upstream_handler(request: Request, exc: NoUpstreamAvailable):
+    return ORJSONResponse(
+        status_code=503,
+        content={"detail": "Сервис недоступен"}
+    )
+
+
+@app.on_event('startup')
+async def startup():
+    for name, urls in settings.upstream_pools.items():
+        upstream.upstreams[name] = upstream.UpstreamClient(
+            balancer=LoadBalancer(
+                urls=urls,
+                failure_threshold=settings.circuit_failure_threshold,
+                recovery_time=settings.circuit_recovery_time,
+            ),
+            max_retries=settings.upstream_max_retries,
+            timeout=httpx.Timeout(settings.upstream_timeout, connect=settings.upstream_connect_timeout),
+            limits=httpx.Limits(
+                max_connections=settings.upstream_max_connections,
+                max_keepalive_connections=settings.upstream_max_keepalive,
+                keepalive_expiry=settings.upstream_keepalive_expiry,
+            ),
+        )
+    upstream.upstream = upstream.upstreams['auth']
+    token_cache.token_cache = token_cache.TokenCache(
+        max_size=settings.get_user_cache_size, ttl=settings.get_user_cache_ttl
+    )
+
+
+@app.on_event('shutdown')
+async def shutdown():
+    for client in upstream.upstreams.values():
+        await client.close()
+
+if settings.pass_through:
+    app.include_router(proxy.router, prefix='/api/v1', tags=['login'])
+else:
+    app.include_router(gateway.router, prefix='/api/v1', tags=['login'])
+app.include_router(dashboard.router, prefix='/api/v1', tags=['dashboard'])
+app.include_router(metrics.router, prefix='/api/v1', tags=['metrics'])
+# должен подключаться последним: принимает все пути, не занятые маршрутами выше
+app.include_router(reverse_proxy.router)
 
 # if __name__ == '__main__':
 #     uvicorn.run(
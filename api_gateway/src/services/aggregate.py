@@ -0,0 +1,93 @@
+import asyncio
+from http import HTTPStatus
+
+import httpx
+from pydantic import BaseModel
+
+from core.deadline import DeadlineExceeded
+from core.metrics import metrics
+from services.balancer import NoUpstreamAvailable
+from services.upstream import UpstreamClient
+
+
+class AggregatePart(BaseModel):
+    # ключ части в ответе
+    name: str
+    upstream: str
+    path: str
+    timeout: float = 2
+    # без этой части ответ не имеет смысла: ее ошибка становится ошибкой всего запроса
+    required: bool = False
+
+
+class PartResult(BaseModel):
+    name: str
+    status: int
+    body: object = None
+
+
+DASHBOARD_PARTS = [
+    AggregatePart(name='user', upstream='auth', path='/api/v1/auth/get_user/', required=True),
+    AggregatePart(name='profile', upstream='auth', path='/api/v1/profil/self_data/'),
+    AggregatePart(name='history', upstream='auth', path='/api/v1/profil/get_history/', timeout=3),
+]
+
+
+async def fetch_part(upstream: UpstreamClient, part: AggregatePart, headers: dict, cookies: dict) -> PartResult:
+    """
+    Выполняет GET запрос одной части. Ошибки сервиса и сети не выбрасываются, а возвращаются статусом части.
+
+    :param upstream: (UpstreamClient) Клиент пула part.upstream.
+    :param part: (AggregatePart) Описание части.
+    :return:
+    PartResult: Статус и тело ответа сервиса или статус ошибки с описанием в body.
+    """
+    try:
+        response = await asyncio.wait_for(
+            upstream.request('GET', part.path, headers=headers, cookies=cookies, timeout=part.timeout),
+            part.timeout
+        )
+    except (asyncio.TimeoutError, httpx.TimeoutException, DeadlineExceeded):
+        result = PartResult(
+            name=part.name, status=HTTPStatus.GATEWAY_TIMEOUT, body={'detail': 'Сервис не ответил вовремя'}
+        )
+    except NoUpstreamAvailable:
+        result = PartResult(
+            name=part.name, status=HTTPStatus.SERVICE_UNAVAILABLE, body={'detail': 'Сервис недоступен'}
+        )
+    except httpx.TransportError:
+        result = PartResult(name=part.name, status=HTTPStatus.BAD_GATEWAY, body={'detail': 'Сервис недоступен'})
+    else:
+        try:
+            body = response.json()
+        except ValueError:
+            body = {'detail': response.text}
+        result = PartResult(name=part.name, status=response.status_code, body=body)
+    if result.status != HTTPStatus.OK:
+        metrics.inc(f'aggregate_part_failures_total:{part.name}')
+    return result
+
+
+async def aggregate(
+        upstreams: dict[str, UpstreamClient], parts: list[AggregatePart], headers: dict, cookies: dict
+) -> tuple[int, dict]:
+    """
+    Параллельно запрашивает все части и собирает их в один ответ.
+
+    :return:
+    tuple: Статус и тело ответа. Если не удалась обязательная часть, возвращаются ее статус и тело.
+           Иначе 200, тело неудавшейся части - None, ее статус и описание ошибки - в errors.
+    """
+    results = await asyncio.gather(*(
+        fetch_part(upstreams[part.upstream], part, headers, cookies) for part in parts
+    ))
+    content = {'errors': {}}
+    for part, result in zip(parts, results):
+        if result.status == HTTPStatus.OK:
+            content[part.name] = result.body
+            continue
+        if part.required:
+            return result.status, result.body
+        content[part.name] = None
+        content['errors'][part.name] = {'status': result.status, 'body': result.body}
+    return HTTPStatus.OK, content
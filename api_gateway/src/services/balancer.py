@@ -0,0 +1,122 @@
+import random
+from enum import Enum
+from time import monotonic
+
+from core.metrics import metrics
+
+
+class NoUpstreamAvailable(Exception):
+    '''
+    Все экземпляры сервиса недоступны: цепи разомкнуты или уже были опробованы.
+    '''
+
+
+class CircuitState(Enum):
+    closed = 'closed'
+    open = 'open'
+    half_open = 'half_open'
+
+
+class CircuitBreaker:
+    '''
+    Размыкается после failure_threshold ошибок подряд. Через recovery_time пропускает один
+    пробный запрос (half-open): успех замыкает цепь, ошибка снова ее размыкает.
+    '''
+
+    def __init__(self, failure_threshold: int, recovery_time: float):
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.state = CircuitState.closed
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+
+    def available(self) -> bool:
+        if self.state is CircuitState.closed:
+            return True
+        if self.probe_in_flight:
+            return False
+        return self.state is CircuitState.half_open or monotonic() - self.opened_at >= self.recovery_time
+
+    def on_request(self) -> None:
+        if self.state is not CircuitState.closed:
+            self.state = CircuitState.half_open
+            self.probe_in_flight = True
+
+    def record_success(self) -> None:
+        self.state = CircuitState.closed
+        self.failures = 0
+        self.probe_in_flight = False
+
+    def release(self) -> None:
+        self.probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state is CircuitState.half_open or self.failures >= self.failure_threshold:
+            self.state = CircuitState.open
+            self.opened_at = monotonic()
+        self.probe_in_flight = False
+
+
+class Upstream:
+    '''
+    Экземпляр сервиса с пассивной статистикой: незавершенные запросы, ошибки, задержка.
+    '''
+
+    def __init__(self, url: str, breaker: CircuitBreaker):
+        self.url = url
+        self.breaker = breaker
+        self.outstanding = 0
+        self.total_failures = 0
+        self.latency_ewma = 0.0
+
+    def on_request(self) -> None:
+        self.outstanding += 1
+        self.breaker.on_request()
+        metrics.set_gauge(f'upstream_outstanding:{self.url}', self.outstanding)
+
+    def on_response(self, success: bool | None, latency: float) -> None:
+        """
+        :param success: (bool | None) Итог запроса, None - запрос отменен и не говорит о состоянии экземпляра.
+        :param latency: (float) Длительность запроса в секундах.
+        """
+        self.outstanding -= 1
+        self.latency_ewma = latency if not self.latency_ewma else 0.8 * self.latency_ewma + 0.2 * latency
+        was_open = self.breaker.state is CircuitState.open
+        if success is None:
+            self.breaker.release()
+        elif success:
+            self.breaker.record_success()
+        else:
+            self.total_failures += 1
+            metrics.inc(f'upstream_failures_total:{self.url}')
+            self.breaker.record_failure()
+        if not was_open and self.breaker.state is CircuitState.open:
+            metrics.inc('upstream_circuit_opened_total')
+        metrics.set_gauge(f'upstream_outstanding:{self.url}', self.outstanding)
+        metrics.set_gauge(f'upstream_circuit_open:{self.url}', int(self.breaker.state is not CircuitState.closed))
+
+
+class LoadBalancer:
+    '''
+    Выбирает экземпляр сервиса с наименьшим числом незавершенных запросов среди тех,
+    чья цепь пропускает запросы.
+    '''
+
+    def __init__(self, urls: list[str], failure_threshold: int, recovery_time: float):
+        self.upstreams = [Upstream(url, CircuitBreaker(failure_threshold, recovery_time)) for url in urls]
+
+    def choose(self, exclude: tuple[Upstream, ...] = ()) -> Upstream:
+        """
+        :param exclude: (tuple) Экземпляры, которые уже были опробованы в рамках этого запроса.
+        :return:
+        Upstream: Выбранный экземпляр, для него уже учтен начатый запрос.
+        """
+        candidates = [item for item in self.upstreams if item not in exclude and item.breaker.available()]
+        if not candidates:
+            raise NoUpstreamAvailable
+        least = min(item.outstanding for item in candidates)
+        upstream = random.choice([item for item in candidates if item.outstanding == least])
+        upstream.on_request()
+        return upstream
@@ -0,0 +1,160 @@
+import asyncio
+import json
+import multiprocessing
+import socket
+from time import perf_counter, process_time
+from typing import AsyncIterator
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+
+from core.config import app_settings
+from services import upstream
+from services.balancer import LoadBalancer
+
+
+def stub_upstream(latency: float, body: bytes):
+    '''
+    ASGI приложение - заглушка сервиса: на любой запрос отвечает 200 и body через latency секунд.
+    '''
+    async def app(scope, receive, send):
+        await asyncio.sleep(latency)
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'application/json')],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    return app
+
+
+def _serve_stub(port: int, latency: float, body: bytes) -> None:
+    uvicorn.run(stub_upstream(latency, body), host='127.0.0.1', port=port, lifespan='off', log_level='warning')
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_port(port: int, timeout: float = 10) -> None:
+    deadline = perf_counter() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+        except OSError:
+            if perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.05)
+        else:
+            writer.close()
+            return
+
+
+async def measure_throughput(
+        app: FastAPI, path: str = '/api/v1/get_user/', count: int = 2000, concurrency: int = 50,
+        latency: float = 0.02
+) -> float:
+    """
+    Пропускная способность шлюза (запросов в секунду). Сервис авторизации заменяется заглушкой
+    в отдельном процессе с задержкой ответа latency, шлюз ходит в нее по TCP через общий пул UpstreamClient.
+    Запросы к шлюзу идут в том же процессе через ASGI клиент, у каждого запроса свой access токен,
+    поэтому кеш /get_user/ и объединение одинаковых запросов не срабатывают.
+
+    :param app: (FastAPI) Приложение шлюза.
+    :param path: (str) Путь запроса к шлюзу.
+    :param count: (int) Число запросов.
+    :param concurrency: (int) Число одновременных клиентов.
+    :param latency: (float) Задержка ответа заглушки в секундах.
+    :return:
+    float: Запросов в секунду.
+    """
+    port = _free_port()
+    stub = multiprocessing.Process(target=_serve_stub, args=(port, latency, b'{"login": "bench"}'), daemon=True)
+    stub.start()
+    auth_upstreams = app_settings.auth_upstreams
+    app_settings.auth_upstreams = [f'http://127.0.0.1:{port}']
+    try:
+        await _wait_port(port)
+        await app.router.startup()
+        tokens = iter(range(count))
+
+        async def client(ac: httpx.AsyncClient) -> None:
+            for number in tokens:
+                response = await ac.get(path, cookies={app_settings.access_cookie_key: f'bench-{number}'})
+                response.raise_for_status()
+
+        async with httpx.AsyncClient(app=app, base_url='http://gateway') as ac:
+            # прогрев: соединения пула открываются до замера
+            await asyncio.gather(*(ac.get(path) for _ in range(concurrency)))
+            started = perf_counter()
+            await asyncio.gather(*(client(ac) for _ in range(concurrency)))
+            elapsed = perf_counter() - started
+        await app.router.shutdown()
+    finally:
+        app_settings.auth_upstreams = auth_upstreams
+        stub.terminate()
+        stub.join()
+    upstream.upstreams.clear()
+    return round(count / elapsed, 1)
+
+
+async def _stream(body: bytes) -> AsyncIterator[bytes]:
+    yield body
+
+
+async def measure_request_cpu(app: FastAPI, count: int = 3000, reply_size: int = 1024) -> float:
+    """
+    Процессорное время шлюза на один POST /api/v1/login/ в текущем режиме (GATEWAY_PASS_THROUGH).
+    Сервис авторизации заменяется MockTransport: ответ размером около reply_size байт с двумя Set-Cookie
+    отдается потоком, как по сети. Сетевого ввода-вывода нет, поэтому замер показывает стоимость
+    разбора и сборки тел в шлюзе (вместе с ASGI клиентом).
+
+    :param app: (FastAPI) Приложение шлюза.
+    :param count: (int) Число запросов.
+    :param reply_size: (int) Размер тела ответа сервиса в байтах.
+    :return:
+    float: Микросекунд процессорного времени на запрос.
+    """
+    reply = json.dumps({'access_token': 'a' * (reply_size // 2), 'refresh_token': 'r' * (reply_size // 2)}).encode()
+    headers = [
+        ('content-type', 'application/json'),
+        ('set-cookie', f'{app_settings.access_cookie_key}=access; HttpOnly; Path=/'),
+        ('set-cookie', f'{app_settings.refresh_cookie_key}=refresh; HttpOnly; Path=/'),
+    ]
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        return httpx.Response(200, headers=headers, content=_stream(reply))
+
+    client = upstream.UpstreamClient(
+        balancer=LoadBalancer(['http://auth'], failure_threshold=5, recovery_time=10),
+        timeout=httpx.Timeout(5),
+        limits=httpx.Limits(max_connections=10),
+        transport=httpx.MockTransport(handler),
+    )
+    upstream.upstreams['auth'] = upstream.upstream = client
+    body = b'{"login": "admin", "password": "admin"}'
+    try:
+        async with httpx.AsyncClient(app=app, base_url='http://gateway') as ac:
+
+            async def login() -> None:
+                response = await ac.post(
+                    '/api/v1/login/', content=body, headers={'Content-Type': 'application/json'}
+                )
+                response.raise_for_status()
+
+            for _ in range(100):
+                await login()
+            started = process_time()
+            for _ in range(count):
+                await login()
+            elapsed = process_time() - started
+    finally:
+        await client.close()
+        upstream.upstreams.clear()
+        upstream.upstream = None
+    return round(elapsed / count * 1e6)
@@ -0,0 +1,90 @@
+from http import HTTPStatus
+
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+from core.config import app_settings
+from core.deadline import DEADLINE_HEADER
+from services.single_flight import SingleFlight
+from services.token_cache import TokenCache
+from services.upstream import UpstreamClient
+
+# заголовки соединения клиент-шлюз, которые не передаются в соединение шлюз-сервис и обратно
+HOP_BY_HOP_HEADERS = frozenset({
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te', 'trailer', 'trailers',
+    'transfer-encoding', 'upgrade', 'host',
+})
+METHODS_WITHOUT_BODY = frozenset({'GET', 'HEAD', 'OPTIONS', 'DELETE'})
+
+
+def forward_headers(request: Request) -> dict:
+    # бюджет клиента уже учтен в дедлайне шлюза, сервису передается оставшийся бюджет шлюза (services.upstream)
+    return {
+        key: value for key, value in request.headers.items()
+        if key not in HOP_BY_HOP_HEADERS and key != DEADLINE_HEADER.lower()
+    }
+
+
+async def proxy_request(
+        request: Request, upstream: UpstreamClient, path: str, timeout: float | None = None
+) -> StreamingResponse:
+    """
+    Передает запрос в сервис и ответ клиенту без разбора тела: тело запроса отправляется по мере чтения,
+    статус, заголовки (включая все Set-Cookie) и тело ответа отдаются клиенту как есть.
+
+    :param request: (Request) Входящий запрос.
+    :param upstream: (UpstreamClient) Клиент сервиса.
+    :param path: (str) Путь в сервисе.
+    :param timeout: (float | None) Таймаут запроса, None - таймаут клиента.
+    :return:
+    StreamingResponse: Ответ сервиса, соединение с сервисом закрывается после отправки тела клиенту.
+    """
+    kwargs = {} if timeout is None else {'timeout': timeout}
+    response = await upstream.request(
+        request.method, path,
+        headers=forward_headers(request),
+        params=request.query_params,
+        content=None if request.method in METHODS_WITHOUT_BODY else request.stream(),
+        stream=True,
+        **kwargs
+    )
+    proxied = StreamingResponse(
+        response.aiter_raw(), status_code=response.status_code, background=BackgroundTask(response.aclose)
+    )
+    proxied.raw_headers = [
+        (key, value) for key, value in response.headers.raw if key.lower().decode() not in HOP_BY_HOP_HEADERS
+    ]
+    return proxied
+
+
+async def cached_token_request(
+        request: Request, upstream: UpstreamClient, path: str,
+        token_cache: TokenCache, single_flight: SingleFlight, timeout: float | None = None
+) -> Response:
+    """
+    Выполняет GET запрос, ответ на который зависит только от access токена и User-Agent.
+    Ответ берется из кеша, одинаковые одновременные запросы объединяются, тело не разбирается.
+    """
+    user_agent = request.headers.get('user-agent')
+    access_token = request.cookies.get(app_settings.access_cookie_key)
+    if access_token:
+        body = token_cache.get(access_token, user_agent)
+        if body is not None:
+            return Response(content=body, media_type='application/json')
+
+    kwargs = {} if timeout is None else {'timeout': timeout}
+    key = single_flight.make_key('GET', path, request.cookies, (app_settings.access_cookie_key,), user_agent)
+    response_auth = await single_flight.do(
+        key, lambda: upstream.request('GET', path, headers=forward_headers(request), **kwargs)
+    )
+    if access_token:
+        if response_auth.status_code == HTTPStatus.OK:
+            token_cache.put(access_token, user_agent, response_auth.content)
+        else:
+            token_cache.evict_token(access_token)
+    return Response(
+        content=response_auth.content,
+        status_code=response_auth.status_code,
+        media_type=response_auth.headers.get('content-type')
+    )
@@ -0,0 +1,52 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+from core.metrics import metrics
+
+
+class SingleFlight:
+    '''
+    Объединяет одинаковые одновременные идемпотентные запросы в сервисы:
+    первый вызов выполняет запрос, остальные ждут его результат.
+    '''
+
+    def __init__(self):
+        self.calls: dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.shared = 0
+
+    @staticmethod
+    def make_key(
+            method: str, path: str, cookies: dict, cookie_names: tuple[str, ...], user_agent: str | None
+    ) -> tuple:
+        """
+        Собирает ключ запроса: одинаковые метод, путь, значимые cookies и User-Agent.
+
+        :param cookie_names: (tuple) Имена cookies, от которых зависит ответ сервиса.
+        """
+        return method, path, tuple(cookies.get(name) for name in cookie_names), user_agent
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Выполняет func или присоединяется к уже выполняющемуся вызову с тем же ключом.
+        Запрос выполняется в отдельной задаче, поэтому отмена одного из ожидающих не отменяет его для остальных.
+        """
+        task = self.calls.get(key)
+        if task is None:
+            self.leaders += 1
+            metrics.inc('single_flight_leaders_total')
+            task = asyncio.ensure_future(func())
+            self.calls[key] = task
+            task.add_done_callback(lambda _: self.calls.pop(key, None))
+        else:
+            self.shared += 1
+            metrics.inc('single_flight_shared_total')
+        metrics.set_gauge('single_flight_coalescing_ratio', self.shared / (self.leaders + self.shared))
+        return await asyncio.shield(task)
+
+
+single_flight = SingleFlight()
+
+
+async def get_single_flight() -> SingleFlight:
+    return single_flight
@@ -0,0 +1,89 @@
+import base64
+import binascii
+from collections import OrderedDict
+from time import time
+from typing import Any
+
+import orjson
+
+from core.metrics import metrics
+
+
+class TokenCache:
+    '''
+    In-process TTL/LRU кеш ответов /get_user/ по access токену и User-Agent.
+    Запись живет не дольше ttl и не дольше срока действия самого токена.
+    '''
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        # token -> {user_agent: (expires_at, body)}, порядок ключей - порядок LRU
+        self.entries: OrderedDict[str, dict[str | None, tuple[float, Any]]] = OrderedDict()
+
+    @staticmethod
+    def token_expires_at(token: str) -> float | None:
+        """
+        Достает exp из payload JWT без проверки подписи, подпись проверяет сервис авторизации.
+
+        :param token: (str) Access token.
+        :return:
+        float | None: Время истечения токена или None, если токен не удалось разобрать.
+        """
+        try:
+            payload = token.split('.')[1]
+            payload += '=' * (-len(payload) % 4)
+            exp = orjson.loads(base64.urlsafe_b64decode(payload)).get('exp')
+        except (IndexError, ValueError, binascii.Error, AttributeError):
+            return None
+        return exp if isinstance(exp, (int, float)) else None
+
+    def get(self, token: str, user_agent: str | None) -> Any | None:
+        entry = self.entries.get(token, {}).get(user_agent)
+        if entry is None:
+            metrics.inc('token_cache_misses_total')
+            return None
+        expires_at, body = entry
+        if expires_at <= time():
+            self._discard(token, user_agent)
+            metrics.inc('token_cache_misses_total')
+            return None
+        self.entries.move_to_end(token)
+        metrics.inc('token_cache_hits_total')
+        return body
+
+    def put(self, token: str, user_agent: str | None, body: Any) -> None:
+        token_exp = self.token_expires_at(token)
+        if token_exp is None:
+            return
+        expires_at = min(time() + self.ttl, token_exp)
+        if expires_at <= time():
+            return
+        self.entries.setdefault(token, {})[user_agent] = (expires_at, body)
+        self.entries.move_to_end(token)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            metrics.inc('token_cache_evictions_total')
+        metrics.set_gauge('token_cache_size', len(self.entries))
+
+    def evict_token(self, token: str | None) -> None:
+        """
+        Удаляет все записи токена, вызывается при logout/refresh и при отказе сервиса авторизации.
+        """
+        if token is not None and self.entries.pop(token, None) is not None:
+            metrics.inc('token_cache_evictions_total')
+            metrics.set_gauge('token_cache_size', len(self.entries))
+
+    def _discard(self, token: str, user_agent: str | None) -> None:
+        by_agent = self.entries.get(token, {})
+        by_agent.pop(user_agent, None)
+        if not by_agent:
+            self.entries.pop(token, None)
+        metrics.set_gauge('token_cache_size', len(self.entries))
+
+
+token_cache: TokenCache | None = None
+
+
+async def get_token_cache() -> TokenCache:
+    return token_cache
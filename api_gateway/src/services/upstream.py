@@ -0,0 +1,162 @@
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from time import perf_counter
+
+import httpx
+
+from core.deadline import DEADLINE_HEADER, remaining_budget
+from core.metrics import metrics
+from services.balancer import LoadBalancer, NoUpstreamAvailable, Upstream
+
+
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+# ответы, означающие проблему с экземпляром сервиса, а не с самим запросом
+UNAVAILABLE_STATUSES = frozenset({502, 503, 504})
+
+
+class UpstreamClient:
+    '''
+    Общий keep-alive клиент для запросов шлюза в сервисы.
+    Создается один раз при старте приложения и переиспользует соединения из пула.
+    Экземпляр сервиса для каждого запроса выбирает балансировщик.
+    '''
+
+    def __init__(
+            self, balancer: LoadBalancer, timeout: httpx.Timeout, limits: httpx.Limits, max_retries: int = 1,
+            **kwargs
+    ):
+        self.balancer = balancer
+        self.max_retries = max_retries
+        self.max_connections = limits.max_connections
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        # клиент общий для всех пользователей, поэтому cookies ответов в нем не сохраняются
+        cookies = CookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))
+        self.client = httpx.AsyncClient(timeout=timeout, limits=limits, cookies=cookies, **kwargs)
+
+    async def request(
+            self, method: str, url: str, headers: dict | None = None, cookies: dict | None = None,
+            timeout: float | httpx.Timeout = httpx.USE_CLIENT_DEFAULT, stream: bool = False, **kwargs
+    ) -> httpx.Response:
+        """
+        Выполняет запрос в сервис через общий пул соединений.
+        Идемпотентные запросы при ошибке экземпляра повторяются на другом экземпляре не более max_retries раз.
+        Таймаут каждой попытки ограничен оставшимся бюджетом запроса, бюджет передается сервису в заголовке.
+
+        :param method: (str) HTTP метод.
+        :param url: (str) Путь относительно адреса сервиса.
+        :param headers: (dict | None) Заголовки запроса, заголовки со значением None не передаются.
+        :param cookies: (dict | None) Cookies клиента, передаются заголовком Cookie.
+        :param timeout: (float | Timeout) Таймаут конкретного запроса, по умолчанию таймаут клиента.
+        :param stream: (bool) Не читать тело ответа, вызывающий обязан закрыть ответ через aclose().
+        :return:
+        Response: Ответ сервиса. Ошибки транспорта и таймауты пробрасываются как исключения httpx,
+                  NoUpstreamAvailable - если ни один экземпляр не принимает запросы,
+                  DeadlineExceeded - если бюджет запроса исчерпан.
+        """
+        headers = {key: value for key, value in (headers or {}).items() if value is not None}
+        if cookies:
+            headers['Cookie'] = '; '.join(f'{key}={value}' for key, value in cookies.items())
+        retries = self.max_retries if method in IDEMPOTENT_METHODS else 0
+        tried = ()
+        upstream = self.balancer.choose()
+        while True:
+            attempt_timeout = self._attempt_timeout(timeout, headers)
+            tried += (upstream,)
+            response, error = await self._send(
+                upstream, method, url, stream, headers=headers, timeout=attempt_timeout, **kwargs
+            )
+            if error is None and response.status_code not in UNAVAILABLE_STATUSES:
+                return response
+            upstream = None
+            if len(tried) <= retries:
+                try:
+                    upstream = self.balancer.choose(exclude=tried)
+                except NoUpstreamAvailable:
+                    pass
+            if upstream is None:
+                # повтора не будет - отдаем результат последней попытки, ответ остается открытым для вызывающего
+                if error is not None:
+                    raise error
+                return response
+            if response is not None:
+                await response.aclose()
+            metrics.inc('upstream_retries_total')
+
+    def _attempt_timeout(
+            self, timeout: float | httpx.Timeout, headers: dict
+    ) -> float | httpx.Timeout:
+        budget = remaining_budget()
+        if budget is None:
+            return timeout
+        for key in [key for key in headers if key.lower() == DEADLINE_HEADER.lower()]:
+            del headers[key]
+        headers[DEADLINE_HEADER] = str(int(budget * 1000))
+        if isinstance(timeout, (int, float)):
+            return min(timeout, budget)
+        default = self.client.timeout if timeout is httpx.USE_CLIENT_DEFAULT else timeout
+        return httpx.Timeout(
+            connect=min(default.connect or budget, budget),
+            read=min(default.read or budget, budget),
+            write=min(default.write or budget, budget),
+            pool=min(default.pool or budget, budget),
+        )
+
+    async def _send(
+            self, upstream: Upstream, method: str, url: str, stream: bool, **kwargs
+    ) -> tuple[httpx.Response | None, httpx.TransportError | None]:
+        self._acquire()
+        start = perf_counter()
+        response, error = None, None
+        try:
+            request = self.client.build_request(method, upstream.url + url, **kwargs)
+            response = await self.client.send(request, stream=stream)
+        except httpx.PoolTimeout as exc:
+            metrics.inc('upstream_pool_timeouts_total')
+            error = exc
+        except httpx.TimeoutException as exc:
+            metrics.inc('upstream_timeouts_total')
+            error = exc
+        except httpx.TransportError as exc:
+            metrics.inc('upstream_errors_total')
+            error = exc
+        finally:
+            latency = perf_counter() - start
+            self._release()
+            metrics.observe('upstream_latency_seconds', latency)
+            if response is None and error is None:
+                # запрос отменен клиентом - экземпляр сервиса тут ни при чем
+                upstream.on_response(None, latency)
+            else:
+                upstream.on_response(error is None and response.status_code not in UNAVAILABLE_STATUSES, latency)
+        return response, error
+
+    def _acquire(self) -> None:
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        metrics.inc('upstream_requests_total')
+        self._update_pool_gauges()
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        self._update_pool_gauges()
+
+    def _update_pool_gauges(self) -> None:
+        metrics.set_gauge('upstream_in_flight', self.in_flight)
+        metrics.set_gauge('upstream_peak_in_flight', self.peak_in_flight)
+        metrics.set_gauge('upstream_pool_usage', self.in_flight / self.max_connections)
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+# именованные пулы экземпляров сервисов, upstream - пул сервиса авторизации
+upstreams: dict[str, UpstreamClient] = {}
+upstream: UpstreamClient | None = None
+
+
+async def get_upstream() -> UpstreamClient:
+    return upstream
+
+
+async def get_upstreams() -> dict[str, UpstreamClient]:
+    return upstreams
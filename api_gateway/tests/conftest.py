@@ -0,0 +1,122 @@
+import asyncio
+import inspect
+from typing import AsyncGenerator, Callable
+
+import httpx
+import pytest
+from httpx import AsyncClient
+from main import app
+from services.balancer import LoadBalancer
+from services.single_flight import SingleFlight, get_single_flight
+from services.token_cache import TokenCache, get_token_cache
+from services.upstream import UpstreamClient, get_upstream, get_upstreams
+
+
+# SETUP
+@pytest.fixture(scope='session')
+def event_loop(request):
+    """Create an instance of the default event loop for each test case."""
+    loop = asyncio.get_event_loop_policy().new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope="session")
+async def ac() -> AsyncGenerator[AsyncClient, None]:
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        yield ac
+
+
+@pytest.fixture(autouse=True)
+def token_cache() -> TokenCache:
+    """Give every test its own empty /get_user/ cache."""
+    cache = TokenCache(max_size=100, ttl=30)
+    app.dependency_overrides[get_token_cache] = lambda: cache
+    yield cache
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture(autouse=True)
+def single_flight() -> SingleFlight:
+    """Give every test its own request-coalescing layer."""
+    coalescer = SingleFlight()
+    app.dependency_overrides[get_single_flight] = lambda: coalescer
+    return coalescer
+
+
+@pytest.fixture
+def mock_upstream() -> Callable[[Callable], UpstreamClient]:
+    """Replace the shared upstream client with one served by the given handler."""
+    def install(handler: Callable) -> UpstreamClient:
+        async def network_handler(request: httpx.Request) -> httpx.Response:
+            response = handler(request)
+            if inspect.isawaitable(response):
+                response = await response
+            # MockTransport отдает уже прочитанное тело, по сети тело приходит потоком
+            if response.is_stream_consumed:
+                body = response.content
+                response = httpx.Response(response.status_code, headers=response.headers, content=stream(body))
+            return response
+
+        client = UpstreamClient(
+            balancer=LoadBalancer(['http://auth'], failure_threshold=5, recovery_time=10),
+            timeout=httpx.Timeout(1),
+            limits=httpx.Limits(max_connections=10),
+            transport=httpx.MockTransport(network_handler),
+        )
+        app.dependency_overrides[get_upstream] = lambda: client
+        app.dependency_overrides[get_upstreams] = lambda: {'auth': client}
+        return client
+
+    return install
+
+
+async def stream(body: bytes) -> AsyncGenerator[bytes, None]:
+    yield body
+
+
+class StubServer:
+    """Minimal local HTTP server answering every request with a fixed status after a delay."""
+
+    def __init__(self, status: int = 200, delay: float = 0):
+        self.status = status
+        self.delay = delay
+        self.hits = 0
+        self.server: asyncio.Server | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f'http://{host}:{port}'
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        head = await reader.readuntil(b'\r\n\r\n')
+        for line in head.split(b'\r\n'):
+            if line.lower().startswith(b'content-length:'):
+                await reader.readexactly(int(line.split(b':')[1]))
+        self.hits += 1
+        await asyncio.sleep(self.delay)
+        body = b'{"port": %d}' % self.server.sockets[0].getsockname()[1]
+        writer.write(
+            b'HTTP/1.1 %d STUB\r\nContent-Type: application/json\r\nContent-Length: %d\r\n'
+            b'Connection: close\r\n\r\n%s' % (self.status, len(body), body)
+        )
+        await writer.drain()
+        writer.close()
+
+
+@pytest.fixture
+async def stub_servers() -> AsyncGenerator[Callable[..., StubServer], None]:
+    """Start local stub upstreams on free ports."""
+    servers = []
+
+    async def start(status: int = 200, delay: float = 0) -> StubServer:
+        stub = StubServer(status, delay)
+        stub.server = await asyncio.start_server(stub.handle, '127.0.0.1', 0)
+        servers.append(stub)
+        return stub
+
+    yield start
+    for stub in servers:
+        stub.server.close()
+        await stub.server.wait_closed()
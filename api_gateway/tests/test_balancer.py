@@ -0,0 +1,114 @@
+import asyncio
+import socket
+
+import httpx
+import pytest
+from http import HTTPStatus
+
+from services.balancer import CircuitState, LoadBalancer, NoUpstreamAvailable
+from services.upstream import UpstreamClient
+
+
+def make_client(urls: list[str], failure_threshold: int = 2, recovery_time: float = 10) -> UpstreamClient:
+    return UpstreamClient(
+        balancer=LoadBalancer(urls, failure_threshold=failure_threshold, recovery_time=recovery_time),
+        timeout=httpx.Timeout(1),
+        limits=httpx.Limits(max_connections=10),
+    )
+
+
+def closed_port_url() -> str:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return f'http://127.0.0.1:{sock.getsockname()[1]}'
+
+
+def test_least_outstanding_choice():
+    balancer = LoadBalancer(['http://a', 'http://b', 'http://c'], failure_threshold=1, recovery_time=10)
+    first = balancer.choose()
+    second = balancer.choose()
+    third = balancer.choose()
+    assert len({first, second, third}) == 3
+
+    second.on_response(True, 0.01)
+
+    assert balancer.choose() is second
+
+
+async def test_slow_replica_gets_fewer_requests(stub_servers):
+    slow = await stub_servers(delay=0.2)
+    fast = await stub_servers()
+    client = make_client([slow.url, fast.url])
+
+    async def worker():
+        for _ in range(5):
+            await client.request('GET', '/')
+
+    await asyncio.gather(*[worker() for _ in range(3)])
+
+    assert fast.hits > slow.hits
+    await client.close()
+
+
+async def test_get_retried_on_other_replica(stub_servers):
+    healthy = await stub_servers()
+    client = make_client([closed_port_url(), healthy.url])
+
+    for _ in range(4):
+        response = await client.request('GET', '/')
+        assert response.status_code == HTTPStatus.OK
+
+    assert healthy.hits == 4
+    await client.close()
+
+
+@pytest.mark.parametrize('method, expected_hits', [('GET', 2), ('POST', 1)])
+async def test_only_idempotent_requests_retried(method, expected_hits, stub_servers):
+    broken = await stub_servers(status=HTTPStatus.SERVICE_UNAVAILABLE)
+    also_broken = await stub_servers(status=HTTPStatus.SERVICE_UNAVAILABLE)
+    client = make_client([broken.url, also_broken.url])
+
+    response = await client.request(method, '/')
+
+    assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert broken.hits + also_broken.hits == expected_hits
+    await client.close()
+
+
+async def test_circuit_opens_and_half_open_probe_closes_it(stub_servers):
+    stub = await stub_servers(status=HTTPStatus.SERVICE_UNAVAILABLE)
+    client = make_client([stub.url], failure_threshold=2, recovery_time=0.1)
+    upstream = client.balancer.upstreams[0]
+
+    for _ in range(2):
+        await client.request('GET', '/')
+    assert upstream.breaker.state is CircuitState.open
+
+    with pytest.raises(NoUpstreamAvailable):
+        await client.request('GET', '/')
+    assert stub.hits == 2
+
+    await asyncio.sleep(0.1)
+    stub.status = HTTPStatus.OK
+    probe, blocked = await asyncio.gather(
+        client.request('GET', '/'), client.request('GET', '/'), return_exceptions=True
+    )
+
+    assert probe.status_code == HTTPStatus.OK
+    assert isinstance(blocked, NoUpstreamAvailable)
+    assert upstream.breaker.state is CircuitState.closed
+    await client.close()
+
+
+async def test_unavailable_response_without_other_replica_is_not_closed(stub_servers):
+    stub = await stub_servers(status=HTTPStatus.SERVICE_UNAVAILABLE)
+    client = make_client([stub.url])
+
+    response = await client.request('GET', '/', stream=True)
+
+    # повторять негде: ответ сервиса отдается клиенту как есть, тело еще можно прочитать
+    assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    await response.aread()
+    await response.aclose()
+    assert stub.hits == 1
+    await client.close()
@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+import httpx
+from httpx import AsyncClient
+from http import HTTPStatus
+
+from services.aggregate import AggregatePart
+
+START_URL = "/api/v1/"
+BODIES = {
+    '/api/v1/auth/get_user/': {'sub': 'user'},
+    '/api/v1/profil/self_data/': {'login': 'admin'},
+    '/api/v1/profil/get_history/': [{'user_agent': 'google'}],
+}
+
+
+async def test_dashboard_fans_out_in_parallel(ac: AsyncClient, mock_upstream):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        assert request.headers['cookie'] == 'access_token_cookie=token'
+        assert request.headers['user-agent'] == 'google'
+        await asyncio.sleep(0.2)
+        return httpx.Response(HTTPStatus.OK, json=BODIES[request.url.path])
+
+    mock_upstream(handler)
+
+    start = time.monotonic()
+    response = await ac.get(START_URL + "dashboard/", headers={'User-Agent': 'google'},
+                            cookies={'access_token_cookie': 'token'})
+    elapsed = time.monotonic() - start
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {
+        'user': {'sub': 'user'}, 'profile': {'login': 'admin'}, 'history': [{'user_agent': 'google'}], 'errors': {}
+    }
+    assert elapsed < 0.4
+    ac.cookies.clear()
+
+
+async def test_dashboard_partial_failure(ac: AsyncClient, mock_upstream, monkeypatch):
+    monkeypatch.setattr('api.v1.dashboard.DASHBOARD_PARTS', [
+        AggregatePart(name='user', upstream='auth', path='/api/v1/auth/get_user/', required=True),
+        AggregatePart(name='profile', upstream='auth', path='/api/v1/profil/self_data/'),
+        AggregatePart(name='history', upstream='auth', path='/api/v1/profil/get_history/', timeout=0.1),
+    ])
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == '/api/v1/profil/get_history/':
+            await asyncio.sleep(1)
+        if request.url.path == '/api/v1/profil/self_data/':
+            return httpx.Response(HTTPStatus.INTERNAL_SERVER_ERROR, text='Internal Server Error')
+        return httpx.Response(HTTPStatus.OK, json=BODIES[request.url.path])
+
+    mock_upstream(handler)
+
+    response = await ac.get(START_URL + "dashboard/", headers={'User-Agent': 'google'})
+
+    assert response.status_code == HTTPStatus.OK
+    body = response.json()
+    assert body['user'] == {'sub': 'user'}
+    assert body['profile'] is None and body['history'] is None
+    assert body['errors'] == {
+        'profile': {'status': HTTPStatus.INTERNAL_SERVER_ERROR, 'body': {'detail': 'Internal Server Error'}},
+        'history': {'status': HTTPStatus.GATEWAY_TIMEOUT, 'body': {'detail': 'Сервис не ответил вовремя'}},
+    }
+
+
+async def test_dashboard_required_part_failure(ac: AsyncClient, mock_upstream):
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(HTTPStatus.UNPROCESSABLE_ENTITY, json={'detail': 'Signature has expired'})
+
+    mock_upstream(handler)
+
+    response = await ac.get(START_URL + "dashboard/", headers={'User-Agent': 'google'})
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+    assert response.json() == {'detail': 'Signature has expired'}
@@ -0,0 +1,96 @@
+import httpx
+import pytest
+from httpx import AsyncClient
+from http import HTTPStatus
+
+from core.metrics import metrics
+
+START_URL = "/api/v1/"
+
+
+async def test_login_forwards_cookies(ac: AsyncClient, mock_upstream):
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.path == '/api/v1/auth/login/'
+        assert request.headers['user-agent'] == 'google'
+        return httpx.Response(
+            HTTPStatus.OK, content=b'null',
+            headers=[('set-cookie', 'access_token_cookie=access'), ('set-cookie', 'refresh_token_cookie=refresh')]
+        )
+
+    upstream = mock_upstream(handler)
+
+    response = await ac.post(START_URL + "login/", headers={'User-Agent': 'google'},
+                             json={'login': 'admin', 'password': 'admin'})
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.cookies['access_token_cookie'] == 'access'
+    assert response.cookies['refresh_token_cookie'] == 'refresh'
+    # cookies одного пользователя не должны попасть в общий клиент
+    assert not upstream.client.cookies
+    ac.cookies.clear()
+
+
+async def test_get_user_passes_cookies_and_user_agent(ac: AsyncClient, mock_upstream):
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.headers['cookie'] == 'access_token_cookie=token'
+        return httpx.Response(HTTPStatus.OK, json={'sub': 'user', 'user_agent': request.headers['user-agent']})
+
+    mock_upstream(handler)
+
+    response = await ac.get(START_URL + "get_user/", headers={'User-Agent': 'google'},
+                            cookies={'access_token_cookie': 'token'})
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {'sub': 'user', 'user_agent': 'google'}
+    ac.cookies.clear()
+
+
+@pytest.mark.parametrize(
+    'error, expected_status',
+    [
+        (httpx.ReadTimeout('timeout'), HTTPStatus.GATEWAY_TIMEOUT),
+        (httpx.ConnectError('refused'), HTTPStatus.BAD_GATEWAY),
+    ]
+)
+async def test_upstream_errors(error, expected_status, ac: AsyncClient, mock_upstream):
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise error
+
+    upstream = mock_upstream(handler)
+    requests_before = metrics.counters['upstream_requests_total']
+
+    response = await ac.get(START_URL + "get_user/", headers={'User-Agent': 'google'})
+
+    assert response.status_code == expected_status
+    assert metrics.counters['upstream_requests_total'] == requests_before + 1
+    assert upstream.in_flight == 0
+
+
+async def test_deadline_forwarded_to_upstream(ac: AsyncClient, mock_upstream):
+    budgets = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        budgets.append([int(value) for value in request.headers.get_list('x-request-deadline-ms')])
+        return httpx.Response(HTTPStatus.OK, json={})
+
+    mock_upstream(handler)
+
+    headers = {'User-Agent': 'google', 'X-Request-Deadline-Ms': '800'}
+    await ac.get(START_URL + "get_user/", headers=headers)
+    # проксируемый маршрут передает заголовки клиента: его бюджет не должен дойти до сервиса вторым значением
+    await ac.get('/api/v1/profil/self_data/', headers=headers)
+
+    for values in budgets:
+        assert len(values) == 1
+        assert 0 < values[0] <= 800
+    assert len(budgets) == 2
+
+
+async def test_spent_deadline_fails_fast(ac: AsyncClient, mock_upstream):
+    mock_upstream(lambda request: pytest.fail('request with spent budget must not reach upstream'))
+    exceeded_before = metrics.counters['deadline_exceeded_total']
+
+    response = await ac.get(START_URL + "get_user/", headers={'User-Agent': 'google', 'X-Request-Deadline-Ms': '0'})
+
+    assert response.status_code == HTTPStatus.GATEWAY_TIMEOUT
+    assert metrics.counters['deadline_exceeded_total'] == exceeded_before + 1
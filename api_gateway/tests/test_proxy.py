@@ -0,0 +1,83 @@
+import asyncio
+from typing import AsyncGenerator
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+from http import HTTPStatus
+
+from api.v1 import proxy
+from main import app
+
+START_URL = "/api/v1/"
+
+proxy_app = FastAPI()
+proxy_app.include_router(proxy.router, prefix='/api/v1')
+# фикстуры подменяют зависимости основного приложения
+proxy_app.dependency_overrides = app.dependency_overrides
+
+
+@pytest.fixture
+async def pc() -> AsyncGenerator[AsyncClient, None]:
+    async with AsyncClient(app=proxy_app, base_url="http://test") as pc:
+        yield pc
+
+
+async def test_login_streamed_as_is(pc: AsyncClient, mock_upstream):
+    body = b'{"detail":"\\u041d\\u0435\\u0432\\u0435\\u0440\\u043d\\u044b\\u0439"}'
+
+    async def upstream_body():
+        yield body[:10]
+        await asyncio.sleep(0)
+        yield body[10:]
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.path == '/api/v1/auth/login/'
+        assert await request.aread() == b'{"login": "admin", "password": "admin"}'
+        assert request.headers['user-agent'] == 'google'
+        return httpx.Response(
+            HTTPStatus.BAD_REQUEST,
+            headers=[
+                ('content-type', 'application/json'),
+                ('set-cookie', 'access_token_cookie=access; HttpOnly; Path=/'),
+                ('set-cookie', 'refresh_token_cookie=refresh; HttpOnly; Path=/'),
+            ],
+            content=upstream_body(),
+        )
+
+    mock_upstream(handler)
+
+    response = await pc.post(
+        START_URL + "login/", headers={'User-Agent': 'google', 'Content-Type': 'application/json'},
+        content=b'{"login": "admin", "password": "admin"}'
+    )
+
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert response.content == body
+    assert response.headers.get_list('set-cookie') == [
+        'access_token_cookie=access; HttpOnly; Path=/', 'refresh_token_cookie=refresh; HttpOnly; Path=/'
+    ]
+    pc.cookies.clear()
+
+
+async def test_get_user_cached_as_raw_bytes(pc: AsyncClient, mock_upstream, token_cache):
+    calls = 0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        return httpx.Response(HTTPStatus.OK, content=b'{"sub":"user"}', headers={'content-type': 'application/json'})
+
+    mock_upstream(handler)
+    token = 'header.eyJleHAiOjk5OTk5OTk5OTl9.signature'
+
+    for _ in range(2):
+        response = await pc.get(
+            START_URL + "get_user/", headers={'User-Agent': 'google'}, cookies={'access_token_cookie': token}
+        )
+        assert response.content == b'{"sub":"user"}'
+
+    assert calls == 1
+    assert token_cache.get(token, 'google') == b'{"sub":"user"}'
+    pc.cookies.clear()
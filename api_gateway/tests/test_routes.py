@@ -0,0 +1,135 @@
+import asyncio
+
+import httpx
+import pytest
+from httpx import AsyncClient
+from http import HTTPStatus
+
+from core.routes import CachePolicy, Route, RouteTable, route_table
+
+
+@pytest.mark.parametrize(
+    'path, expected_prefix',
+    [
+        ('/api/v1/auth/get_user/', '/api/v1/auth/get_user/'),
+        ('/api/v1/auth/login/', '/api/v1/auth/'),
+        ('/api/v1/profil/self_data/', '/api/v1/profil/'),
+        ('/api/v1/admin/update/1/', '/api/v1/admin/'),
+        ('/api/v2/profil/', None),
+        ('/api/v1/profile/', None),
+        ('/api/v1/auth/introspect/', None),
+    ]
+)
+def test_route_match(path, expected_prefix):
+    state = route_table.match(path)
+    assert (state.route.prefix if state else None) == expected_prefix
+
+
+def test_longest_prefix_wins_regardless_of_order():
+    table = RouteTable([Route(prefix='/a/', upstream='x'), Route(prefix='/a/b/', upstream='y')])
+    assert table.match('/a/b/c').route.upstream == 'y'
+    assert table.match('/a/c').route.upstream == 'x'
+
+
+@pytest.mark.parametrize(
+    'method, path',
+    [
+        ('GET', '/api/v1/profil/self_data/'),
+        ('PATCH', '/api/v1/profil/self_data/'),
+        ('POST', '/api/v1/admin/assign/'),
+        ('PATCH', '/api/v1/admin/delete/7b1c9c3e-5d52-4b55-a0b5-23d3f20b48b3/'),
+    ]
+)
+async def test_auth_routers_proxied(method, path, ac: AsyncClient, mock_upstream):
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.method == method
+        assert request.url.path == path
+        assert request.url.params['page'] == '2'
+        return httpx.Response(HTTPStatus.OK, json={'path': request.url.path})
+
+    mock_upstream(handler)
+
+    response = await ac.request(method, path, params={'page': 2}, headers={'User-Agent': 'google'})
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {'path': path}
+
+
+async def test_unknown_route(ac: AsyncClient, mock_upstream):
+    mock_upstream(lambda request: pytest.fail('unknown route must not reach upstream'))
+
+    response = await ac.get('/api/v2/unknown/')
+
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+    # внутренний метод auth под общим префиксом /api/v1/auth/
+    response = await ac.post('/api/v1/auth/introspect/', json={'tokens': []})
+
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+async def test_route_concurrency_limit(ac: AsyncClient, mock_upstream, monkeypatch):
+    state = route_table.match('/api/v1/admin/')
+    monkeypatch.setattr(state.route, 'max_concurrency', 1)
+    release = asyncio.Event()
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await release.wait()
+        return httpx.Response(HTTPStatus.OK, json=None)
+
+    mock_upstream(handler)
+
+    first = asyncio.ensure_future(ac.post('/api/v1/admin/assign/', json={}))
+    await asyncio.sleep(0.05)
+    rejected = await ac.post('/api/v1/admin/assign/', json={})
+    release.set()
+
+    assert rejected.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert (await first).status_code == HTTPStatus.OK
+    assert state.in_flight == 0
+
+
+async def test_get_user_route_cached_and_logout_evicts(ac: AsyncClient, mock_upstream, token_cache):
+    assert route_table.match('/api/v1/auth/get_user/').route.cache is CachePolicy.token
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        return httpx.Response(HTTPStatus.OK, content=b'{"sub":"user"}', headers={'content-type': 'application/json'})
+
+    mock_upstream(handler)
+    token = 'header.eyJleHAiOjk5OTk5OTk5OTl9.signature'
+    cookies = {'access_token_cookie': token}
+
+    for _ in range(2):
+        await ac.get('/api/v1/auth/get_user/', headers={'User-Agent': 'google'}, cookies=cookies)
+    assert calls == ['/api/v1/auth/get_user/']
+
+    await ac.get('/api/v1/auth/logout/', headers={'User-Agent': 'google'}, cookies=cookies)
+
+    assert token not in token_cache.entries
+    ac.cookies.clear()
+
+
+async def test_route_concurrency_limit_covers_streamed_body(ac: AsyncClient, mock_upstream, monkeypatch):
+    state = route_table.match('/api/v1/profil/')
+    monkeypatch.setattr(state.route, 'max_concurrency', 1)
+    release = asyncio.Event()
+
+    async def body():
+        yield b'{"login":'
+        await release.wait()
+        yield b'"admin"}'
+
+    mock_upstream(lambda request: httpx.Response(HTTPStatus.OK, content=body()))
+
+    first = asyncio.ensure_future(ac.get('/api/v1/profil/self_data/'))
+    await asyncio.sleep(0.05)
+    # обработчик уже вернул ответ, но тело еще отправляется: место маршрута занято
+    assert state.in_flight == 1
+    rejected = await ac.get('/api/v1/profil/self_data/')
+    release.set()
+
+    assert rejected.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert (await first).content == b'{"login":"admin"}'
+    assert state.in_flight == 0
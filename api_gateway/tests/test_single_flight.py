@@ -0,0 +1,73 @@
+import asyncio
+
+import httpx
+import pytest
+from httpx import AsyncClient
+from http import HTTPStatus
+
+from services.single_flight import SingleFlight
+
+START_URL = "/api/v1/"
+CALLERS = 20
+
+
+async def test_concurrent_get_user_coalesced(ac: AsyncClient, mock_upstream, single_flight):
+    calls = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.1)
+        return httpx.Response(HTTPStatus.OK, json={'sub': 'user'})
+
+    mock_upstream(handler)
+
+    responses = await asyncio.gather(*[
+        ac.get(START_URL + "get_user/", headers={'User-Agent': 'google'}, cookies={'access_token_cookie': 'token'})
+        for _ in range(CALLERS)
+    ])
+
+    assert calls == 1
+    assert all(response.json() == {'sub': 'user'} for response in responses)
+    assert single_flight.leaders == 1
+    assert single_flight.shared == CALLERS - 1
+    assert not single_flight.calls
+    ac.cookies.clear()
+
+
+async def test_different_keys_not_coalesced():
+    single_flight = SingleFlight()
+    calls = []
+
+    async def call(user_agent):
+        calls.append(user_agent)
+        await asyncio.sleep(0.01)
+        return user_agent
+
+    results = await asyncio.gather(*[
+        single_flight.do(SingleFlight.make_key('GET', '/', {}, (), user_agent), lambda ua=user_agent: call(ua))
+        for user_agent in ('google', 'yandex', 'google')
+    ])
+
+    assert results == ['google', 'yandex', 'google']
+    assert sorted(calls) == ['google', 'yandex']
+
+
+async def test_error_shared_and_cancelled_leader():
+    single_flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def call():
+        await release.wait()
+        raise httpx.ConnectError('refused')
+
+    leader = asyncio.ensure_future(single_flight.do('key', call))
+    await asyncio.sleep(0)
+    follower = asyncio.ensure_future(single_flight.do('key', call))
+    await asyncio.sleep(0)
+    leader.cancel()
+    release.set()
+
+    with pytest.raises(httpx.ConnectError):
+        await follower
+    assert leader.cancelled()
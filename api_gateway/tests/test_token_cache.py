@@ -0,0 +1,99 @@
+import base64
+import time
+
+import httpx
+import orjson
+import pytest
+from httpx import AsyncClient
+from http import HTTPStatus
+
+START_URL = "/api/v1/"
+
+
+def make_token(exp: float) -> str:
+    payload = base64.urlsafe_b64encode(orjson.dumps({'sub': 'user', 'exp': exp})).rstrip(b'=').decode()
+    return f'header.{payload}.signature'
+
+
+def counting_handler(status: int = HTTPStatus.OK):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        if request.url.path == '/api/v1/auth/logout/':
+            return httpx.Response(HTTPStatus.OK, content=b'null')
+        return httpx.Response(status, json={'sub': 'user', 'user_agent': request.headers['user-agent']})
+
+    return handler, calls
+
+
+async def test_get_user_served_from_cache(ac: AsyncClient, mock_upstream, token_cache):
+    handler, calls = counting_handler()
+    mock_upstream(handler)
+    cookies = {'access_token_cookie': make_token(time.time() + 100)}
+
+    for _ in range(3):
+        response = await ac.get(START_URL + "get_user/", headers={'User-Agent': 'google'}, cookies=cookies)
+        assert response.json() == {'sub': 'user', 'user_agent': 'google'}
+
+    assert len(calls) == 1
+
+    # другой User-Agent - другая запись
+    await ac.get(START_URL + "get_user/", headers={'User-Agent': 'yandex'}, cookies=cookies)
+    assert len(calls) == 2
+    ac.cookies.clear()
+
+
+@pytest.mark.parametrize(
+    'exp, status, cached',
+    [
+        (time.time() - 1, HTTPStatus.OK, False),
+        (time.time() + 100, HTTPStatus.UNPROCESSABLE_ENTITY, False),
+        (time.time() + 100, HTTPStatus.OK, True),
+    ]
+)
+async def test_cache_policy(exp, status, cached, ac: AsyncClient, mock_upstream, token_cache):
+    handler, calls = counting_handler(status)
+    mock_upstream(handler)
+    token = make_token(exp)
+
+    await ac.get(START_URL + "get_user/", headers={'User-Agent': 'google'}, cookies={'access_token_cookie': token})
+
+    assert (token_cache.get(token, 'google') is not None) == cached
+    ac.cookies.clear()
+
+
+def test_ttl_capped_by_token_exp(token_cache):
+    token = make_token(time.time() + 5)
+
+    token_cache.put(token, 'google', {'sub': 'user'})
+
+    expires_at, _ = token_cache.entries[token]['google']
+    assert expires_at <= time.time() + 5
+
+
+def test_lru_eviction(token_cache):
+    token_cache.max_size = 2
+    tokens = [make_token(time.time() + 100 + i) for i in range(3)]
+    for token in tokens[:2]:
+        token_cache.put(token, 'google', {})
+    token_cache.get(tokens[0], 'google')
+
+    token_cache.put(tokens[2], 'google', {})
+
+    assert list(token_cache.entries) == [tokens[0], tokens[2]]
+
+
+@pytest.mark.parametrize('method, path', [('GET', 'logout/'), ('POST', 'refresh/')])
+async def test_logout_and_refresh_evict(method, path, ac: AsyncClient, mock_upstream, token_cache):
+    handler, calls = counting_handler()
+    mock_upstream(handler)
+    token = make_token(time.time() + 100)
+    cookies = {'access_token_cookie': token}
+    await ac.get(START_URL + "get_user/", headers={'User-Agent': 'google'}, cookies=cookies)
+    assert token in token_cache.entries
+
+    await ac.request(method, START_URL + path, headers={'User-Agent': 'google'}, cookies=cookies)
+
+    assert token not in token_cache.entries
+    ac.cookies.clear()
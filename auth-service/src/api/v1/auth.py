@@ -1,14 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, Header, Request
+from fastapi import APIRouter, Depends, HTTPException, Header, Request, Response
 from typing import Annotated
-from depends import get_repository_user
-from schemas.entity import UserCreate, UserLogin
+from depends import get_repository_user, login_rate_limit, refresh_rate_limit, service_auth
+from schemas.entity import UserCreate, UserLogin, IntrospectRequest, IntrospectResult
+from services.signing_keys import KeyRing, get_key_ring
 from services.user import BaseAuth
-from core.config import ErrorName
+from core.config import ErrorName, app_settings
 
 router = APIRouter()
 
 
-@router.post('/login/')
+@router.post('/login/', dependencies=[Depends(login_rate_limit)])
 async def login(
         data: UserLogin, user_agent: Annotated[str | None, Header()] = None,
         user_manager: BaseAuth = Depends(get_repository_user)
@@ -47,7 +48,19 @@ async def get_user(
     return result
 
 
-@router.post('/refresh/')
+@router.post('/introspect/', dependencies=[Depends(service_auth)])
+async def introspect(
+        data: IntrospectRequest,
+        user_manager: BaseAuth = Depends(get_repository_user)
+) -> list[IntrospectResult]:
+    '''
+    Метод проверяет пачку access токенов за один запрос: для каждого токена возвращает claims или ошибку.
+    Доступен только сервисам с токеном INTROSPECT_TOKEN в заголовке X-Service-Token, через api_gateway не проксируется.
+    '''
+    return await user_manager.introspect(data.tokens)
+
+
+@router.post('/refresh/', dependencies=[Depends(refresh_rate_limit)])
 async def refresh(
         request: Request, user_agent: Annotated[str | None, Header()] = None,
         user_manager: BaseAuth = Depends(get_repository_user),
@@ -68,3 +81,33 @@ async def logout(
         request: Request, user_agent: Annotated[str | None, Header()] = None,
         user_manager: BaseAuth = Depends(get_repository_user)):
     await user_manager.logout(request, user_agent)
+
+
+@router.post('/logout_all/')
+async def logout_all(
+        request: Request, user_agent: Annotated[str | None, Header()] = None,
+        user_manager: BaseAuth = Depends(get_repository_user)):
+    '''
+    Метод завершает все сессии пользователя на всех устройствах.
+    '''
+    result = await user_manager.logout_all(request, user_agent)
+    match result:
+        case ErrorName.InvalidAccessToken:
+            raise HTTPException(status_code=422, detail='Signature has expired')
+        case ErrorName.UnsafeEntry:
+            raise HTTPException(status_code=400, detail='подозрение на небезопасный вход')
+
+
+@router.get('/jwks/')
+async def jwks(
+        if_none_match: Annotated[str | None, Header()] = None,
+        key_ring: KeyRing = Depends(get_key_ring)
+) -> Response:
+    '''
+    Открытые ключи подписи токенов (JWKS) для проверки токенов в других сервисах без запроса в сервис авторизации.
+    Время кеширования меньше периода, в течение которого новый ключ публикуется до начала подписи им.
+    '''
+    headers = {'Cache-Control': f'public, max-age={app_settings.jwks_max_age}', 'ETag': key_ring.etag}
+    if if_none_match == key_ring.etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=key_ring.jwks, media_type='application/json', headers=headers)
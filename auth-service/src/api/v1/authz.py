@@ -0,0 +1,40 @@
+from fastapi import APIRouter, Depends, HTTPException, Header
+from typing import Annotated
+from depends import get_repository_user
+from schemas.entity import ContentDecision, ContentDecisionRequest
+from services.authz import content_decisions
+from services.user import BaseAuth
+from core.config import ErrorName
+
+router = APIRouter()
+
+
+async def access_claims(
+        user_agent: Annotated[str | None, Header()] = None,
+        manager_auth: BaseAuth = Depends(get_repository_user)
+) -> dict:
+    result = await manager_auth.get_info_from_access_token(user_agent)
+    match result:
+        case ErrorName.UnsafeEntry:
+            raise HTTPException(status_code=400, detail='подозрение на небезопасный вход')
+        case ErrorName.InvalidAccessToken:
+            raise HTTPException(status_code=422, detail='Signature has expired')
+    return result
+
+
+@router.get('/content/')
+async def content_access(year: int, claims: dict = Depends(access_claims)) -> ContentDecision:
+    '''
+    Метод отвечает, может ли пользователь смотреть контент указанного года. Запросов в БД не выполняет.
+    '''
+    return content_decisions(claims, [year])[0]
+
+
+@router.post('/content/')
+async def content_access_batch(
+        data: ContentDecisionRequest, claims: dict = Depends(access_claims)
+) -> list[ContentDecision]:
+    '''
+    Метод отвечает на вопрос о доступе к контенту для нескольких лет сразу (например, для страницы каталога).
+    '''
+    return content_decisions(claims, data.years)
@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+
+from core.metrics import metrics
+
+router = APIRouter()
+
+
+@router.get('/metrics/')
+async def get_metrics() -> dict:
+    return metrics.snapshot()
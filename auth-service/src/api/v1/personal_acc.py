@@ -1,11 +1,18 @@
 from services.user import UserManage
 
-from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from datetime import datetime
 from typing import Annotated
 from depends import get_user_manage
-from schemas.entity import UserProfil, ChangeProfil, ChangePassword, HistoryUser, ChangeLevel
+from models.entity import EventEnum
+from schemas.entity import (
+    UserProfil, ChangeProfil, ChangePassword, HistoryUser, HistoryFilter, ChangeLevel, SessionInfo
+)
 from core.config import ErrorName
 
+NDJSON = 'application/x-ndjson'
+
 
 router = APIRouter()
 
@@ -71,31 +78,51 @@ async def change_password(
 
 @router.get('/get_history/')
 async def get_history(
+        response: Response,
+        after: str | None = None,
+        limit: Annotated[int | None, Query(ge=1)] = None,
+        event_type: EventEnum | None = None,
+        result: bool | None = None,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        accept: Annotated[str | None, Header()] = None,
         user_agent: Annotated[str | None, Header()] = None,
         user_manager: UserManage = Depends(get_user_manage)
 ) -> list[HistoryUser]:
     '''
-    Метод возвращает информацию о пользователе.
+    Метод возвращает историю входов пользователя от новых событий к старым, по страницам.
+    Курсор следующей страницы передается в заголовке X-Next-Cursor, его значение передается в after.
+    С заголовком Accept: application/x-ndjson вся история после курсора отдается потоком, по строке на событие.
     '''
 
-    user_history: UserProfil = await user_manager.get_history(user_agent)
+    stream = accept is not None and NDJSON in accept
+    history_filter = HistoryFilter(event_type=event_type, result=result, since=since, until=until)
+    user_history = await user_manager.get_history(user_agent, history_filter, after, limit, stream)
     match user_history:
         case ErrorName.InvalidAccessToken:
             raise HTTPException(status_code=422, detail='Signature has expired')
         case ErrorName.UnsafeEntry:
             raise HTTPException(status_code=400, detail='подозрение на небезопасный вход')
-    return user_history
+        case ErrorName.InvalidCursor:
+            raise HTTPException(status_code=400, detail='Неверный курсор')
+    if stream:
+        return StreamingResponse(user_history, media_type=NDJSON)
+    page, next_cursor = user_history
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return page
 
 
 @router.post('/change-level/')
 async def change_level(
         self_data: ChangeLevel,
+        request: Request,
         user_agent: Annotated[str | None, Header()] = None,
         user_manager: UserManage = Depends(get_user_manage)) -> str | None:
     '''
     Метод для редактирования профиля пользователя.
     '''
-    status = await user_manager.change_level(user_agent, self_data.level_up)
+    status = await user_manager.change_level(user_agent, request, self_data.level_up)
     match status:
         case ErrorName.InvalidAccessToken:
             raise HTTPException(status_code=422, detail='Signature has expired')
@@ -103,4 +130,44 @@ async def change_level(
             raise HTTPException(status_code=400, detail='подозрение на небезопасный вход')
         case ErrorName.RoleDoesNotExist:
             raise HTTPException(status_code=400, detail='Роли не существует')
+        case ErrorName.InvalidRefreshToken:
+            # уровень изменен, но refresh токен сессии уже погашен: новые cookies не выдаются, нужен вход
+            raise HTTPException(status_code=401, detail='Сессия завершена, войдите снова')
     return "level raised" if self_data.level_up else "decreased"
+
+
+@router.get('/sessions/')
+async def get_sessions(
+        user_agent: Annotated[str | None, Header()] = None,
+        user_manager: UserManage = Depends(get_user_manage)
+) -> list[SessionInfo]:
+    '''
+    Метод возвращает действующие сессии (устройства) пользователя.
+    '''
+
+    sessions = await user_manager.get_sessions(user_agent)
+    match sessions:
+        case ErrorName.InvalidAccessToken:
+            raise HTTPException(status_code=422, detail='Signature has expired')
+        case ErrorName.UnsafeEntry:
+            raise HTTPException(status_code=400, detail='подозрение на небезопасный вход')
+    return sessions
+
+
+@router.delete('/sessions/{session_id}/')
+async def revoke_session(
+        session_id: str,
+        user_agent: Annotated[str | None, Header()] = None,
+        user_manager: UserManage = Depends(get_user_manage)) -> str:
+    '''
+    Метод завершает сессию пользователя на одном устройстве.
+    '''
+    status = await user_manager.revoke_session(user_agent, session_id)
+    match status:
+        case ErrorName.InvalidAccessToken:
+            raise HTTPException(status_code=422, detail='Signature has expired')
+        case ErrorName.UnsafeEntry:
+            raise HTTPException(status_code=400, detail='подозрение на небезопасный вход')
+        case ErrorName.SessionDoesNotExist:
+            raise HTTPException(status_code=404, detail='Сессия не найдена')
+    return "session revoked"
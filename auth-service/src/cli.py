@@ -1,8 +1,16 @@
 import typer
 import asyncio
+from redis.asyncio import Redis
 
-from db.postgres import command_create_role, command_create_user
+from core.config import app_settings
+
+from db.postgres import async_session, command_create_role, command_create_user
 from models.entity import Role, User
+from services.password_schemes import calibrate_argon2
+from services.history_partitions import create_partitions, drop_partitions
+from services.history_spool import history_spool
+from services.redis_cache import measure_key_layouts, migrate_legacy_keys
+from services.signing_keys import generate_key, measure_signing
 from services.repository import BaseRepository
 
 app = typer.Typer()
@@ -44,5 +52,132 @@ def create_superuser(
     print(result)
 
 
+@app.command(name='calibrate_hashing')
+def calibrate_hashing(
+        target_ms: float = 250,
+        parallelism: int = 1,
+        rounds: int = 5
+):
+    '''
+    Подбирает параметры argon2id, при которых проверка пароля на этой машине укладывается в target_ms.
+    Из подходящих выбирается самая затратная для перебора комбинация (память * проходы).
+    '''
+    results = calibrate_argon2(
+        memory_costs=[19456, 32768, 65536, 131072, 262144],
+        time_costs=[1, 2, 3, 4, 6],
+        parallelism=parallelism,
+        rounds=rounds,
+    )
+    for memory_cost, time_cost, seconds in results:
+        print(f'memory_cost={memory_cost} KiB time_cost={time_cost}: {seconds * 1000:.1f} ms')
+    fitting = [result for result in results if result[2] * 1000 <= target_ms]
+    if not fitting:
+        print(f'No parameters verify within {target_ms} ms')
+        raise typer.Exit(code=1)
+    memory_cost, time_cost, seconds = max(fitting, key=lambda result: (result[0] * result[1], result[0]))
+    print(f'Recommended ({seconds * 1000:.1f} ms):')
+    print(f'ARGON2_MEMORY_COST={memory_cost}')
+    print(f'ARGON2_TIME_COST={time_cost}')
+    print(f'ARGON2_PARALLELISM={parallelism}')
+
+
+@app.command(name='migrate_redis_keys')
+def migrate_redis_keys(batch: int = 1000):
+    '''
+    Переносит refresh токены и отозванные jti в хешированные ключи. После переноса
+    можно выключить проверку старых ключей: REDIS_LEGACY_KEYS=false.
+    '''
+    async def migrate() -> dict[str, int]:
+        redis = Redis(host=app_settings.redis_host, port=app_settings.redis_port)
+        try:
+            return await migrate_legacy_keys(redis, batch)
+        finally:
+            await redis.close()
+
+    print(asyncio.run(migrate()))
+
+
+@app.command(name='measure_redis_keys')
+def measure_redis_keys(count: int = 10000, token_size: int = 495):
+    '''
+    Замеряет расход памяти Redis на refresh токен и отозванный jti в старом и хешированном формате ключей.
+    Запускать на отдельном экземпляре Redis: замер использует общий счетчик памяти сервера.
+    '''
+    async def measure() -> dict[str, float]:
+        redis = Redis(host=app_settings.redis_host, port=app_settings.redis_port)
+        try:
+            return await measure_key_layouts(redis, count, token_size)
+        finally:
+            await redis.close()
+
+    for name, size in asyncio.run(measure()).items():
+        print(f'{name}: {size} B')
+
+
+@app.command(name='generate_signing_key')
+def generate_signing_key(
+        kid: str,
+        keys_dir: str = app_settings.jwt_keys_dir or '.',
+        algorithm: str = 'EdDSA'
+):
+    '''
+    Создает ключ подписи токенов (EdDSA или RS256). Смена ключа: новый ключ раскладывается на все экземпляры
+    и публикуется в JWKS, после JWKS_MAX_AGE становится активным (JWT_ACTIVE_KID), старый ключ удаляется
+    после TIME_LIFE_REFRESH.
+    '''
+    print(generate_key(keys_dir, kid, algorithm))
+
+
+@app.command(name='measure_signing')
+def measure_token_signing(count: int = 2000):
+    '''
+    Замеряет скорость подписи и проверки токенов и их размер для SECRET_KEY (HS256), EdDSA и RS256.
+    '''
+    print(f'{"alg":<8}{"sign/s":>10}{"verify/s":>10}{"token bytes":>13}')
+    for algorithm, stats in measure_signing(count).items():
+        print(f'{algorithm:<8}{stats["sign/s"]:>10,}{stats["verify/s"]:>10,}{stats["token bytes"]:>13}')
+
+
+@app.command(name='replay_history_spool')
+def replay_history_spool(spool_dir: str = app_settings.history_spool_dir):
+    '''
+    Переносит в login_history события, отложенные в файл при недоступности БД.
+    Сервис делает это сам раз в HISTORY_SPOOL_REPLAY_INTERVAL.
+    '''
+    history_spool.directory = spool_dir
+    history_spool.session_factory = async_session
+    print(asyncio.run(history_spool.replay()))
+
+
+@app.command(name='create_history_partitions')
+def create_history_partitions(months_ahead: int = app_settings.history_partitions_ahead):
+    '''
+    Создает секции login_history текущего месяца и months_ahead следующих. Сервис делает это сам при старте
+    и раз в HISTORY_PARTITIONS_CHECK_INTERVAL.
+    '''
+    async def create() -> list[str]:
+        async with async_session() as session:
+            return await create_partitions(session, months_ahead)
+
+    print(asyncio.run(create()))
+
+
+@app.command(name='history_retention')
+def history_retention(
+        keep_months: int = app_settings.history_retention_months,
+        detach: bool = False,
+        dry_run: bool = False
+):
+    '''
+    Удаляет месячные секции login_history старше keep_months полных месяцев. С --detach секции только
+    отсоединяются и остаются отдельными таблицами (для выгрузки в архив), с --dry-run только выводятся.
+    '''
+    async def drop() -> list[str]:
+        async with async_session() as session:
+            return await drop_partitions(session, keep_months, detach=detach, dry_run=dry_run)
+
+    print(asyncio.run(drop()))
+
+
 if __name__ == "__main__":
     app()
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from os import getenv
+from os import cpu_count, getenv
 from dotenv import load_dotenv
 from enum import Enum
 
@@ -22,6 +22,71 @@ class Settings(BaseModel):
     authjwt_refresh_cookie_key: str = 'refresh_token_cookie'
     authjwt_time_access: int
     authjwt_time_refresh: int
+    request_deadline: float = 10
+    # процессы для хеширования паролей в каждом воркере gunicorn и число запросов, которые могут ждать свободный
+    # процесс. По умолчанию ядра делятся между воркерами (WEB_CONCURRENCY): argon2id занимает ядро и 64 MiB на хеш
+    hash_workers: int
+    hash_queue_size: int = 64
+    # схема для новых хешей паролей (argon2id | werkzeug), параметры argon2id: время, память в KiB, потоки
+    password_scheme: str = 'argon2id'
+    argon2_time_cost: int = 3
+    argon2_memory_cost: int = 65536
+    argon2_parallelism: int = 1
+    # ограничения попыток входа и обновления токенов: число попыток в скользящем окне (секунды)
+    login_attempts_per_login: int = 5
+    login_attempts_per_ip: int = 30
+    login_window: int = 60
+    refresh_attempts_per_ip: int = 60
+    refresh_window: int = 60
+    # проверять ключи Redis в старом формате, пока они не перенесены командой cli.py migrate_redis_keys
+    redis_legacy_keys: bool = True
+    # фильтр Блума отозванных jti: ожидаемое число отозванных токенов, доля ложных срабатываний,
+    # период пересборки (секунды)
+    denylist_filter_capacity: int = 100000
+    denylist_filter_error_rate: float = 0.001
+    denylist_filter_rebuild: float = 300
+    # кеш поколений токенов пользователей в памяти воркера: время жизни записи (секунды) и размер
+    generation_cache_ttl: float = 5
+    generation_cache_size: int = 10000
+    # ключ отпечатка User-Agent в токенах и прием токенов со строкой User-Agent, выпущенных до перехода на отпечаток
+    user_agent_key: str
+    user_agent_legacy_claims: bool = True
+    # каталог ключей подписи токенов (<kid>.pem, <kid>.pub) и kid активного ключа, без них токены подписываются
+    # SECRET_KEY (HS256); прием токенов, подписанных SECRET_KEY, после перехода на ключи; время кеширования JWKS
+    jwt_keys_dir: str | None = None
+    jwt_active_kid: str | None = None
+    jwt_accept_secret_key: bool = True
+    jwks_max_age: int = 300
+    # максимальное число токенов в одном запросе пакетной проверки и токен сервисов, которым она доступна
+    # (заголовок X-Service-Token), без токена пакетная проверка отключена
+    introspect_batch_size: int = 100
+    introspect_token: str | None = None
+    # период перечитывания копии таблицы ролей в воркере (секунды) и число лет в одном запросе решения о доступе
+    role_snapshot_refresh: float = 30
+    authz_batch_size: int = 1000
+    # фоновая запись истории входов: строк в одном INSERT, максимальная задержка записи (секунды), размер очереди
+    history_batch_size: int = 500
+    history_flush_interval: float = 0.5
+    history_queue_size: int = 10000
+    # время на запись пачки истории (фоновая запись) и одного события (без фоновой записи), после него события
+    # откладываются в файл в history_spool_dir и переносятся в БД раз в history_spool_replay_interval секунд
+    history_flush_timeout: float = 2
+    history_write_timeout: float = 0.2
+    history_spool_dir: str = '/var/spool/auth'
+    history_spool_replay_interval: float = 30
+    # страница истории входов по умолчанию и максимальная, строк за одно чтение при выдаче потоком (NDJSON)
+    history_page_size: int = 100
+    history_max_page_size: int = 1000
+    history_stream_chunk: int = 1000
+    # время на выгрузку истории потоком (секунды): выгрузка идет дольше обычного запроса и не ограничена его бюджетом
+    history_stream_timeout: float = 300
+    # login_history разбита на месячные секции: сколько секций держать созданными наперед, как часто проверять
+    # и сколько полных месяцев истории хранить (cli.py history_retention)
+    history_partitions_ahead: int = 3
+    history_partitions_check_interval: float = 3600
+    history_retention_months: int = 12
+    # число строк User-Agent -> id из user_agents в памяти воркера
+    user_agent_cache_size: int = 10000
 
     def __init__(self, **data):
         data["pg_user"] = getenv("POSTGRES_USER")
@@ -35,6 +100,49 @@ class Settings(BaseModel):
         data["authjwt_secret_key"] = getenv("SECRET_KEY")
         data["authjwt_time_access"] = getenv("TIME_LIFE_ACCESS")
         data["authjwt_time_refresh"] = getenv("TIME_LIFE_REFRESH")
+        data["request_deadline"] = getenv("REQUEST_DEADLINE", 10)
+        data["hash_workers"] = getenv("HASH_WORKERS", max(1, (cpu_count() or 1) // int(getenv("WEB_CONCURRENCY", 1))))
+        data["hash_queue_size"] = getenv("HASH_QUEUE_SIZE", 64)
+        data["password_scheme"] = getenv("PASSWORD_SCHEME", 'argon2id')
+        data["argon2_time_cost"] = getenv("ARGON2_TIME_COST", 3)
+        data["argon2_memory_cost"] = getenv("ARGON2_MEMORY_COST", 65536)
+        data["argon2_parallelism"] = getenv("ARGON2_PARALLELISM", 1)
+        data["login_attempts_per_login"] = getenv("LOGIN_ATTEMPTS_PER_LOGIN", 5)
+        data["login_attempts_per_ip"] = getenv("LOGIN_ATTEMPTS_PER_IP", 30)
+        data["login_window"] = getenv("LOGIN_WINDOW", 60)
+        data["refresh_attempts_per_ip"] = getenv("REFRESH_ATTEMPTS_PER_IP", 60)
+        data["refresh_window"] = getenv("REFRESH_WINDOW", 60)
+        data["redis_legacy_keys"] = getenv("REDIS_LEGACY_KEYS", True)
+        data["denylist_filter_capacity"] = getenv("DENYLIST_FILTER_CAPACITY", 100000)
+        data["denylist_filter_error_rate"] = getenv("DENYLIST_FILTER_ERROR_RATE", 0.001)
+        data["denylist_filter_rebuild"] = getenv("DENYLIST_FILTER_REBUILD", 300)
+        data["generation_cache_ttl"] = getenv("GENERATION_CACHE_TTL", 5)
+        data["generation_cache_size"] = getenv("GENERATION_CACHE_SIZE", 10000)
+        data["user_agent_key"] = getenv("USER_AGENT_KEY", getenv("SECRET_KEY"))
+        data["user_agent_legacy_claims"] = getenv("USER_AGENT_LEGACY_CLAIMS", True)
+        data["jwt_keys_dir"] = getenv("JWT_KEYS_DIR")
+        data["jwt_active_kid"] = getenv("JWT_ACTIVE_KID")
+        data["jwt_accept_secret_key"] = getenv("JWT_ACCEPT_SECRET_KEY", True)
+        data["jwks_max_age"] = getenv("JWKS_MAX_AGE", 300)
+        data["introspect_batch_size"] = getenv("INTROSPECT_BATCH_SIZE", 100)
+        data["introspect_token"] = getenv("INTROSPECT_TOKEN")
+        data["role_snapshot_refresh"] = getenv("ROLE_SNAPSHOT_REFRESH", 30)
+        data["authz_batch_size"] = getenv("AUTHZ_BATCH_SIZE", 1000)
+        data["history_batch_size"] = getenv("HISTORY_BATCH_SIZE", 500)
+        data["history_flush_interval"] = getenv("HISTORY_FLUSH_INTERVAL", 0.5)
+        data["history_queue_size"] = getenv("HISTORY_QUEUE_SIZE", 10000)
+        data["history_flush_timeout"] = getenv("HISTORY_FLUSH_TIMEOUT", 2)
+        data["history_write_timeout"] = getenv("HISTORY_WRITE_TIMEOUT", 0.2)
+        data["history_spool_dir"] = getenv("HISTORY_SPOOL_DIR", '/var/spool/auth')
+        data["history_spool_replay_interval"] = getenv("HISTORY_SPOOL_REPLAY_INTERVAL", 30)
+        data["history_page_size"] = getenv("HISTORY_PAGE_SIZE", 100)
+        data["history_max_page_size"] = getenv("HISTORY_MAX_PAGE_SIZE", 1000)
+        data["history_stream_chunk"] = getenv("HISTORY_STREAM_CHUNK", 1000)
+        data["history_stream_timeout"] = getenv("HISTORY_STREAM_TIMEOUT", 300)
+        data["history_partitions_ahead"] = getenv("HISTORY_PARTITIONS_AHEAD", 3)
+        data["history_partitions_check_interval"] = getenv("HISTORY_PARTITIONS_CHECK_INTERVAL", 3600)
+        data["history_retention_months"] = getenv("HISTORY_RETENTION_MONTHS", 12)
+        data["user_agent_cache_size"] = getenv("USER_AGENT_CACHE_SIZE", 10000)
         super().__init__(**data)
 
     def database_dsn(self):
@@ -54,6 +162,8 @@ class ErrorName(Enum):
     RoleAlreadyExists = "RoleAlreadyExists"
     RoleDoesNotExist = "RoleDoesNotExist"
     UserDoesNotExist = "UserDoesNotExist"
+    SessionDoesNotExist = "SessionDoesNotExist"
+    InvalidCursor = "InvalidCursor"
 
 
 app_settings = Settings()
@@ -0,0 +1,54 @@
+import asyncio
+from contextvars import ContextVar
+from time import monotonic
+from typing import Any, Awaitable, Callable
+
+# оставшийся бюджет запроса в миллисекундах, выставляется api_gateway
+DEADLINE_HEADER = 'X-Request-Deadline-Ms'
+
+request_deadline: ContextVar[float | None] = ContextVar('request_deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    '''
+    Бюджет времени запроса исчерпан.
+    '''
+
+
+def set_deadline(budget: float) -> None:
+    request_deadline.set(monotonic() + budget)
+
+
+def parse_budget(header: str | None) -> float | None:
+    try:
+        return int(header) / 1000
+    except (TypeError, ValueError):
+        return None
+
+
+def remaining_budget() -> float | None:
+    """
+    :return:
+    float | None: Оставшийся бюджет в секундах или None, если у запроса нет дедлайна.
+                  Если бюджет исчерпан, выбрасывает DeadlineExceeded.
+    """
+    deadline = request_deadline.get()
+    if deadline is None:
+        return None
+    budget = deadline - monotonic()
+    if budget <= 0:
+        raise DeadlineExceeded
+    return budget
+
+
+async def with_deadline(func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+    """
+    Выполняет func(*args, **kwargs), отменяя ее по истечении бюджета запроса.
+    """
+    budget = remaining_budget()
+    if budget is None:
+        return await func(*args, **kwargs)
+    try:
+        return await asyncio.wait_for(func(*args, **kwargs), budget)
+    except asyncio.TimeoutError as exc:
+        raise DeadlineExceeded from exc
@@ -1,5 +1,7 @@
 from core.config import app_settings
-from sqlalchemy.orm import declarative_base, sessionmaker
+from core.deadline import remaining_budget
+from sqlalchemy import event
+from sqlalchemy.orm import declarative_base, sessionmaker, Session
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 
 Base = declarative_base()
@@ -8,6 +10,16 @@ engine = create_async_engine(url=app_settings.database_dsn(), echo=True, future=
 async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 
+@event.listens_for(Session, 'after_begin')
+def set_statement_timeout(session, transaction, connection) -> None:
+    '''
+    Ограничивает запросы транзакции оставшимся бюджетом времени HTTP запроса.
+    '''
+    budget = remaining_budget()
+    if budget is not None:
+        connection.exec_driver_sql(f'SET LOCAL statement_timeout = {max(int(budget * 1000), 1)}')
+
+
 async def get_session() -> AsyncSession:
     async with async_session() as session:
         yield session
@@ -1,11 +1,19 @@
-from async_fastapi_jwt_auth import AuthJWT
+from hmac import compare_digest
+from math import ceil
+from typing import Annotated
+
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi import Depends
+from fastapi import Depends, HTTPException, Header, Request
+
+from core.config import app_settings
 
+from services.auth_jwt import KeyRingAuthJWT
 from services.user import BaseAuth, UserManage
 from services.role import BaseRole
 from services.history import BaseHistory
 from services.admin import BaseAdmin
+from services.hashing import PasswordHasher, get_password_hasher
+from services.rate_limit import RateLimiter
 from db.postgres import get_session
 from db.redis import get_redis, Redis
 
@@ -18,11 +26,14 @@ def get_manager_history(
 
 def get_repository_user(
         session: AsyncSession = Depends(get_session),
-        authorize: AuthJWT = Depends(),
+        authorize: KeyRingAuthJWT = Depends(),
         redis: Redis = Depends(get_redis),
-        manager_history: BaseHistory = Depends(get_manager_history)
+        manager_history: BaseHistory = Depends(get_manager_history),
+        password_hasher: PasswordHasher = Depends(get_password_hasher)
 ):
-    return BaseAuth(session=session, auth=authorize, redis=redis, manager_history=manager_history)
+    return BaseAuth(
+        session=session, auth=authorize, redis=redis, manager_history=manager_history, password_hasher=password_hasher
+    )
 
 
 def get_repository_role(
@@ -45,3 +56,59 @@ def get_user_manage(
         manager_history: BaseHistory = Depends(get_manager_history)
 ):
     return UserManage(manager_auth=manager_auth, manager_role=manager_role, manager_history=manager_history)
+
+
+def get_rate_limiter(
+        redis: Redis = Depends(get_redis)
+):
+    return RateLimiter(redis)
+
+
+def client_ip(request: Request) -> str:
+    # X-Real-IP выставляет nginx, api_gateway передает его дальше
+    return request.headers.get('x-real-ip') or request.client.host
+
+
+async def check_rate_limit(rate_limiter: RateLimiter, name: str, limits: list[tuple[str, int, int]]) -> None:
+    retry_after = await rate_limiter.hit(name, limits)
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail='Слишком много попыток, повторите позже',
+            headers={'Retry-After': str(ceil(retry_after))}
+        )
+
+
+async def login_rate_limit(
+        request: Request,
+        rate_limiter: RateLimiter = Depends(get_rate_limiter)
+):
+    '''
+    Ограничивает попытки входа по логину и по IP до обращения к базе и хеширования пароля.
+    '''
+    limits = [(f'login_ip:{client_ip(request)}', app_settings.login_attempts_per_ip, app_settings.login_window)]
+    try:
+        login = (await request.json()).get('login')
+    except (ValueError, AttributeError):
+        login = None
+    if isinstance(login, str):
+        limits.append((f'login:{login}', app_settings.login_attempts_per_login, app_settings.login_window))
+    await check_rate_limit(rate_limiter, 'login', limits)
+
+
+async def refresh_rate_limit(
+        request: Request,
+        rate_limiter: RateLimiter = Depends(get_rate_limiter)
+):
+    limits = [(f'refresh_ip:{client_ip(request)}', app_settings.refresh_attempts_per_ip, app_settings.refresh_window)]
+    await check_rate_limit(rate_limiter, 'refresh', limits)
+
+
+def service_auth(x_service_token: Annotated[str | None, Header()] = None) -> None:
+    # пакетная проверка токенов - внутренний метод: без проверки UA и отзыва токена, только для других сервисов
+    if not app_settings.introspect_token:
+        raise HTTPException(status_code=403, detail='Пакетная проверка токенов отключена')
+    if x_service_token is None:
+        raise HTTPException(status_code=401, detail='Нужен токен сервиса')
+    if not compare_digest(x_service_token.encode(), app_settings.introspect_token.encode()):
+        raise HTTPException(status_code=403, detail='Неверный токен сервиса')
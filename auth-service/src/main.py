@@ -6,9 +6,19 @@ from async_fastapi_jwt_auth import AuthJWT
 from async_fastapi_jwt_auth.exceptions import AuthJWTException
 
 from core.config import app_settings
+from core.deadline import DEADLINE_HEADER, DeadlineExceeded, parse_budget, set_deadline
+from core.metrics import metrics as service_metrics
 from db import redis
+from db.postgres import async_session
+from services import hashing
+from services.history_partitions import history_partitions
+from services.history_spool import history_spool
+from services.history_writer import history_writer
+from services.redis_cache import denylist_keys
+from services.revocation_filter import revocation_filter
+from services.role_snapshot import role_snapshot
 
-from api.v1 import auth, personal_acc, roles
+from api.v1 import auth, authz, metrics, personal_acc, roles
 
 
 app = FastAPI(
@@ -32,15 +42,63 @@ def authjwt_exception_handler(request: Request, exc: AuthJWTException):
     )
 
 
+@app.middleware('http')
+async def request_deadline(request: Request, call_next):
+    budget = app_settings.request_deadline
+    incoming = parse_budget(request.headers.get(DEADLINE_HEADER))
+    if incoming is not None:
+        budget = min(budget, incoming)
+    if budget <= 0:
+        return deadline_exceeded_handler(request, DeadlineExceeded())
+    set_deadline(budget)
+    return await call_next(request)
+
+
+@app.exception_handler(DeadlineExceeded)
+def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded):
+    service_metrics.inc('deadline_exceeded_total')
+    return ORJSONResponse(
+        status_code=504,
+        content={"detail": "Истекло время обработки запроса"}
+    )
+
+
+@app.exception_handler(hashing.HashingBusy)
+def hashing_busy_handler(request: Request, exc: hashing.HashingBusy):
+    return ORJSONResponse(
+        status_code=503,
+        content={"detail": "Сервис перегружен, повторите запрос позже"},
+        headers={"Retry-After": "1"}
+    )
+
+
 @app.on_event('startup')
 async def startup():
     redis.redis = Redis(host=app_settings.redis_host, port=app_settings.redis_port)
+    await hashing.password_hasher.start()
+    await revocation_filter.start(redis.redis, denylist_keys)
+    await role_snapshot.start(async_session)
+    await history_partitions.start(async_session)
+    await history_writer.start(async_session)
+    await history_spool.start(async_session)
     # from models.entity import User
     # await create_database()
 
+
+@app.on_event('shutdown')
+async def shutdown():
+    hashing.password_hasher.stop()
+    await revocation_filter.stop()
+    await role_snapshot.stop()
+    await history_partitions.stop()
+    await history_writer.stop()
+    await history_spool.stop()
+
 app.include_router(auth.router, prefix='/api/v1/auth', tags=['login'])
 app.include_router(personal_acc.router, prefix='/api/v1/profil', tags=['personal_acc'])
 app.include_router(roles.router, prefix='/api/v1/admin', tags=['admin'])
+app.include_router(authz.router, prefix='/api/v1/authz', tags=['authz'])
+app.include_router(metrics.router, prefix='/api/v1', tags=['metrics'])
 
 if __name__ == '__main__':
     uvicorn.run(
@@ -0,0 +1,33 @@
+"""login_history user_id, time index
+
+Revision ID: 7c41d2a9e8f3
+Revises: 039e1eae5b38
+Create Date: 2026-10-18 12:04:31.518230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c41d2a9e8f3'
+down_revision = '039e1eae5b38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY не блокирует запись истории на время построения и не выполняется в транзакции
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_login_history_user_id_time',
+            'login_history',
+            ['user_id', sa.text('time DESC'), sa.text('id DESC')],
+            postgresql_include=['browser', 'event_type', 'result'],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_login_history_user_id_time', table_name='login_history', postgresql_concurrently=True)
@@ -0,0 +1,105 @@
+"""partition login_history by month
+
+Revision ID: b5e0c3f17a26
+Revises: 7c41d2a9e8f3
+Create Date: 2026-10-18 15:21:47.203118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e0c3f17a26'
+down_revision = '7c41d2a9e8f3'
+branch_labels = None
+depends_on = None
+
+# секции на месяцы с событиями и на 3 месяца вперед, дальше их создает сервис (services.history_partitions)
+CREATE_PARTITIONS = '''
+DO $$
+DECLARE
+    month date;
+BEGIN
+    FOR month IN
+        SELECT generate_series(
+            date_trunc('month', coalesce(
+                (SELECT min(time) FROM login_history_unpartitioned), timezone('utc', now())
+            )),
+            date_trunc('month', timezone('utc', now())) + interval '3 months',
+            interval '1 month'
+        )::date
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF login_history FOR VALUES FROM (%L) TO (%L)',
+            'login_history_' || to_char(month, '"y"YYYY"m"MM'), month, (month + interval '1 month')::date
+        );
+    END LOOP;
+END $$
+'''
+
+
+def upgrade() -> None:
+    # имена индексов общие для схемы: старая таблица освобождает их для новой
+    op.rename_table('login_history', 'login_history_unpartitioned')
+    op.execute('ALTER INDEX login_history_pkey RENAME TO login_history_unpartitioned_pkey')
+    op.execute('ALTER INDEX ix_login_history_user_id_time RENAME TO ix_login_history_unpartitioned_user_id_time')
+
+    # ключ секционирования входит в первичный ключ, уникальность одного id на секционированной таблице недоступна
+    op.create_table('login_history',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('time', sa.DateTime(), nullable=False),
+    sa.Column('browser', sa.String(length=255), nullable=False),
+    sa.Column('event_type', postgresql.ENUM('login', 'logout', 'refresh', name='eventenum', create_type=False),
+              nullable=True),
+    sa.Column('result', sa.Boolean(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id', 'time'),
+    postgresql_partition_by='RANGE (time)'
+    )
+    op.execute(CREATE_PARTITIONS)
+    op.execute('''
+        INSERT INTO login_history (id, user_id, time, browser, event_type, result)
+        SELECT id, user_id, coalesce(time, timezone('utc', now())), browser, event_type, result
+        FROM login_history_unpartitioned
+    ''')
+    # индекс строится после переноса строк: один проход по каждой секции
+    op.create_index(
+        'ix_login_history_user_id_time',
+        'login_history',
+        ['user_id', sa.text('time DESC'), sa.text('id DESC')],
+        postgresql_include=['browser', 'event_type', 'result'],
+    )
+    op.drop_table('login_history_unpartitioned')
+
+
+def downgrade() -> None:
+    op.rename_table('login_history', 'login_history_partitioned')
+    op.execute('ALTER INDEX login_history_pkey RENAME TO login_history_partitioned_pkey')
+    op.execute('ALTER INDEX ix_login_history_user_id_time RENAME TO ix_login_history_partitioned_user_id_time')
+    op.create_table('login_history',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('time', sa.DateTime(), nullable=True),
+    sa.Column('browser', sa.String(length=255), nullable=False),
+    sa.Column('event_type', postgresql.ENUM('login', 'logout', 'refresh', name='eventenum', create_type=False),
+              nullable=True),
+    sa.Column('result', sa.Boolean(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('id')
+    )
+    op.execute('''
+        INSERT INTO login_history (id, user_id, time, browser, event_type, result)
+        SELECT id, user_id, time, browser, event_type, result FROM login_history_partitioned
+    ''')
+    op.create_index(
+        'ix_login_history_user_id_time',
+        'login_history',
+        ['user_id', sa.text('time DESC'), sa.text('id DESC')],
+        postgresql_include=['browser', 'event_type', 'result'],
+    )
+    # секции удаляются вместе с родительской таблицей
+    op.drop_table('login_history_partitioned')
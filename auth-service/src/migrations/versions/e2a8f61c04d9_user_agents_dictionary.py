@@ -0,0 +1,131 @@
+"""user_agents dictionary for login_history
+
+Revision ID: e2a8f61c04d9
+Revises: b5e0c3f17a26
+Create Date: 2026-10-18 18:02:13.640512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a8f61c04d9'
+down_revision = 'b5e0c3f17a26'
+branch_labels = None
+depends_on = None
+
+# то же значение, что services.user_agents.user_agent_hash: первые 16 байт sha256 строки
+USER_AGENT_HASH = "substring(sha256(convert_to({}, 'UTF8')) FROM 1 FOR 16)"
+
+# секции старой таблицы переименовываются: их имена нужны секциям новой таблицы
+RENAME_PARTITIONS = '''
+DO $$
+DECLARE
+    child_name text;
+BEGIN
+    FOR child_name IN
+        SELECT child.relname FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = 'login_history'::regclass
+    LOOP
+        EXECUTE format('ALTER TABLE %I RENAME TO %I', child_name, child_name || '_old');
+    END LOOP;
+END $$
+'''
+
+# те же секции, что у старой таблицы: с первого месяца событий и на 3 месяца вперед
+CREATE_PARTITIONS = '''
+DO $$
+DECLARE
+    month date;
+BEGIN
+    FOR month IN
+        SELECT generate_series(
+            date_trunc('month', coalesce((SELECT min(time) FROM login_history_old), timezone('utc', now()))),
+            date_trunc('month', timezone('utc', now())) + interval '3 months',
+            interval '1 month'
+        )::date
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF login_history FOR VALUES FROM (%L) TO (%L)',
+            'login_history_' || to_char(month, '"y"YYYY"m"MM'), month, (month + interval '1 month')::date
+        );
+    END LOOP;
+END $$
+'''
+
+
+def recreate_login_history(user_agent_column: sa.Column, include: str, copy: str) -> None:
+    '''
+    Пересоздает секционированную login_history с другим столбцом User-Agent и переносит строки.
+    Таблица переписывается целиком, а не через UPDATE: новая таблица и индексы без мертвых строк.
+    '''
+    op.execute(RENAME_PARTITIONS)
+    op.rename_table('login_history', 'login_history_old')
+    op.execute('ALTER INDEX login_history_pkey RENAME TO login_history_old_pkey')
+    op.execute('ALTER INDEX ix_login_history_user_id_time RENAME TO ix_login_history_old_user_id_time')
+
+    op.create_table('login_history',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('time', sa.DateTime(), nullable=False),
+    user_agent_column,
+    sa.Column('event_type', postgresql.ENUM('login', 'logout', 'refresh', name='eventenum', create_type=False),
+              nullable=True),
+    sa.Column('result', sa.Boolean(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id', 'time'),
+    postgresql_partition_by='RANGE (time)'
+    )
+    op.execute(CREATE_PARTITIONS)
+    op.execute(copy)
+    op.create_index(
+        'ix_login_history_user_id_time',
+        'login_history',
+        ['user_id', sa.text('time DESC'), sa.text('id DESC')],
+        postgresql_include=[include, 'event_type', 'result'],
+    )
+    # секции удаляются вместе с родительской таблицей
+    op.drop_table('login_history_old')
+
+
+def upgrade() -> None:
+    op.create_table('user_agents',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('hash', sa.LargeBinary(length=16), nullable=False),
+    sa.Column('user_agent', sa.Text(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('hash')
+    )
+    op.execute(f'''
+        INSERT INTO user_agents (hash, user_agent)
+        SELECT {USER_AGENT_HASH.format('browser')}, browser FROM (SELECT DISTINCT browser FROM login_history) browsers
+    ''')
+    recreate_login_history(
+        sa.Column('user_agent_id', sa.Integer(), sa.ForeignKey('user_agents.id'), nullable=False),
+        'user_agent_id',
+        f'''
+            INSERT INTO login_history (id, user_id, time, user_agent_id, event_type, result)
+            SELECT history.id, history.user_id, history.time, user_agents.id, history.event_type, history.result
+            FROM login_history_old history
+            JOIN user_agents ON user_agents.hash = {USER_AGENT_HASH.format('history.browser')}
+        '''
+    )
+
+
+def downgrade() -> None:
+    # строки длиннее 255 символов, которые позволяет user_agents, обрезаются
+    recreate_login_history(
+        sa.Column('browser', sa.String(length=255), nullable=False),
+        'browser',
+        '''
+            INSERT INTO login_history (id, user_id, time, browser, event_type, result)
+            SELECT history.id, history.user_id, history.time, left(user_agents.user_agent, 255),
+                   history.event_type, history.result
+            FROM login_history_old history
+            JOIN user_agents ON user_agents.id = history.user_agent_id
+        '''
+    )
+    op.drop_table('user_agents')
@@ -1,11 +1,11 @@
 import uuid
 from datetime import datetime
 import enum
-from sqlalchemy import Boolean, Column, DateTime, String, Enum, ForeignKey, Integer
+from sqlalchemy import Boolean, Column, DateTime, String, Enum, ForeignKey, Index, Integer, LargeBinary, Text
 from sqlalchemy.dialects.postgresql import UUID
-from werkzeug.security import check_password_hash, generate_password_hash
 
 from db.postgres import Base
+from services.password_schemes import hash_password, verify_password
 
 
 class User(Base):
@@ -23,18 +23,21 @@ class User(Base):
 
     def __init__(
             self, login: str, password: str, first_name: str,
-            last_name: str, role_id: UUID, email: str, is_admin: bool = False
+            last_name: str, role_id: UUID, email: str, is_admin: bool = False, password_hash: str | None = None
     ) -> None:
+        '''
+        :param password_hash: (str | None) Готовый хеш пароля (services.hashing), иначе пароль хешируется здесь.
+        '''
         self.is_admin = is_admin
         self.login = login
-        self.password = generate_password_hash(password)
+        self.password = password_hash if password_hash is not None else hash_password(password)
         self.first_name = first_name
         self.last_name = last_name
         self.role_id = role_id
         self.email = email
 
     def check_password(self, password: str) -> bool:
-        return check_password_hash(self.password, password)
+        return verify_password(self.password, password)
 
     def __repr__(self) -> str:
         return f'<User {self.login}>'
@@ -59,6 +62,22 @@ class Role(Base):
         return f'<{self.name_role}:{self.lvl}>'
 
 
+class UserAgent(Base):
+    __tablename__ = 'user_agents'
+
+    id = Column(Integer(), primary_key=True)
+    # первые 16 байт sha256 строки: уникальный индекс по 16 байтам вместо индекса по строке
+    hash = Column(LargeBinary(16), unique=True, nullable=False)
+    user_agent = Column(Text(), nullable=False)
+
+    def __init__(self, hash: bytes, user_agent: str) -> None:
+        self.hash = hash
+        self.user_agent = user_agent
+
+    def __repr__(self) -> str:
+        return f'<UserAgent {self.id}>'
+
+
 class EventEnum(enum.Enum):
     login = "login"
     logout = "logout"
@@ -68,16 +87,38 @@ class EventEnum(enum.Enum):
 class History(Base):
     __tablename__ = 'login_history'
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, unique=True, nullable=False)
+    # таблица разбита на месячные секции по time (services.history_partitions), ключ секционирования входит в PK
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, nullable=False)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
-    time = Column(DateTime, default=datetime.utcnow)
-    browser = Column(String(255), nullable=False)
+    time = Column(DateTime, primary_key=True, default=datetime.utcnow, nullable=False)
+    # строка User-Agent хранится один раз в user_agents (services.user_agents)
+    user_agent_id = Column(Integer(), ForeignKey("user_agents.id"), nullable=False)
     event_type = Column(Enum(EventEnum))
     result = Column(Boolean, nullable=False)
 
-    def __init__(self, user_id: UUID, browser: str, event_type: enum, result: bool) -> None:
+    __table_args__ = (
+        # история пользователя по страницам (user_id, time, id) читается только из индекса
+        Index(
+            'ix_login_history_user_id_time', user_id, time.desc(), id.desc(),
+            postgresql_include=['user_agent_id', 'event_type', 'result']
+        ),
+        {'postgresql_partition_by': 'RANGE (time)'},
+    )
+
+    def __init__(
+            self, user_id: UUID, user_agent_id: int, event_type: enum, result: bool,
+            id: UUID | None = None, time: datetime | None = None
+    ) -> None:
+        '''
+        :param id: (UUID | None) id, созданный при отправке события (services.history_writer.history_row).
+        :param time: (datetime | None) Время события.
+        '''
+        if id is not None:
+            self.id = id
+        if time is not None:
+            self.time = time
         self.user_id = user_id
-        self.browser = browser
+        self.user_agent_id = user_agent_id
         self.event_type = event_type
         self.result = result
 
@@ -1,6 +1,9 @@
 from uuid import UUID
-from datetime import datetime
-from pydantic import BaseModel, Field
+from datetime import datetime, timezone
+from pydantic import BaseModel, Field, field_validator
+
+from core.config import app_settings
+from models.entity import EventEnum
 # import re
 
 
@@ -15,6 +18,54 @@ class HistoryUser(BaseModel):
     browser: str
     user_id: UUID
     result: bool
+    event_type: EventEnum | None = None
+
+
+class HistoryFilter(BaseModel):
+    event_type: EventEnum | None = None
+    result: bool | None = None
+    since: datetime | None = None
+    until: datetime | None = None
+
+    @field_validator('since', 'until')
+    @classmethod
+    def naive_utc(cls, value: datetime | None) -> datetime | None:
+        # login_history.time хранит UTC без часового пояса: asyncpg не сравнивает его со временем с поясом
+        if value is not None and value.tzinfo is not None:
+            return value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+
+class SessionInfo(BaseModel):
+    session_id: str
+    user_agent: str | None
+    issued_at: datetime
+    expires_at: datetime
+    current: bool
+
+
+class IntrospectToken(BaseModel):
+    token: str = Field(min_length=1)
+    user_agent: str | None = None
+
+
+class IntrospectRequest(BaseModel):
+    tokens: list[IntrospectToken] = Field(max_length=app_settings.introspect_batch_size)
+
+
+class IntrospectResult(BaseModel):
+    active: bool
+    claims: dict | None = None
+    error: str | None = None
+
+
+class ContentDecisionRequest(BaseModel):
+    years: list[int] = Field(max_length=app_settings.authz_batch_size)
+
+
+class ContentDecision(BaseModel):
+    year: int
+    allowed: bool
 
 
 class UserCreate(BaseModel):
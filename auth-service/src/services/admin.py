@@ -3,6 +3,7 @@ import uuid
 from schemas.entity import RoleCreate
 from models.entity import User, Role
 from services.repository import BaseRepository
+from services.role_snapshot import role_snapshot
 from core.config import ErrorName
 
 
@@ -27,6 +28,7 @@ class BaseAdmin(BaseRepository):
             "max_year": data.max_year
         }
         await self.create_obj(Role, new_role)
+        await role_snapshot.reload()
         return new_role
 
     async def update_role(self, role_id: uuid.UUID, new_data: RoleCreate):
@@ -37,6 +39,7 @@ class BaseAdmin(BaseRepository):
                 if value:
                     setattr(role_obj, attr, value)
             await self.manager_auth.session.commit()
+            await role_snapshot.reload()
             return RoleCreate(**vars(role_obj))
         else:
             return ErrorName.RoleDoesNotExist
@@ -47,6 +50,8 @@ class BaseAdmin(BaseRepository):
         if role_obj and user_obj:
             user_obj.role_id = role_id
             await self.manager_auth.session.commit()
+            # пользователь входит заново и получает токены с новой ролью
+            await self.manager_auth._bump_generation(str(user_id))
         elif user_obj and not role_obj:
             return ErrorName.RoleDoesNotExist
         elif role_obj and not user_obj:
@@ -56,3 +61,4 @@ class BaseAdmin(BaseRepository):
 
     async def delete_role(self, role_id: uuid.UUID):
         await self.delete_obj(Role, role_id)
+        await role_snapshot.reload()
@@ -1,5 +1,82 @@
+from base64 import urlsafe_b64encode
+from hashlib import blake2b
+from hmac import compare_digest
+
+import jwt
 from async_fastapi_jwt_auth import AuthJWT
+from async_fastapi_jwt_auth.exceptions import InvalidHeaderError, JWTDecodeError
+
 from core.config import app_settings
+from services import signing_keys
+
+# claim с отпечатком User-Agent, старые токены содержат строку User-Agent в claim user_agent
+USER_AGENT_CLAIM = 'uaf'
+_user_agent_key = app_settings.user_agent_key.encode()[:64]
+
+
+def user_agent_fingerprint(user_agent: str | None) -> str:
+    '''
+    Ключевой хеш User-Agent для claims токенов: 16 символов вместо строки в 150-300 байт.
+    '''
+    digest = blake2b((user_agent or '').encode(), digest_size=12, key=_user_agent_key).digest()
+    return urlsafe_b64encode(digest).decode()
+
+
+def check_user_agent(claims: dict, user_agent: str | None) -> bool:
+    '''
+    Проверяет, что токен выпущен для этого User-Agent.
+    '''
+    fingerprint = claims.get(USER_AGENT_CLAIM)
+    if fingerprint is not None:
+        return compare_digest(fingerprint, user_agent_fingerprint(user_agent))
+    return app_settings.user_agent_legacy_claims and claims.get('user_agent') == user_agent
+
+
+class KeyRingAuthJWT(AuthJWT):
+    '''
+    AuthJWT с подписью активным ключом связки (services.signing_keys) и заголовком kid.
+    Токены проверяются ключом из их kid, токены без kid - SECRET_KEY, пока это разрешено.
+    '''
+
+    async def _create_token(self, *args, algorithm: str | None = None, headers: dict | None = None, **kwargs) -> str:
+        key = signing_keys.key_ring.active
+        if key is not None:
+            algorithm = key.algorithm
+            headers = {**(headers or {}), 'kid': key.kid}
+        return await super()._create_token(*args, algorithm=algorithm, headers=headers, **kwargs)
+
+    async def _get_secret_key(self, algorithm: str, process: str):
+        key = signing_keys.key_ring.active
+        if process == 'encode' and key is not None and algorithm == key.algorithm:
+            return key.private_key
+        return await super()._get_secret_key(algorithm, process)
+
+    async def _verified_token(self, encoded_token: str, issuer: str | None = None) -> dict:
+        try:
+            headers = await self.get_unverified_jwt_headers(encoded_token)
+        except Exception as err:
+            raise InvalidHeaderError(status_code=422, message=str(err))
+        kid = headers.get('kid')
+        if kid is None:
+            if signing_keys.key_ring.active is not None and not app_settings.jwt_accept_secret_key:
+                raise JWTDecodeError(status_code=422, message='Token is not signed with a signing key')
+            if headers.get('alg') != self._algorithm:
+                raise JWTDecodeError(status_code=422, message='The specified alg value is not allowed')
+            return await super()._verified_token(encoded_token, issuer)
+        key = signing_keys.key_ring.get(kid)
+        if key is None:
+            raise JWTDecodeError(status_code=422, message='Unknown signing key')
+        try:
+            return jwt.decode(
+                encoded_token,
+                key.public_key,
+                issuer=issuer,
+                audience=self._decode_audience,
+                leeway=self._decode_leeway,
+                algorithms=[key.algorithm],
+            )
+        except Exception as err:
+            raise JWTDecodeError(status_code=422, message=str(err))
 
 
 class BaseAuthJWT:
@@ -11,9 +88,12 @@ class BaseAuthJWT:
             self,
             sub: str,
             user_claims: dict,
+            generation: int = 0,
             expires_time_access: int = app_settings.authjwt_time_access,
             expires_time_refresh: int = app_settings.authjwt_time_refresh
     ) -> tuple[str]:
+        # поколение токенов пользователя (services.redis_cache.CacheRedis._get_generation)
+        user_claims['gen'] = generation
         access_token = await self.auth.create_access_token(
             subject=sub, expires_time=expires_time_access, user_claims=user_claims
         )
@@ -31,6 +111,12 @@ class BaseAuthJWT:
         user_data = await self.auth.get_raw_jwt()
         return user_data
 
+    async def decode_token(self, token: str) -> dict:
+        '''
+        Проверяет подпись и срок действия переданного токена.
+        '''
+        return await self.auth.get_raw_jwt(token)
+
     async def check_refresh_token(self) -> dict:
         await self.auth.jwt_refresh_token_required()
         user_data = await self.auth.get_raw_jwt()
@@ -0,0 +1,32 @@
+from uuid import UUID
+
+from schemas.entity import ContentDecision
+from services.role_snapshot import role_snapshot
+
+
+def role_claims(role_id: UUID | str | None) -> dict:
+    '''
+    Claims роли для токенов: id роли и ее lvl, max_year из копии таблицы ролей.
+    '''
+    if role_id is None:
+        return {}
+    claims = {'role': str(role_id)}
+    role = role_snapshot.get(str(role_id))
+    if role is not None:
+        claims['lvl'] = role.lvl
+        claims['max_year'] = role.max_year
+    return claims
+
+
+def content_decisions(claims: dict, years: list[int]) -> list[ContentDecision]:
+    """
+    Решает, можно ли пользователю смотреть контент указанных лет, по claims токена без запросов в БД.
+    Параметры роли берутся из копии таблицы ролей (изменения ролей действуют сразу),
+    если роли там нет - из claims токена.
+
+    :param claims: (dict) Claims проверенного access токена.
+    :param years: (list[int]) Годы выпуска контента.
+    """
+    role = role_snapshot.get(claims.get('role'))
+    max_year = role.max_year if role is not None else claims.get('max_year')
+    return [ContentDecision(year=year, allowed=max_year is not None and year <= max_year) for year in years]
@@ -0,0 +1,35 @@
+from collections import OrderedDict
+from time import monotonic
+
+from core.config import app_settings
+from core.metrics import metrics
+
+
+class GenerationCache:
+    '''
+    In-process TTL/LRU кеш поколений токенов пользователей (user_id -> generation).
+    Воркер, увеличивший поколение, обновляет свою запись сразу, остальные узнают о нем не позже чем через ttl.
+    '''
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: OrderedDict[str, tuple[float, int]] = OrderedDict()
+
+    def get(self, user_id: str) -> int | None:
+        entry = self.entries.get(user_id)
+        if entry is None or entry[0] <= monotonic():
+            metrics.inc('generation_cache_misses_total')
+            return None
+        self.entries.move_to_end(user_id)
+        metrics.inc('generation_cache_hits_total')
+        return entry[1]
+
+    def put(self, user_id: str, generation: int) -> None:
+        self.entries[user_id] = (monotonic() + self.ttl, generation)
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
+generation_cache = GenerationCache(max_size=app_settings.generation_cache_size, ttl=app_settings.generation_cache_ttl)
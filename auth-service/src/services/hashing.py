@@ -0,0 +1,82 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from os import getpid
+from time import monotonic, perf_counter
+from typing import Any, Callable
+
+from core.config import app_settings
+from core.metrics import metrics
+from services.password_schemes import hash_password, password_schemes, verify_password
+
+
+class HashingBusy(Exception):
+    '''
+    Все процессы хеширования заняты и очередь ожидания заполнена.
+    '''
+
+
+def _timed(func: Callable, *args) -> tuple[Any, float]:
+    # выполняется в процессе пула: возвращает результат и чистое время хеширования
+    start = perf_counter()
+    result = func(*args)
+    return result, perf_counter() - start
+
+
+class PasswordHasher:
+    '''
+    Хеширование и проверка паролей в пуле процессов, чтобы хеширование не блокировало цикл событий.
+    Одновременно принимается не больше workers + queue_size запросов, остальные отклоняются HashingBusy.
+    До start() хеширование выполняется в вызывающем потоке (cli, тесты).
+    '''
+
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.executor: ProcessPoolExecutor | None = None
+        self.pending = 0
+
+    async def start(self) -> None:
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        # процессы создаются при первой задаче: создаем их до приема запросов
+        await asyncio.get_running_loop().run_in_executor(self.executor, getpid)
+
+    def stop(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    async def _run(self, func: Callable, *args) -> Any:
+        if self.executor is None:
+            return func(*args)
+        if self.pending >= self.workers + self.queue_size:
+            metrics.inc('password_hash_rejected_total')
+            raise HashingBusy
+        self.pending += 1
+        metrics.set_gauge('password_hash_pending', self.pending)
+        submitted_at = monotonic()
+        try:
+            result, hash_time = await asyncio.get_running_loop().run_in_executor(self.executor, _timed, func, *args)
+        finally:
+            self.pending -= 1
+            metrics.set_gauge('password_hash_pending', self.pending)
+        metrics.observe('password_hash_seconds', hash_time)
+        metrics.observe('password_hash_queue_wait_seconds', max(monotonic() - submitted_at - hash_time, 0))
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, password_hash: str, password: str) -> bool:
+        return await self._run(verify_password, password_hash, password)
+
+    @staticmethod
+    def needs_rehash(password_hash: str) -> bool:
+        # разбирает только заголовок хеша, пул не нужен
+        return password_schemes.needs_rehash(password_hash)
+
+
+password_hasher = PasswordHasher(workers=app_settings.hash_workers, queue_size=app_settings.hash_queue_size)
+
+
+async def get_password_hasher() -> PasswordHasher:
+    return password_hasher
@@ -1,31 +1,138 @@
+import asyncio
+import base64
 import uuid
+from datetime import datetime
+from typing import AsyncIterator
 
-from schemas.entity import FieldFilter, HistoryUser
-from models.entity import History as HistoryDB
+import orjson
+from sqlalchemy import Select, select, text, tuple_
+from sqlalchemy.exc import SQLAlchemyError
+
+from core.config import app_settings
+from core.deadline import DeadlineExceeded, remaining_budget, set_deadline
+from core.metrics import metrics
+from schemas.entity import HistoryFilter, HistoryUser
+from models.entity import History as HistoryDB, UserAgent
+from services.history_spool import history_spool
+from services.history_writer import history_row, history_writer
 from services.repository import BaseRepository
+from services.user_agents import with_user_agent_ids
+
+HISTORY_COLUMNS = (
+    HistoryDB.id, HistoryDB.time, UserAgent.user_agent.label('browser'), HistoryDB.user_id, HistoryDB.result,
+    HistoryDB.event_type
+)
+
+
+def encode_cursor(time: datetime, history_id: uuid.UUID) -> str:
+    '''
+    Курсор страницы истории: время и id последней строки страницы.
+    '''
+    return base64.urlsafe_b64encode(f'{time.isoformat()}|{history_id}'.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    '''
+    Выбрасывает ValueError, если курсор поврежден.
+    '''
+    time, history_id = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode().split('|')
+    return datetime.fromisoformat(time), uuid.UUID(history_id)
 
 
 class BaseHistory(BaseRepository):
     async def write_entry_history(self, user_id: uuid.UUID, user_agent: str, event_type: str, result: bool):
-        await self.create_obj(
-            model=HistoryDB,
-            data={
-                'user_id': user_id,
-                'browser': user_agent,
-                'event_type': event_type,
-                'result': result
-            }
+        row = history_row(user_id, user_agent, event_type, result)
+        # запись уходит в фоновую очередь, без нее (cli) - сразу в БД
+        if history_writer.submit(row):
+            return
+        try:
+            await asyncio.wait_for(self._write_row(row), app_settings.history_write_timeout)
+        except (SQLAlchemyError, OSError, asyncio.TimeoutError, DeadlineExceeded):
+            # токены уже выданы: недоступность БД не должна ломать вход
+            metrics.inc('history_write_errors_total')
+            await history_spool.save([row])
+
+    async def _write_row(self, row: dict) -> None:
+        rows = await with_user_agent_ids(self.session, [row])
+        await self.create_obj(model=HistoryDB, data=rows[0])
+
+    @staticmethod
+    def _history_query(
+            user_id: uuid.UUID, history_filter: HistoryFilter, cursor: tuple[datetime, uuid.UUID] | None
+    ) -> Select:
+        """
+        Строки истории пользователя от новых к старым. Порядок совпадает с индексом
+        ix_login_history_user_id_time (user_id, time DESC, id DESC), страница после курсора
+        начинается с позиции в индексе, без OFFSET. Сортировка по ключу секционирования позволяет читать
+        секции от новых к старым и остановиться, когда набрана страница.
+        """
+        # строки User-Agent подставляются соединением с user_agents в том же запросе
+        query = (
+            select(*HISTORY_COLUMNS)
+            .join(UserAgent, UserAgent.id == HistoryDB.user_agent_id)
+            .where(HistoryDB.user_id == user_id)
         )
+        if history_filter.event_type is not None:
+            query = query.where(HistoryDB.event_type == history_filter.event_type)
+        if history_filter.result is not None:
+            query = query.where(HistoryDB.result == history_filter.result)
+        if history_filter.since is not None:
+            query = query.where(HistoryDB.time >= history_filter.since)
+        if history_filter.until is not None:
+            query = query.where(HistoryDB.time < history_filter.until)
+        if cursor is not None:
+            # отдельное условие на time отсекает секции новее курсора
+            query = query.where(HistoryDB.time <= cursor[0], tuple_(HistoryDB.time, HistoryDB.id) < tuple_(*cursor))
+        return query.order_by(HistoryDB.time.desc(), HistoryDB.id.desc())
+
+    async def get_history(
+            self, user_id: uuid.UUID, history_filter: HistoryFilter,
+            cursor: tuple[datetime, uuid.UUID] | None, limit: int
+    ) -> tuple[list[HistoryUser], str | None]:
+        """
+        :param cursor: (tuple | None) Позиция, после которой начинается страница (decode_cursor).
+        :param limit: (int) Размер страницы.
+        :return:
+        tuple: Страница истории и курсор следующей страницы, None - страница последняя.
+        """
+        rows = await self._with_deadline(self.session.execute, self._history_query(user_id, history_filter, cursor)
+                                         .limit(limit + 1))
+        page = [HistoryUser(**row._asdict()) for row in rows]
+        if len(page) <= limit:
+            return page, None
+        page.pop()
+        return page, encode_cursor(page[-1].time, page[-1].id)
 
-    async def get_history(self, user_id: uuid.UUID):
-        data_filter = [
-            {
-                'model': HistoryDB,
-                'fields': [
-                    FieldFilter(attr_name='user_id', attr_value=str(user_id))
-                ]
-            },
-        ]
-        list_obj = await self.get_list_obj_by_list_attr_name_operator_or(data_filter)
-        result = [HistoryUser.parse_obj(obj.__dict__) for obj in list_obj]
-        return result
+    async def stream_history(
+            self, user_id: uuid.UUID, history_filter: HistoryFilter,
+            cursor: tuple[datetime, uuid.UUID] | None, limit: int | None = None
+    ) -> AsyncIterator[bytes]:
+        """
+        История в формате NDJSON. Строки читаются серверным курсором по history_stream_chunk,
+        память не зависит от размера истории. Выгрузка ограничена history_stream_timeout, а не бюджетом запроса.
+        Если выгрузка прервана (бюджет исчерпан, ошибка БД), последней строкой отдается
+        {"error": ..., "after": курсор}: статус ответа уже отправлен, с курсора выгрузку можно продолжить.
+        """
+        # бюджет запроса заменяется бюджетом выгрузки, в том числе statement_timeout уже начатой транзакции
+        set_deadline(app_settings.history_stream_timeout)
+        query = self._history_query(user_id, history_filter, cursor)
+        if limit is not None:
+            query = query.limit(limit)
+        last = cursor
+        try:
+            await self._with_deadline(self.session.execute, text(
+                f'SET LOCAL statement_timeout = {max(int(app_settings.history_stream_timeout * 1000), 1)}'
+            ))
+            rows = await self._with_deadline(
+                self.session.stream, query.execution_options(yield_per=app_settings.history_stream_chunk)
+            )
+            async for partition in rows.partitions():
+                yield b''.join(orjson.dumps(row._asdict()) + b'\n' for row in partition)
+                last = (partition[-1].time, partition[-1].id)
+                remaining_budget()
+        except (SQLAlchemyError, OSError, asyncio.TimeoutError, DeadlineExceeded) as exc:
+            metrics.inc('history_stream_errors_total')
+            yield orjson.dumps({
+                'error': 'timeout' if isinstance(exc, DeadlineExceeded) else 'database',
+                'after': encode_cursor(*last) if last is not None else None,
+            }) + b'\n'
@@ -0,0 +1,159 @@
+import asyncio
+import re
+from datetime import date, datetime
+from typing import Callable
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import app_settings
+from core.metrics import metrics
+
+HISTORY_TABLE = 'login_history'
+# секция на календарный месяц: login_history_y2023m08 хранит события с 2023-08-01 до 2023-09-01
+PARTITION_NAME = HISTORY_TABLE + '_y{:04d}m{:02d}'
+PARTITION_PATTERN = re.compile(HISTORY_TABLE + r'_y(\d{4})m(\d{2})$')
+# ключ pg_advisory_xact_lock: секции меняет один воркер за раз
+PARTITIONS_LOCK = 0x6c68_7061
+# DDL секций берет ACCESS EXCLUSIVE на login_history: не ждем долгих чтений, чтобы не задерживать запись истории
+PARTITIONS_LOCK_TIMEOUT = '1s'
+
+LIST_PARTITIONS = text('''
+    SELECT child.relname FROM pg_inherits
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE pg_inherits.inhparent = CAST(:table AS regclass)
+''')
+
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    year, month_index = divmod(month.year * 12 + month.month - 1 + months, 12)
+    return date(year, month_index + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return PARTITION_NAME.format(month.year, month.month)
+
+
+async def list_partitions(session: AsyncSession) -> dict[date, str]:
+    '''
+    :return:
+    dict: Месячные секции login_history: первое число месяца -> имя секции.
+    '''
+    rows = await session.execute(LIST_PARTITIONS, {'table': HISTORY_TABLE})
+    partitions = {}
+    for name, in rows:
+        match = PARTITION_PATTERN.match(name)
+        if match:
+            partitions[date(int(match[1]), int(match[2]), 1)] = name
+    return partitions
+
+
+async def _lock_partitions(session: AsyncSession) -> None:
+    await session.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': PARTITIONS_LOCK})
+    await session.execute(text(f"SET LOCAL lock_timeout = '{PARTITIONS_LOCK_TIMEOUT}'"))
+
+
+async def create_partitions(session: AsyncSession, months_ahead: int, today: date | None = None) -> list[str]:
+    '''
+    Создает секции текущего месяца и months_ahead следующих, если их еще нет.
+
+    :return:
+    list: Имена созданных секций.
+    '''
+    current = month_start(today or datetime.utcnow().date())
+    months = [add_months(current, offset) for offset in range(months_ahead + 1)]
+    if set(months) <= (await list_partitions(session)).keys():
+        return []
+    await _lock_partitions(session)
+    existing = await list_partitions(session)
+    created = []
+    for month in months:
+        if month in existing:
+            continue
+        name = partition_name(month)
+        await session.execute(text(
+            f"CREATE TABLE {name} PARTITION OF {HISTORY_TABLE} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+        ))
+        created.append(name)
+    await session.commit()
+    return created
+
+
+async def drop_partitions(
+        session: AsyncSession, keep_months: int, detach: bool = False, dry_run: bool = False,
+        today: date | None = None
+) -> list[str]:
+    '''
+    Удаляет секции, все события которых старше keep_months месяцев. Секция удаляется целиком,
+    без построчного DELETE: таблица и индексы не раздуваются, VACUUM после удаления не нужен.
+
+    :param keep_months: (int) Сколько полных месяцев истории хранить кроме текущего.
+    :param detach: (bool) Только отсоединить секции от login_history (например, для выгрузки в архив).
+    :param dry_run: (bool) Только вернуть секции, которые были бы удалены.
+    :return:
+    list: Имена удаленных (отсоединенных) секций.
+    '''
+    cutoff = add_months(month_start(today or datetime.utcnow().date()), -keep_months)
+    expired = [name for month, name in sorted((await list_partitions(session)).items()) if month < cutoff]
+    if dry_run or not expired:
+        return expired
+    await _lock_partitions(session)
+    for name in expired:
+        await session.execute(text(f'ALTER TABLE {HISTORY_TABLE} DETACH PARTITION {name}'))
+        if not detach:
+            await session.execute(text(f'DROP TABLE {name}'))
+    await session.commit()
+    return expired
+
+
+class HistoryPartitions:
+    '''
+    Поддерживает секции login_history на months_ahead месяцев вперед: проверяет их при старте
+    и раз в check_interval секунд. Запас в несколько месяцев покрывает периоды, когда DDL не удается выполнить.
+    '''
+
+    def __init__(self, months_ahead: int, check_interval: float):
+        self.months_ahead = months_ahead
+        self.check_interval = check_interval
+        self.session_factory: Callable[[], AsyncSession] | None = None
+        self.task: asyncio.Task | None = None
+
+    async def start(self, session_factory: Callable[[], AsyncSession]) -> None:
+        self.session_factory = session_factory
+        await self._ensure()
+        self.task = asyncio.create_task(self._ensure_periodically())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def ensure(self) -> list[str]:
+        async with self.session_factory() as session:
+            created = await create_partitions(session, self.months_ahead)
+        metrics.inc('history_partitions_created_total', len(created))
+        return created
+
+    async def _ensure(self) -> None:
+        try:
+            await self.ensure()
+        except (SQLAlchemyError, OSError):
+            metrics.inc('history_partitions_errors_total')
+
+    async def _ensure_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await self._ensure()
+
+
+history_partitions = HistoryPartitions(
+    months_ahead=app_settings.history_partitions_ahead,
+    check_interval=app_settings.history_partitions_check_interval,
+)
@@ -0,0 +1,256 @@
+import asyncio
+import fcntl
+import logging
+import os
+import struct
+import uuid
+import zlib
+from datetime import datetime
+from glob import glob
+from typing import Callable
+
+import orjson
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import app_settings
+from core.metrics import metrics
+from models.entity import EventEnum, History
+from services.user_agents import with_user_agent_ids
+
+logger = logging.getLogger(__name__)
+
+SPOOL_FILE = 'history.spool'
+REPLAYING_SUFFIX = '.replaying'
+# события, которые БД отклоняет (например, пользователь удален): сохраняются для разбора, перенос продолжается
+DEAD_FILE = SPOOL_FILE + '.dead'
+# заголовок записи: длина и crc32 тела
+RECORD_HEADER = struct.Struct('>II')
+
+
+def encode_record(row: dict) -> bytes:
+    payload = orjson.dumps(row)
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def decode_row(payload: bytes) -> dict:
+    row = orjson.loads(payload)
+    row['id'] = uuid.UUID(row['id'])
+    row['user_id'] = uuid.UUID(row['user_id'])
+    row['time'] = datetime.fromisoformat(row['time'])
+    row['event_type'] = EventEnum(row['event_type'])
+    return row
+
+
+def read_records(path: str) -> tuple[list[dict], int]:
+    '''
+    Читает записи файла. Записи с неверной контрольной суммой пропускаются,
+    недописанная запись в конце файла (сбой во время записи) отбрасывается.
+
+    :return:
+    tuple: Строки истории и число отброшенных записей.
+    '''
+    with open(path, 'rb') as file:
+        data = file.read()
+    rows, skipped, offset = [], 0, 0
+    while offset + RECORD_HEADER.size <= len(data):
+        length, checksum = RECORD_HEADER.unpack_from(data, offset)
+        payload = data[offset + RECORD_HEADER.size:offset + RECORD_HEADER.size + length]
+        if len(payload) < length:
+            break
+        offset += RECORD_HEADER.size + length
+        if zlib.crc32(payload) != checksum:
+            skipped += 1
+            continue
+        rows.append(decode_row(payload))
+    if offset < len(data):
+        skipped += 1
+    return rows, skipped
+
+
+class HistorySpool:
+    '''
+    Локальный файл для событий истории, которые не удалось записать в БД. Файл общий для воркеров:
+    запись дописывается в конец под flock. Фоновая задача переносит накопленные события в login_history,
+    когда БД снова доступна. id и время событий создаются при отправке, поэтому повторный перенос не дублирует строки.
+    '''
+
+    def __init__(self, directory: str, replay_interval: float, batch_size: int):
+        self.directory = directory
+        self.replay_interval = replay_interval
+        self.batch_size = batch_size
+        self.session_factory: Callable[[], AsyncSession] | None = None
+        self.task: asyncio.Task | None = None
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, SPOOL_FILE)
+
+    @property
+    def dead_path(self) -> str:
+        return os.path.join(self.directory, DEAD_FILE)
+
+    async def start(self, session_factory: Callable[[], AsyncSession]) -> None:
+        self.session_factory = session_factory
+        self.task = asyncio.create_task(self._replay_periodically())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def append(self, rows: list[dict]) -> None:
+        data = b''.join(encode_record(row) for row in rows)
+        os.makedirs(self.directory, exist_ok=True)
+        while True:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                # пока ждали блокировку, файл могли забрать на перенос в БД: пишем в новый
+                try:
+                    same_file = os.stat(self.path).st_ino == os.fstat(fd).st_ino
+                except FileNotFoundError:
+                    same_file = False
+                if same_file:
+                    os.write(fd, data)
+                    break
+            finally:
+                os.close(fd)
+        metrics.inc('history_spooled_rows_total', len(rows))
+
+    def append_or_drop(self, rows: list[dict]) -> bool:
+        '''
+        append, который не пробрасывает ошибку записи (диск заполнен, каталог недоступен): событие истории
+        не должно ломать вход. Потерянные строки учитываются в history_spool_dropped_rows_total.
+
+        :return:
+        bool: False - строки не записаны.
+        '''
+        try:
+            self.append(rows)
+        except OSError as exc:
+            metrics.inc('history_spool_dropped_rows_total', len(rows))
+            logger.error('history spool %s is not writable, %d rows dropped: %s', self.path, len(rows), exc)
+            return False
+        return True
+
+    async def save(self, rows: list[dict]) -> bool:
+        '''
+        append_or_drop в потоке: flock и запись в файл не блокируют цикл событий.
+        '''
+        return await asyncio.to_thread(self.append_or_drop, rows)
+
+    def claim(self) -> list[str]:
+        '''
+        Переименовывает текущий файл для переноса, новые события пишутся в новый файл.
+
+        :return:
+        list: Файлы, ожидающие переноса, включая не перенесенные ранее.
+        '''
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except FileNotFoundError:
+            pass
+        else:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                if os.fstat(fd).st_size:
+                    os.rename(self.path, f'{self.path}.{uuid.uuid4().hex}{REPLAYING_SUFFIX}')
+            finally:
+                os.close(fd)
+        return sorted(glob(os.path.join(self.directory, f'{SPOOL_FILE}.*{REPLAYING_SUFFIX}')))
+
+    async def replay(self) -> int:
+        '''
+        Переносит события из файлов в login_history. Файл удаляется после переноса всех его событий,
+        при недоступности БД остается до следующей попытки. События, которые БД отклоняет,
+        переносятся в DEAD_FILE и не задерживают остальные.
+
+        :return:
+        int: Число перенесенных событий.
+        '''
+        replayed = 0
+        for path in await asyncio.to_thread(self.claim):
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+            try:
+                try:
+                    # файл уже переносит другой воркер
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                rows, skipped = await asyncio.to_thread(read_records, path)
+                metrics.inc('history_spool_corrupt_records_total', skipped)
+                rejected = []
+                for start in range(0, len(rows), self.batch_size):
+                    rejected += await self._insert(rows[start:start + self.batch_size])
+                if rejected:
+                    await asyncio.to_thread(self.bury, rejected)
+                os.unlink(path)
+                replayed += len(rows) - len(rejected)
+            finally:
+                os.close(fd)
+        metrics.inc('history_replayed_rows_total', replayed)
+        return replayed
+
+    async def _insert(self, rows: list[dict]) -> list[dict]:
+        '''
+        Записывает пакет. Если БД отклоняет пакет, строки записываются по одной, чтобы найти отклоненные.
+        Ошибки соединения пробрасываются: файл переносится позже целиком.
+
+        :return:
+        list: Строки, которые БД отклонила.
+        '''
+        try:
+            async with self.session_factory() as session:
+                await session.execute(
+                    insert(History.__table__).on_conflict_do_nothing(index_elements=['id', 'time']),
+                    await with_user_agent_ids(session, rows)
+                )
+                await session.commit()
+        except (OperationalError, InterfaceError):
+            raise
+        except DBAPIError as error:
+            if error.connection_invalidated:
+                raise
+            if len(rows) == 1:
+                return rows
+        else:
+            return []
+        rejected = []
+        for row in rows:
+            rejected += await self._insert([row])
+        return rejected
+
+    def bury(self, rows: list[dict]) -> None:
+        '''
+        Дописывает отклоненные БД события в DEAD_FILE в формате файла переноса (читается read_records).
+        Если файл удалось перенести только со второй попытки, события в DEAD_FILE могут повторяться.
+        '''
+        fd = os.open(self.dead_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            os.write(fd, b''.join(encode_record(row) for row in rows))
+        finally:
+            os.close(fd)
+        metrics.inc('history_spool_dead_rows_total', len(rows))
+
+    async def _replay_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.replay_interval)
+            try:
+                await self.replay()
+            except Exception:
+                # любая ошибка переноса оставляет файлы до следующей попытки, задача продолжает работу
+                metrics.inc('history_replay_errors_total')
+
+
+history_spool = HistorySpool(
+    directory=app_settings.history_spool_dir,
+    replay_interval=app_settings.history_spool_replay_interval,
+    batch_size=app_settings.history_batch_size,
+)
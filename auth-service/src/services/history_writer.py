@@ -0,0 +1,150 @@
+import asyncio
+import uuid
+from datetime import datetime
+from time import monotonic, perf_counter
+from typing import Callable
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import app_settings
+from core.metrics import metrics
+from models.entity import History
+from services.history_spool import history_spool
+from services.user_agents import with_user_agent_ids
+
+
+def history_row(user_id: uuid.UUID | str, user_agent: str | None, event_type, result: bool) -> dict:
+    '''
+    Строка login_history. id и время создаются при отправке события: повторная запись той же строки не дублирует ее.
+    Запрос без заголовка User-Agent записывается с пустой строкой.
+    '''
+    return {
+        'id': uuid.uuid4(),
+        'user_id': uuid.UUID(user_id) if isinstance(user_id, str) else user_id,
+        'time': datetime.utcnow(),
+        'browser': user_agent or '',
+        'event_type': event_type,
+        'result': result,
+    }
+
+
+# сигнал остановки в очереди: записи до него сохраняются, после него не принимаются
+_STOP = object()
+
+
+class HistoryWriter:
+    '''
+    Фоновая запись истории входов воркера: события копятся в ограниченной очереди и сохраняются
+    одним многострочным INSERT, когда набралось batch_size событий или прошло flush_interval секунд.
+    Если БД недоступна или не отвечает за flush_timeout, события откладываются в файл (services.history_spool).
+    До start() submit возвращает False, и запись выполняет вызывающий.
+    '''
+
+    def __init__(self, batch_size: int, flush_interval: float, queue_size: int, flush_timeout: float = 2):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.flush_timeout = flush_timeout
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.session_factory: Callable[[], AsyncSession] | None = None
+        self.task: asyncio.Task | None = None
+        # записи в файл событий, не поместившихся в очередь
+        self.spooling: set[asyncio.Task] = set()
+
+    async def start(self, session_factory: Callable[[], AsyncSession]) -> None:
+        self.session_factory = session_factory
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10) -> None:
+        '''
+        Сохраняет накопленные события и останавливает запись.
+        '''
+        if self.task is None:
+            return
+        task, self.task = self.task, None
+        await self.queue.put(_STOP)
+        try:
+            await asyncio.wait_for(task, timeout)
+        except asyncio.TimeoutError:
+            # БД не принимает записи: остаток очереди откладывается в файл
+            rows = [self.queue.get_nowait() for _ in range(self.queue.qsize())]
+            history_spool.append_or_drop([row for row in rows if row is not _STOP])
+        await asyncio.gather(*self.spooling)
+
+    def submit(self, row: dict) -> bool:
+        """
+        :param row: (dict) Строка login_history (history_row).
+        :return:
+        bool: False - фоновая запись не запущена, строку записывает вызывающий.
+        """
+        if self.task is None:
+            return False
+        try:
+            self.queue.put_nowait(row)
+        except asyncio.QueueFull:
+            # БД не успевает за потоком событий: событие откладывается в файл в потоке, вход не ждет ни БД, ни диск
+            metrics.inc('history_queue_full_total')
+            task = asyncio.create_task(history_spool.save([row]))
+            self.spooling.add(task)
+            task.add_done_callback(self.spooling.discard)
+            return True
+        metrics.set_gauge('history_queue_depth', self.queue.qsize())
+        return True
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch = []
+            item = await self.queue.get()
+            deadline = monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                if self.queue.empty():
+                    try:
+                        item = await asyncio.wait_for(self.queue.get(), max(deadline - monotonic(), 0))
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = self.queue.get_nowait()
+            if batch:
+                try:
+                    await self._flush(batch)
+                except Exception:
+                    # неожиданная ошибка при откладывании строк в файл: пакет теряется, запись продолжается
+                    metrics.inc('history_rows_lost_total', len(batch))
+
+    async def _flush(self, rows: list[dict]) -> None:
+        started = perf_counter()
+        try:
+            await asyncio.wait_for(self._insert(rows), self.flush_timeout)
+        except Exception:
+            # строки могли успеть записаться: при переносе из файла повторы по id пропускаются.
+            # Неожиданная ошибка тоже не останавливает запись: строки остаются в файле до переноса
+            metrics.inc('history_flush_errors_total')
+            await history_spool.save(rows)
+            return
+        except asyncio.CancelledError:
+            history_spool.append_or_drop(rows)
+            raise
+        finally:
+            metrics.set_gauge('history_queue_depth', self.queue.qsize())
+        metrics.observe('history_flush_seconds', perf_counter() - started)
+        metrics.inc('history_rows_written_total', len(rows))
+
+    async def _insert(self, rows: list[dict]) -> None:
+        async with self.session_factory() as session:
+            await session.execute(insert(History.__table__), await with_user_agent_ids(session, rows))
+            await session.commit()
+
+
+history_writer = HistoryWriter(
+    batch_size=app_settings.history_batch_size,
+    flush_interval=app_settings.history_flush_interval,
+    queue_size=app_settings.history_queue_size,
+    flush_timeout=app_settings.history_flush_timeout,
+)
@@ -0,0 +1,144 @@
+from abc import ABC, abstractmethod
+from statistics import median
+from time import perf_counter
+
+from argon2 import PasswordHasher as Argon2Hasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from core.config import app_settings
+
+
+class PasswordScheme(ABC):
+    '''
+    Алгоритм хеширования паролей: по хешу определяется, каким алгоритмом и с какими параметрами он создан.
+    '''
+
+    name: str
+
+    @abstractmethod
+    def identify(self, password_hash: str) -> bool:
+        ...
+
+    @abstractmethod
+    def hash(self, password: str) -> str:
+        ...
+
+    @abstractmethod
+    def verify(self, password_hash: str, password: str) -> bool:
+        ...
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        return False
+
+
+class WerkzeugScheme(PasswordScheme):
+    '''
+    Хеши werkzeug (pbkdf2, scrypt), которыми созданы пароли до перехода на argon2id.
+    '''
+
+    name = 'werkzeug'
+
+    def identify(self, password_hash: str) -> bool:
+        return password_hash.startswith(('pbkdf2:', 'scrypt:'))
+
+    def hash(self, password: str) -> str:
+        return generate_password_hash(password)
+
+    def verify(self, password_hash: str, password: str) -> bool:
+        return check_password_hash(password_hash, password)
+
+
+class Argon2Scheme(PasswordScheme):
+    name = 'argon2id'
+
+    def __init__(self, time_cost: int, memory_cost: int, parallelism: int):
+        self.hasher = Argon2Hasher(time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+
+    def identify(self, password_hash: str) -> bool:
+        return password_hash.startswith('$argon2id$')
+
+    def hash(self, password: str) -> str:
+        return self.hasher.hash(password)
+
+    def verify(self, password_hash: str, password: str) -> bool:
+        try:
+            return self.hasher.verify(password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        return self.hasher.check_needs_rehash(password_hash)
+
+
+class PasswordSchemes:
+    '''
+    Реестр алгоритмов: новые хеши создаются алгоритмом по умолчанию, проверка выполняется
+    алгоритмом, которым создан хеш. Хеш другого алгоритма или с устаревшими параметрами требует пересчета.
+    '''
+
+    def __init__(self, schemes: list[PasswordScheme], default: str):
+        self.schemes = schemes
+        self.default = next(scheme for scheme in schemes if scheme.name == default)
+
+    def identify(self, password_hash: str) -> PasswordScheme | None:
+        return next((scheme for scheme in self.schemes if scheme.identify(password_hash)), None)
+
+    def hash(self, password: str) -> str:
+        return self.default.hash(password)
+
+    def verify(self, password_hash: str, password: str) -> bool:
+        scheme = self.identify(password_hash)
+        return scheme is not None and scheme.verify(password_hash, password)
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        scheme = self.identify(password_hash)
+        return scheme is not self.default or scheme.needs_rehash(password_hash)
+
+
+password_schemes = PasswordSchemes(
+    schemes=[
+        Argon2Scheme(
+            time_cost=app_settings.argon2_time_cost,
+            memory_cost=app_settings.argon2_memory_cost,
+            parallelism=app_settings.argon2_parallelism,
+        ),
+        WerkzeugScheme(),
+    ],
+    default=app_settings.password_scheme,
+)
+
+
+# функции модуля, а не методы: передаются в процессы пула services.hashing
+def hash_password(password: str) -> str:
+    return password_schemes.hash(password)
+
+
+def verify_password(password_hash: str, password: str) -> bool:
+    return password_schemes.verify(password_hash, password)
+
+
+def calibrate_argon2(
+        memory_costs: list[int], time_costs: list[int], parallelism: int, rounds: int
+) -> list[tuple[int, int, float]]:
+    """
+    Измеряет время проверки пароля argon2id для каждой пары параметров на текущей машине.
+
+    :param memory_costs: (list[int]) Проверяемые объемы памяти в KiB.
+    :param time_costs: (list[int]) Проверяемые числа проходов.
+    :param rounds: (int) Число проверок для каждой пары, берется медиана.
+    :return:
+    list[tuple[int, int, float]]: Объем памяти, число проходов и медианное время проверки в секундах.
+    """
+    results = []
+    for memory_cost in memory_costs:
+        for time_cost in time_costs:
+            scheme = Argon2Scheme(time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+            password_hash = scheme.hash('calibration')
+            timings = []
+            for _ in range(rounds):
+                start = perf_counter()
+                scheme.verify(password_hash, 'calibration')
+                timings.append(perf_counter() - start)
+            results.append((memory_cost, time_cost, median(timings)))
+    return results
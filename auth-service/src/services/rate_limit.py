@@ -0,0 +1,69 @@
+from time import time
+from uuid import uuid4
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from core.deadline import with_deadline
+from core.metrics import metrics
+
+# KEYS - ключи окон, ARGV: текущее время (мс), уникальный member, затем для каждого ключа лимит и окно (мс).
+# Попытка записывается во все окна, только если ни одно из них не заполнено.
+SLIDING_WINDOW_SCRIPT = '''
+local now = tonumber(ARGV[1])
+local retry_after = 0
+for index, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[index * 2 + 1])
+    local window = tonumber(ARGV[index * 2 + 2])
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+    if redis.call('ZCARD', key) >= limit then
+        local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+        retry_after = math.max(retry_after, tonumber(oldest[2]) + window - now)
+    end
+end
+if retry_after > 0 then
+    return retry_after
+end
+for index, key in ipairs(KEYS) do
+    redis.call('ZADD', key, now, ARGV[2])
+    redis.call('PEXPIRE', key, ARGV[index * 2 + 2])
+end
+return 0
+'''
+
+
+class RateLimiter:
+    '''
+    Ограничение числа попыток в скользящем окне. Проверка и запись всех окон выполняются
+    одним Lua скриптом, поэтому одновременные попытки из разных воркеров не превышают лимит.
+    Если Redis недоступен, попытка разрешается.
+    '''
+
+    def __init__(self, redis: Redis | None):
+        self.redis = redis
+        self.script = redis.register_script(SLIDING_WINDOW_SCRIPT) if redis is not None else None
+
+    async def hit(self, name: str, limits: list[tuple[str, int, int]]) -> float:
+        """
+        Учитывает попытку во всех окнах.
+
+        :param name: (str) Имя ограничения для метрик.
+        :param limits: (list) Ключ окна, максимальное число попыток и длина окна в секундах.
+        :return:
+        float: 0, если попытка разрешена, иначе через сколько секунд освободится место в окне.
+        """
+        if self.script is None:
+            return 0
+        args = [int(time() * 1000), uuid4().hex]
+        for _, limit, window in limits:
+            args.extend((limit, window * 1000))
+        try:
+            retry_after = await with_deadline(
+                self.script, keys=[f'rate_limit:{key}' for key, _, _ in limits], args=args
+            )
+        except RedisError:
+            metrics.inc('rate_limit_errors_total')
+            return 0
+        if retry_after:
+            metrics.inc(f'rate_limit_rejected_total:{name}')
+        return retry_after / 1000
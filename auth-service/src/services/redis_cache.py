@@ -1,16 +1,350 @@
+import re
+import secrets
+from hashlib import blake2b
+from time import time
+from typing import AsyncIterator
+from uuid import UUID, uuid4
+
+import orjson
 from redis.asyncio import Redis
 
+from core.config import app_settings
+from core.deadline import with_deadline
+from services.generations import generation_cache
+from services.revocation_filter import DENYLIST_CHANNEL, revocation_filter
+
+# пространства ключей: отозванные jti access токенов, действующие refresh токены, поколения токенов пользователей
+DENYLIST = 'dl'
+REFRESH_TOKENS = 'rt'
+GENERATIONS = 'gen'
+# сессии пользователя: sorted set session_id -> срок действия refresh токена и hash session_id -> описание
+SESSIONS = 'sess'
+SESSIONS_INFO = 'sinfo'
+
+# KEYS: sorted set и hash сессий пользователя, новый refresh токен, затем заменяемые refresh токены.
+# ARGV: текущее время, session_id, срок действия refresh токена, описание сессии, время жизни refresh токена.
+# При замене сессия обновляется, только если этот вызов погасил старый refresh токен.
+# Истекшие сессии удаляются при каждой записи, ключи сессий живут до истечения последней из них.
+STORE_SESSION_SCRIPT = '''
+if #KEYS > 3 then
+    local deleted = 0
+    for index = 4, #KEYS do
+        deleted = deleted + redis.call('DEL', KEYS[index])
+    end
+    if deleted == 0 then
+        return 0
+    end
+end
+redis.call('SET', KEYS[3], '1', 'EX', ARGV[5])
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+for _, session_id in ipairs(expired) do
+    redis.call('HDEL', KEYS[2], session_id)
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[2])
+redis.call('HSET', KEYS[2], ARGV[2], ARGV[4])
+local last = redis.call('ZRANGE', KEYS[1], -1, -1, 'WITHSCORES')
+local ttl = math.max(math.ceil(tonumber(last[2]) - tonumber(ARGV[1])), 1)
+redis.call('EXPIRE', KEYS[1], ttl)
+redis.call('EXPIRE', KEYS[2], ttl)
+return 1
+'''
+
+# KEYS: sorted set и hash сессий пользователя, ARGV[1] - session_id. Возвращает описание удаленной сессии.
+REMOVE_SESSION_SCRIPT = '''
+local info = redis.call('HGET', KEYS[2], ARGV[1])
+if not info then
+    return false
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[2], ARGV[1])
+return info
+'''
+
+
+def cache_key(obj: str, namespace: str) -> bytes:
+    '''
+    Ключ фиксированной длины: пространство и 16 байт blake2b от токена или jti.
+    '''
+    return namespace.encode() + b':' + blake2b(obj.encode(), digest_size=16).digest()
+
 
 class CacheRedis:
     def __init__(self, redis: Redis):
         self.redis = redis
 
-    async def _object_from_cache(self, obj: str) -> bool:
-        data = await self.redis.get(obj)
-        return True if data else False
+    async def _object_from_cache(self, obj: str, namespace: str = DENYLIST) -> bool:
+        if namespace == DENYLIST and not revocation_filter.might_contain(cache_key(obj, namespace)):
+            return False
+        return await with_deadline(self.redis.exists, *self._keys(obj, namespace)) > 0
+
+    async def _put_object_to_cache(self, obj: str, time_cache: int = 30, namespace: str = DENYLIST):
+        key = cache_key(obj, namespace)
+        if namespace != DENYLIST:
+            await with_deadline(self.redis.set, key, b'1', time_cache)
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.set(key, b'1', time_cache)
+            pipe.publish(DENYLIST_CHANNEL, key)
+            await with_deadline(pipe.execute)
+        revocation_filter.add(key)
+
+    async def _delete_object_from_cache(self, obj: str, namespace: str = DENYLIST):
+        await with_deadline(self.redis.delete, *self._keys(obj, namespace))
+
+    async def _consume_object_from_cache(self, obj: str, namespace: str = DENYLIST) -> bool:
+        '''
+        Удаляет объект и сообщает, был ли он в кеше. Из одновременных вызовов True получает только один.
+        '''
+        return await with_deadline(self.redis.delete, *self._keys(obj, namespace)) > 0
+
+    async def _put_and_delete_objects(
+            self, put_obj: str, time_cache: int, put_namespace: str, delete_obj: str, delete_namespace: str,
+            session: tuple[str, str] | None = None
+    ) -> None:
+        '''
+        Записывает put_obj и удаляет delete_obj одним пакетом команд.
+        :param session: (tuple | None) user_id и session_id сессии, которая удаляется в том же пакете.
+        '''
+        key = cache_key(put_obj, put_namespace)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.set(key, b'1', time_cache)
+            if put_namespace == DENYLIST:
+                pipe.publish(DENYLIST_CHANNEL, key)
+            pipe.delete(*self._keys(delete_obj, delete_namespace))
+            if session is not None:
+                user_id, session_id = session
+                pipe.zrem(f'{SESSIONS}:{user_id}', session_id)
+                pipe.hdel(f'{SESSIONS_INFO}:{user_id}', session_id)
+            await with_deadline(pipe.execute)
+        if put_namespace == DENYLIST:
+            revocation_filter.add(key)
+
+    async def _get_generation(self, user_id: str, cached: bool = True) -> int:
+        '''
+        Текущее поколение токенов пользователя: токены с меньшим поколением (claim gen) недействительны.
+
+        :param cached: (bool) False - читать из Redis мимо кеша воркера. Так читается поколение для новых токенов:
+                       после увеличения поколения в другом воркере кеш этого устаревает до ttl, и токен
+                       со старым поколением был бы отклонен, как только кеш обновится.
+        '''
+        generation = generation_cache.get(user_id) if cached else None
+        if generation is None:
+            generation = int(await with_deadline(self.redis.get, f'{GENERATIONS}:{user_id}') or 0)
+            generation_cache.put(user_id, generation)
+        return generation
+
+    async def _batch_token_state(self, jtis: list[str], user_ids: list[str]) -> tuple[list[bool], dict[str, int]]:
+        '''
+        Состояние пачки токенов за одно обращение к Redis: отозван ли каждый jti и текущие поколения пользователей.
+        jti, которых точно нет в фильтре отозванных, и поколения из кеша воркера в Redis не запрашиваются.
+
+        :return:
+        tuple: Признаки отзыва в порядке jtis и поколения по user_id.
+        '''
+        revoked = [False] * len(jtis)
+        check = [index for index, jti in enumerate(jtis) if revocation_filter.might_contain(cache_key(jti, DENYLIST))]
+        generations = {}
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            generation = generation_cache.get(user_id)
+            if generation is None:
+                missing.append(user_id)
+            else:
+                generations[user_id] = generation
+        if not check and not missing:
+            return revoked, generations
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for index in check:
+                pipe.exists(*self._keys(jtis[index], DENYLIST))
+            if missing:
+                pipe.mget([f'{GENERATIONS}:{user_id}' for user_id in missing])
+            results = await with_deadline(pipe.execute)
+        for index, count in zip(check, results):
+            revoked[index] = count > 0
+        if missing:
+            for user_id, value in zip(missing, results[-1]):
+                generations[user_id] = int(value or 0)
+                generation_cache.put(user_id, generations[user_id])
+        return revoked, generations
+
+    async def _bump_generation(self, user_id: str) -> int:
+        '''
+        Делает недействительными все выпущенные токены пользователя одной записью в Redis.
+        '''
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.incr(f'{GENERATIONS}:{user_id}')
+            # все сессии пользователя завершены
+            pipe.delete(f'{SESSIONS}:{user_id}', f'{SESSIONS_INFO}:{user_id}')
+            generation, _ = await with_deadline(pipe.execute)
+        generation_cache.put(user_id, generation)
+        return generation
+
+    async def _store_session(
+            self, user_id: str, session_id: str, user_agent: str | None, access_jti: str,
+            refresh_token: str, old_refresh_token: str | None = None
+    ) -> bool:
+        """
+        Записывает refresh токен и сессию пользователя за одно обращение к Redis.
+
+        :param access_jti: (str) jti access токена сессии, отзывается при завершении сессии.
+        :param old_refresh_token: (str | None) Погашаемый refresh токен при обновлении токенов.
+        :return:
+        bool: False, если old_refresh_token уже погашен, в этом случае ничего не записывается.
+        """
+        now = int(time())
+        refresh_key = cache_key(refresh_token, REFRESH_TOKENS)
+        info = orjson.dumps([user_agent, now, access_jti, refresh_key.hex()])
+        keys = [f'{SESSIONS}:{user_id}', f'{SESSIONS_INFO}:{user_id}', refresh_key]
+        if old_refresh_token is not None:
+            keys.extend(self._keys(old_refresh_token, REFRESH_TOKENS))
+        script = self.redis.register_script(STORE_SESSION_SCRIPT)
+        args = [now, session_id, now + app_settings.authjwt_time_refresh, info, app_settings.authjwt_time_refresh]
+        return await with_deadline(script, keys=keys, args=args) > 0
+
+    async def _list_sessions(self, user_id: str) -> list[tuple[str, int, list]]:
+        '''
+        :return:
+        list: session_id, срок действия и описание [user_agent, issued_at, access_jti, refresh_key] действующих сессий.
+        '''
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zrangebyscore(f'{SESSIONS}:{user_id}', int(time()), '+inf', withscores=True)
+            pipe.hgetall(f'{SESSIONS_INFO}:{user_id}')
+            expires, info = await with_deadline(pipe.execute)
+        return [
+            (session_id.decode(), int(expires_at), orjson.loads(info[session_id]))
+            for session_id, expires_at in expires if session_id in info
+        ]
+
+    async def _revoke_session(self, user_id: str, session_id: str) -> bool:
+        '''
+        Завершает сессию: удаляет ее из списка, гасит refresh токен и отзывает access токен.
+        '''
+        script = self.redis.register_script(REMOVE_SESSION_SCRIPT)
+        info = await with_deadline(
+            script, keys=[f'{SESSIONS}:{user_id}', f'{SESSIONS_INFO}:{user_id}'], args=[session_id]
+        )
+        if info is None:
+            return False
+        _, _, access_jti, refresh_key = orjson.loads(info)
+        denylist_key = cache_key(access_jti, DENYLIST)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.delete(bytes.fromhex(refresh_key))
+            pipe.set(denylist_key, b'1', app_settings.authjwt_time_access)
+            pipe.publish(DENYLIST_CHANNEL, denylist_key)
+            await with_deadline(pipe.execute)
+        revocation_filter.add(denylist_key)
+        return True
+
+    @staticmethod
+    def _keys(obj: str, namespace: str) -> list[bytes | str]:
+        keys = [cache_key(obj, namespace)]
+        if app_settings.redis_legacy_keys:
+            # ключи, записанные до перехода на хеши (ключ и значение - сам объект)
+            keys.append(obj)
+        return keys
+
+
+# refresh токен в старом формате: три части JWT в base64url, без префикса пространства (rate_limit:login:a.b@c.d)
+LEGACY_REFRESH_TOKEN = re.compile(r'[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+')
+
+
+def legacy_namespace(key: bytes) -> str | None:
+    '''
+    Пространство ключа в старом формате: refresh токен (JWT) или jti (UUID), None - чужой ключ.
+    '''
+    try:
+        key = key.decode('ascii')
+    except UnicodeDecodeError:
+        return None
+    if LEGACY_REFRESH_TOKEN.fullmatch(key):
+        return REFRESH_TOKENS
+    try:
+        UUID(key)
+    except ValueError:
+        return None
+    return DENYLIST
+
+
+async def migrate_legacy_keys(redis: Redis, batch: int = 1000) -> dict[str, int]:
+    """
+    Переносит ключи старого формата (ключ и значение - токен или jti) в хешированные с сохранением TTL.
+
+    :param batch: (int) Число ключей за одну итерацию SCAN.
+    :return:
+    dict[str, int]: Число перенесенных ключей по пространствам.
+    """
+    moved = {DENYLIST: 0, REFRESH_TOKENS: 0}
+    cursor = 0
+    while True:
+        cursor, keys = await redis.scan(cursor, count=batch)
+        legacy = [key for key in keys if legacy_namespace(key)]
+        if legacy:
+            async with redis.pipeline(transaction=False) as pipe:
+                for key in legacy:
+                    pipe.type(key)
+                    pipe.get(key)
+                    pipe.pttl(key)
+                # GET ключа другого типа (sorted set, hash) возвращает WRONGTYPE: такие ключи пропускаются
+                values = await pipe.execute(raise_on_error=False)
+            async with redis.pipeline(transaction=False) as pipe:
+                for key, key_type, value, ttl in zip(legacy, values[::3], values[1::3], values[2::3]):
+                    # значение не совпадает с ключом - ключ не наш; -2 - ключ уже истек
+                    if key_type != b'string' or value != key or ttl == -2:
+                        continue
+                    namespace = legacy_namespace(key)
+                    pipe.set(cache_key(key.decode(), namespace), b'1', px=ttl if ttl > 0 else None)
+                    pipe.delete(key)
+                    moved[namespace] += 1
+                await pipe.execute()
+        if cursor == 0:
+            return moved
+
+
+async def measure_key_layouts(
+        redis: Redis, count: int = 10000, token_size: int = 495, ttl: int = 3600
+) -> dict[str, float]:
+    """
+    Средний расход памяти Redis (INFO used_memory) на одну запись: старый формат (ключ и значение - токен или jti)
+    и хешированный ключ со значением b'1'. Записи создаются с TTL, как в сервисе, и удаляются после замера.
+
+    :param count: (int) Число записей каждого вида.
+    :param token_size: (int) Длина refresh токена в байтах.
+    :return:
+    dict[str, float]: Байт на запись по видам записей.
+    """
+    samples = {
+        REFRESH_TOKENS: [secrets.token_urlsafe(token_size)[:token_size] for _ in range(count)],
+        DENYLIST: [str(uuid4()) for _ in range(count)],
+    }
+    result = {}
+    for namespace, objects in samples.items():
+        layouts = {
+            'legacy': [(obj.encode(), obj.encode()) for obj in objects],
+            'hashed': [(cache_key(obj, namespace), b'1') for obj in objects],
+        }
+        for layout, entries in layouts.items():
+            before = (await redis.info('memory'))['used_memory']
+            for start in range(0, count, 1000):
+                async with redis.pipeline(transaction=False) as pipe:
+                    for key, value in entries[start:start + 1000]:
+                        pipe.set(key, value, ttl)
+                    await pipe.execute()
+            used = (await redis.info('memory'))['used_memory'] - before
+            for start in range(0, count, 1000):
+                await redis.delete(*[key for key, _ in entries[start:start + 1000]])
+            result[f'{namespace}:{layout}'] = round(used / count, 1)
+    return result
 
-    async def _put_object_to_cache(self, obj: str, time_cache: int = 30):
-        await self.redis.set(obj, obj, time_cache)
 
-    async def _delete_object_from_cache(self, obj: str):
-        await self.redis.delete(obj)
+async def denylist_keys(redis: Redis) -> AsyncIterator[bytes]:
+    '''
+    Ключи отозванных jti для сборки services.revocation_filter, старые ключи приводятся к новому формату.
+    '''
+    prefix = DENYLIST.encode() + b':'
+    match = None if app_settings.redis_legacy_keys else prefix + b'*'
+    async for key in redis.scan_iter(match=match, count=1000):
+        if key.startswith(prefix):
+            yield key
+        elif legacy_namespace(key) == DENYLIST:
+            yield cache_key(key.decode(), DENYLIST)
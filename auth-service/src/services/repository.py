@@ -1,8 +1,10 @@
 import uuid
 from typing import Any
 
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, or_, Select, Result
+from core.deadline import DeadlineExceeded, with_deadline
 from db.postgres import Base
 from models.entity import Role, User
 
@@ -12,6 +14,19 @@ class BaseRepository:
         self.session = session
         super().__init__(**kwargs)
 
+    @staticmethod
+    async def _with_deadline(func, *args, **kwargs) -> Any:
+        """
+        Выполняет обращение к базе данных в пределах бюджета времени запроса.
+        Запрос, отмененный по statement_timeout (SQLSTATE 57014), считается превысившим бюджет.
+        """
+        try:
+            return await with_deadline(func, *args, **kwargs)
+        except DBAPIError as exc:
+            if getattr(exc.orig, 'sqlstate', None) == '57014':
+                raise DeadlineExceeded from exc
+            raise
+
     async def _get_obj(self, query: Select) -> Base | None:
         """
         Выполняет запрос к базе данных и возвращает результат.
@@ -20,12 +35,12 @@ class BaseRepository:
         :return:
         Base | None: Возвращает результат запроса, который может быть объектом модели или None, если ничего не найдено.
         """
-        obj = await self.session.execute(query)
+        obj = await self._with_deadline(self.session.execute, query)
         obj = obj.scalar()
         return obj
 
     async def _get_list_obj(self, query: Select) -> Result[Any]:
-        list_obj = await self.session.execute(query)
+        list_obj = await self._with_deadline(self.session.execute, query)
         return list_obj.iterator
 
     @classmethod
@@ -57,7 +72,7 @@ class BaseRepository:
         Base | None: Возвращает объект из базы данных, соответствующий указанному PK,
                         либо None, если объект не был найден.
         """
-        obj = await self.session.get(model, pk)
+        obj = await self._with_deadline(self.session.get, model, pk)
         return obj
 
     async def get_obj_by_attr_name(self, model: Base, attr_name: str, attr_value: str | int) -> Base | None:
@@ -113,10 +128,10 @@ class BaseRepository:
             **data
         )
         self.session.add(new_db_obj)
-        await self.session.commit()
+        await self._with_deadline(self.session.commit)
 
     async def delete_obj(self, model: Base, id: uuid.UUID) -> None:
-        obj = await self.session.get(model, id)
+        obj = await self._with_deadline(self.session.get, model, id)
         await self.session.delete(obj)
 
     async def test_join(self):
@@ -0,0 +1,145 @@
+import asyncio
+from hashlib import blake2b
+from math import ceil, log
+from typing import AsyncIterator, Callable
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from core.config import app_settings
+from core.metrics import metrics
+
+# канал, в который публикуются ключи отозванных jti (services.redis_cache.cache_key)
+DENYLIST_CHANNEL = 'denylist'
+
+
+class BloomFilter:
+    '''
+    Множество без ложноотрицательных ответов: отсутствие элемента точное,
+    присутствие - с вероятностью ошибки error_rate при числе элементов до capacity.
+    '''
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, ceil(-capacity * log(error_rate) / log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * log(2)))
+        self.bits = bytearray(ceil(self.size / 8))
+        self.count = 0
+
+    def _positions(self, item: bytes):
+        digest = blake2b(item, digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + index * second) % self.size for index in range(self.hashes))
+
+    def add(self, item: bytes) -> None:
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: bytes) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationFilter:
+    '''
+    Фильтр Блума отозванных jti в памяти воркера: проверка access токена обращается к Redis,
+    только если jti есть в фильтре. Воркеры узнают об отзыве через pub/sub, фильтр периодически
+    пересобирается из Redis, чтобы убрать истекшие ключи и пропущенные сообщения.
+    Пока фильтр не собран или подписка потеряна, ready = False и проверяется Redis.
+    '''
+
+    def __init__(self, capacity: int, error_rate: float, rebuild_interval: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.rebuild_interval = rebuild_interval
+        self.redis: Redis | None = None
+        self.scan_keys: Callable[[Redis], AsyncIterator[bytes]] | None = None
+        self.filter = BloomFilter(capacity, error_rate)
+        # фильтр, который собирается сейчас: новые отзывы добавляются и в него
+        self.pending: BloomFilter | None = None
+        self.ready = False
+        self.tasks: list[asyncio.Task] = []
+
+    async def start(self, redis: Redis, scan_keys: Callable[[Redis], AsyncIterator[bytes]]) -> None:
+        """
+        :param scan_keys: (Callable) Перебирает ключи отозванных jti в Redis для сборки фильтра.
+        """
+        self.redis = redis
+        self.scan_keys = scan_keys
+        self.tasks = [asyncio.create_task(self._listen()), asyncio.create_task(self._rebuild_periodically())]
+
+    async def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        self.ready = False
+
+    def add(self, key: bytes) -> None:
+        self.filter.add(key)
+        if self.pending is not None:
+            self.pending.add(key)
+        metrics.set_gauge('denylist_filter_size', self.filter.count)
+
+    def might_contain(self, key: bytes) -> bool:
+        '''
+        :return:
+        bool: False - ключа точно нет в Redis, True - нужно проверить Redis.
+        '''
+        if not self.ready:
+            return True
+        if key in self.filter:
+            metrics.inc('denylist_filter_positive_total')
+            return True
+        metrics.inc('denylist_filter_negative_total')
+        return False
+
+    async def rebuild(self) -> None:
+        # размер по прошлой сборке, чтобы фильтр не переполнялся при росте числа отзывов
+        pending = BloomFilter(max(self.capacity, self.filter.count * 2), self.error_rate)
+        self.pending = pending
+        try:
+            async for key in self.scan_keys(self.redis):
+                pending.add(key)
+        finally:
+            self.pending = None
+        self.filter = pending
+        metrics.set_gauge('denylist_filter_size', pending.count)
+        metrics.inc('denylist_filter_rebuilds_total')
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(DENYLIST_CHANNEL)
+                # подписка раньше сборки: отзывы во время сборки не теряются
+                await self.rebuild()
+                self.ready = True
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1)
+                    if message is not None:
+                        self.add(message['data'])
+            except (RedisError, OSError):
+                self.ready = False
+                metrics.inc('denylist_filter_errors_total')
+                await asyncio.sleep(1)
+            finally:
+                self.ready = False
+                await pubsub.reset()
+
+    async def _rebuild_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.rebuild_interval)
+            if not self.ready:
+                continue
+            try:
+                await self.rebuild()
+            except (RedisError, OSError):
+                metrics.inc('denylist_filter_errors_total')
+
+
+revocation_filter = RevocationFilter(
+    capacity=app_settings.denylist_filter_capacity,
+    error_rate=app_settings.denylist_filter_error_rate,
+    rebuild_interval=app_settings.denylist_filter_rebuild,
+)
@@ -0,0 +1,64 @@
+import asyncio
+from typing import Callable, NamedTuple
+
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import app_settings
+from core.metrics import metrics
+from models.entity import Role
+
+
+class RoleAccess(NamedTuple):
+    lvl: int
+    max_year: int
+
+
+class RoleSnapshot:
+    '''
+    Копия таблицы ролей в памяти воркера (role_id -> lvl, max_year) для решений о доступе без запросов в БД.
+    Перечитывается раз в refresh_interval и сразу после изменения ролей в этом воркере.
+    '''
+
+    def __init__(self, refresh_interval: float):
+        self.refresh_interval = refresh_interval
+        self.roles: dict[str, RoleAccess] = {}
+        self.session_factory: Callable[[], AsyncSession] | None = None
+        self.task: asyncio.Task | None = None
+
+    async def start(self, session_factory: Callable[[], AsyncSession]) -> None:
+        self.session_factory = session_factory
+        try:
+            await self.reload()
+        except (SQLAlchemyError, OSError):
+            metrics.inc('role_snapshot_errors_total')
+        self.task = asyncio.create_task(self._reload_periodically())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def get(self, role_id: str | None) -> RoleAccess | None:
+        return self.roles.get(role_id)
+
+    async def reload(self) -> None:
+        if self.session_factory is None:
+            return
+        async with self.session_factory() as session:
+            rows = await session.execute(select(Role.id, Role.lvl, Role.max_year))
+        self.roles = {str(role_id): RoleAccess(lvl, max_year) for role_id, lvl, max_year in rows}
+        metrics.set_gauge('role_snapshot_size', len(self.roles))
+
+    async def _reload_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.reload()
+            except (SQLAlchemyError, OSError):
+                metrics.inc('role_snapshot_errors_total')
+
+
+role_snapshot = RoleSnapshot(refresh_interval=app_settings.role_snapshot_refresh)
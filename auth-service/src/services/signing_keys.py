@@ -0,0 +1,141 @@
+import secrets
+from hashlib import blake2b
+from pathlib import Path
+from time import perf_counter, time
+from uuid import uuid4
+
+import jwt
+import orjson
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from jwt.algorithms import OKPAlgorithm, RSAAlgorithm
+
+from core.config import app_settings
+
+# закрытый ключ подписывает (если он активный) и проверяет токены, открытый только проверяет
+PRIVATE_SUFFIX = '.pem'
+PUBLIC_SUFFIX = '.pub'
+
+
+class SigningKey:
+    '''
+    Ключ подписи токенов: kid, алгоритм, ключи cryptography (разобраны один раз при загрузке).
+    '''
+
+    def __init__(self, kid: str, private_key=None, public_key=None):
+        self.kid = kid
+        self.private_key = private_key
+        self.public_key = public_key if public_key is not None else private_key.public_key()
+        if isinstance(self.public_key, ed25519.Ed25519PublicKey):
+            self.algorithm = 'EdDSA'
+            jwk = OKPAlgorithm.to_jwk(self.public_key, as_dict=True)
+        elif isinstance(self.public_key, rsa.RSAPublicKey):
+            self.algorithm = 'RS256'
+            jwk = RSAAlgorithm.to_jwk(self.public_key, as_dict=True)
+        else:
+            raise ValueError(f'Unsupported key type for kid {kid}')
+        self.jwk = {**jwk, 'kid': kid, 'alg': self.algorithm, 'use': 'sig'}
+
+    @classmethod
+    def from_file(cls, path: Path) -> 'SigningKey':
+        data = path.read_bytes()
+        if path.name.endswith(PRIVATE_SUFFIX):
+            return cls(path.name[:-len(PRIVATE_SUFFIX)], private_key=serialization.load_pem_private_key(data, None))
+        return cls(path.name[:-len(PUBLIC_SUFFIX)], public_key=serialization.load_pem_public_key(data))
+
+
+class KeyRing:
+    '''
+    Связка ключей подписи. Активный ключ подписывает новые токены, остальные ключи только проверяют
+    подпись, пока не истекут выпущенные ими токены. Открытые ключи публикуются в JWKS.
+    '''
+
+    def __init__(self, keys: list[SigningKey], active_kid: str | None = None):
+        self.keys = {key.kid: key for key in keys}
+        self.active = None
+        if active_kid is not None:
+            self.active = self.keys.get(active_kid)
+            if self.active is None or self.active.private_key is None:
+                raise ValueError(f'No private key for active kid {active_kid}')
+        self.jwks = orjson.dumps({'keys': [key.jwk for key in self.keys.values()]})
+        self.etag = '"' + blake2b(self.jwks, digest_size=8).hexdigest() + '"'
+
+    @classmethod
+    def from_dir(cls, keys_dir: str | None, active_kid: str | None) -> 'KeyRing':
+        """
+        :param keys_dir: (str | None) Каталог с файлами <kid>.pem и <kid>.pub, None - токены подписываются SECRET_KEY.
+        :param active_kid: (str | None) kid ключа, которым подписываются новые токены.
+        """
+        if not keys_dir:
+            return cls([])
+        paths = sorted(
+            path for path in Path(keys_dir).iterdir() if path.name.endswith((PRIVATE_SUFFIX, PUBLIC_SUFFIX))
+        )
+        return cls([SigningKey.from_file(path) for path in paths], active_kid)
+
+    def get(self, kid: str) -> SigningKey | None:
+        return self.keys.get(kid)
+
+
+def _new_private_key(algorithm: str):
+    if algorithm == 'EdDSA':
+        return ed25519.Ed25519PrivateKey.generate()
+    if algorithm == 'RS256':
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    raise ValueError(f'Unsupported algorithm {algorithm}')
+
+
+def generate_key(keys_dir: str, kid: str, algorithm: str = 'EdDSA') -> Path:
+    '''
+    Создает закрытый ключ <kid>.pem в keys_dir.
+    '''
+    private_key = _new_private_key(algorithm)
+    path = Path(keys_dir) / f'{kid}{PRIVATE_SUFFIX}'
+    path.write_bytes(private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ))
+    path.chmod(0o600)
+    return path
+
+
+def measure_signing(count: int = 2000) -> dict[str, dict[str, float]]:
+    """
+    Скорость подписи и проверки access токена с типичными claims для SECRET_KEY (HS256) и ключей EdDSA и RS256.
+    Ключи создаются в памяти и разобраны заранее, как в связке ключей сервиса.
+
+    :param count: (int) Число подписей и проверок для каждого алгоритма.
+    :return:
+    dict[str, dict[str, float]]: По алгоритмам - подписей в секунду, проверок в секунду и размер токена в байтах.
+    """
+    now = int(time())
+    claims = {
+        'sub': str(uuid4()), 'iat': now, 'nbf': now, 'jti': str(uuid4()), 'exp': now + 900,
+        'type': 'access', 'fresh': False, 'uaf': secrets.token_urlsafe(12), 'is_admin': False,
+        'sid': uuid4().hex, 'role': str(uuid4()), 'lvl': 0, 'max_year': 1980, 'gen': 0,
+    }
+    secret = secrets.token_urlsafe(32)
+    keys = {'HS256': (secret, secret, None)}
+    for algorithm in ('EdDSA', 'RS256'):
+        private_key = _new_private_key(algorithm)
+        keys[algorithm] = (private_key, private_key.public_key(), {'kid': 'measure'})
+    result = {}
+    for algorithm, (sign_key, verify_key, headers) in keys.items():
+        started = perf_counter()
+        for _ in range(count):
+            token = jwt.encode(claims, sign_key, algorithm=algorithm, headers=headers)
+        signed = perf_counter() - started
+        started = perf_counter()
+        for _ in range(count):
+            jwt.decode(token, verify_key, algorithms=[algorithm])
+        verified = perf_counter() - started
+        result[algorithm] = {
+            'sign/s': round(count / signed), 'verify/s': round(count / verified), 'token bytes': len(token)
+        }
+    return result
+
+
+key_ring = KeyRing.from_dir(app_settings.jwt_keys_dir, app_settings.jwt_active_kid)
+
+
+async def get_key_ring() -> KeyRing:
+    return key_ring
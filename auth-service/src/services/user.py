@@ -1,22 +1,31 @@
+from async_fastapi_jwt_auth.exceptions import AuthJWTException
 from fastapi import Request
 
 
-from schemas.entity import UserCreate, UserLogin, UserProfil, ChangeProfil, ChangePassword, FieldFilter
+from schemas.entity import (
+    UserCreate, UserLogin, UserProfil, ChangeProfil, ChangePassword, FieldFilter, SessionInfo, IntrospectToken,
+    IntrospectResult, HistoryFilter
+)
 from models.entity import User, Role, EventEnum
 from services.repository import BaseRepository
-from services.auth_jwt import BaseAuthJWT
-from services.history import BaseHistory
-from services.redis_cache import CacheRedis
+from services.authz import role_claims
+from services.auth_jwt import BaseAuthJWT, USER_AGENT_CLAIM, check_user_agent, user_agent_fingerprint
+from services.hashing import PasswordHasher
+from services.history import BaseHistory, decode_cursor
+from services.redis_cache import CacheRedis, DENYLIST, REFRESH_TOKENS
 from services.role import BaseRole
 from core.config import app_settings, ErrorName
+from core.metrics import metrics
+from datetime import datetime, timezone
 from time import time
-from werkzeug.security import generate_password_hash
+from uuid import UUID, uuid4
 
 
 class BaseAuth(BaseRepository, BaseAuthJWT, CacheRedis):
 
-    def __init__(self, manager_history: BaseHistory, *args, **kwargs):
+    def __init__(self, manager_history: BaseHistory, password_hasher: PasswordHasher, *args, **kwargs):
         self.manager_history = manager_history
+        self.password_hasher = password_hasher
         super().__init__(*args, **kwargs)
 
     async def sign_up(self, data: UserCreate) -> str | ErrorName:
@@ -56,6 +65,7 @@ class BaseAuth(BaseRepository, BaseAuthJWT, CacheRedis):
             data={
                 'login': data.login,
                 'password': data.password,
+                'password_hash': await self.password_hasher.hash(data.password),
                 'last_name': data.last_name,
                 'first_name': data.first_name,
                 'role_id': role.id,
@@ -79,14 +89,25 @@ class BaseAuth(BaseRepository, BaseAuthJWT, CacheRedis):
         error = None
         if user is None:
             return ErrorName.DoesNotExist
-        elif not user.check_password(data.password):
+        elif not await self.password_hasher.verify(user.password, data.password):
             error = ErrorName.InvalidPassword
+        elif self.password_hasher.needs_rehash(user.password):
+            # пароль верный: пересчитываем хеш устаревшего алгоритма или с устаревшими параметрами
+            user.password = await self.password_hasher.hash(data.password)
+            await self._with_deadline(self.session.commit)
+            metrics.inc('password_rehash_total')
         if not error:
-            _, refresh_token = await self.create_tokens(sub=str(user.id), user_claims={
-                'user_agent': user_agent,
-                'is_admin': user.is_admin
-                })
-            await self._put_object_to_cache(obj=refresh_token, time_cache=app_settings.authjwt_time_refresh)
+            session_id = uuid4().hex
+            access_token, refresh_token = await self.create_tokens(sub=str(user.id), user_claims={
+                USER_AGENT_CLAIM: user_agent_fingerprint(user_agent),
+                'is_admin': user.is_admin,
+                'sid': session_id,
+                **role_claims(user.role_id)
+                }, generation=await self._get_generation(str(user.id), cached=False))
+            await self._store_session(
+                user_id=str(user.id), session_id=session_id, user_agent=user_agent,
+                access_jti=await self.auth.get_jti(access_token), refresh_token=refresh_token
+            )
             result = True
         await self.manager_history.write_entry_history(
             user_id=user.id,
@@ -109,13 +130,47 @@ class BaseAuth(BaseRepository, BaseAuthJWT, CacheRedis):
         user_data = await self.check_access_token()
         if await self._object_from_cache(obj=user_data.get('jti')):
             return ErrorName.InvalidAccessToken
-        elif user_agent != user_data.get('user_agent'):
+        elif user_data.get('gen', 0) < await self._get_generation(user_data.get('sub')):
+            # после выпуска токена пользователь вышел со всех устройств или сменил пароль
+            return ErrorName.InvalidAccessToken
+        elif not check_user_agent(user_data, user_agent):
             time_cache = user_data.get('exp', int(time())) - int(time())
             await self._put_object_to_cache(obj=user_data.get('jti'), time_cache=time_cache)
             return ErrorName.UnsafeEntry
         else:
             return user_data
 
+    async def introspect(self, tokens: list[IntrospectToken]) -> list[IntrospectResult]:
+        """
+        Пакетная проверка access токенов для других сервисов: подписи проверяются в цикле,
+        отзыв и поколения всех токенов - одним обращением к Redis.
+        В отличие от get_info_from_access_token, несовпадение User-Agent только сообщается, токен не отзывается.
+
+        :param tokens: (list[IntrospectToken]) Токены и User-Agent, с которыми они пришли.
+        :return:
+        list[IntrospectResult]: Результаты в порядке tokens: claims действующего токена или ошибка.
+        """
+        results = [IntrospectResult(active=False, error=ErrorName.InvalidAccessToken.value) for _ in tokens]
+        verified = []
+        for index, item in enumerate(tokens):
+            try:
+                claims = await self.decode_token(item.token)
+            except AuthJWTException:
+                continue
+            if claims.get('type') == 'access':
+                verified.append((index, claims))
+        revoked, generations = await self._batch_token_state(
+            [claims.get('jti') for _, claims in verified], [claims.get('sub') for _, claims in verified]
+        )
+        for (index, claims), is_revoked in zip(verified, revoked):
+            if is_revoked or claims.get('gen', 0) < generations[claims.get('sub')]:
+                continue
+            if not check_user_agent(claims, tokens[index].user_agent):
+                results[index].error = ErrorName.UnsafeEntry.value
+                continue
+            results[index] = IntrospectResult(active=True, claims=claims)
+        return results
+
     async def refresh_token(self, user_agent: str, request: Request) -> str | ErrorName:
         """
             Обновляет access token и возвращает его.
@@ -128,27 +183,43 @@ class BaseAuth(BaseRepository, BaseAuthJWT, CacheRedis):
                                access token не соответствует refresh token или User-Agent не безопасен).
         """
         refresh_token = request.cookies.get(app_settings.authjwt_refresh_cookie_key)
-        if not await self._object_from_cache(obj=refresh_token):
-            return ErrorName.InvalidRefreshToken
-
-        await self._delete_object_from_cache(obj=refresh_token)
         uuid_access = request.cookies.get(app_settings.authjwt_access_cookie_key).split('.')[-1]
         data = await self.check_refresh_token()
-        result = False
+        generation = await self._get_generation(data.get('sub'), cached=False)
         error = None
-        if data.get('user_agent', '') != user_agent:
+        if data.get('gen', 0) < generation:
+            error = ErrorName.InvalidRefreshToken
+        elif not check_user_agent(data, user_agent):
             error = ErrorName.UnsafeEntry
         elif data.get('uuid_access', '') != uuid_access:
             error = ErrorName.InvalidAccessRefreshTokens
-        if not error:
-            _, refresh_token = await self.create_tokens(
+        if error:
+            # refresh токен одноразовый: при ошибке он тоже погашается
+            consumed = await self._consume_object_from_cache(obj=refresh_token, namespace=REFRESH_TOKENS)
+        else:
+            # токены, выпущенные до появления списка сессий, получают новую сессию
+            session_id = data.get('sid') or uuid4().hex
+            # роль берется из строки пользователя: смена уровня в другой сессии действует после обновления токенов
+            user = await self.get_obj_by_pk(User, data.get('sub'))
+            access_token, new_refresh_token = await self.create_tokens(
                 sub=data.get('sub'),
                 user_claims={
-                    'user_agent': user_agent,
-                    'is_admin': data.get('is_admin')
-                    })
-            await self._put_object_to_cache(refresh_token, app_settings.authjwt_time_refresh)
-            result = True
+                    USER_AGENT_CLAIM: user_agent_fingerprint(user_agent),
+                    'is_admin': data.get('is_admin'),
+                    'sid': session_id,
+                    # параметры роли обновляются при каждом обновлении токенов
+                    **role_claims(user.role_id if user is not None else data.get('role'))
+                    },
+                generation=generation)
+            # погашение старого токена, запись нового и обновление сессии - одна атомарная операция
+            consumed = await self._store_session(
+                user_id=data.get('sub'), session_id=session_id, user_agent=user_agent,
+                access_jti=await self.auth.get_jti(access_token), refresh_token=new_refresh_token,
+                old_refresh_token=refresh_token
+            )
+        if not consumed or error is ErrorName.InvalidRefreshToken:
+            return ErrorName.InvalidRefreshToken
+        result = error is None
         await self.manager_history.write_entry_history(
             user_id=data.get('sub'),
             user_agent=user_agent,
@@ -157,6 +228,39 @@ class BaseAuth(BaseRepository, BaseAuthJWT, CacheRedis):
         )
         return error
 
+    async def reissue_tokens(
+            self, user_data: dict, user_agent: str, role_id: UUID, request: Request
+    ) -> None | ErrorName:
+        """
+        Выпускает токены текущей сессии с новой ролью. Прежний access токен отзывается,
+        refresh токен сессии заменяется новым: claims старой роли в этой сессии больше не принимаются.
+
+        :param user_data: (dict) Claims действующего access token.
+        :param user_agent: (str) Заголовок User-Agent для идентификации клиентского приложения.
+        :param role_id: (UUID) Новая роль пользователя.
+        :param request: (Request) Объект запроса, содержащий cookies с refresh token.
+        :return:
+        Union[None, ErrorName]: ErrorName.InvalidRefreshToken, если refresh token сессии уже погашен
+                                (одновременное обновление токенов или завершение сессии): новые токены не записаны.
+        """
+        user_id = user_data.get('sub')
+        session_id = user_data.get('sid') or uuid4().hex
+        access_token, refresh_token = await self.create_tokens(sub=user_id, user_claims={
+            USER_AGENT_CLAIM: user_agent_fingerprint(user_agent),
+            'is_admin': user_data.get('is_admin'),
+            'sid': session_id,
+            **role_claims(role_id)
+            }, generation=await self._get_generation(user_id, cached=False))
+        time_cache = user_data.get('exp', int(time())) - int(time())
+        await self._put_object_to_cache(obj=user_data.get('jti'), time_cache=time_cache)
+        stored = await self._store_session(
+            user_id=user_id, session_id=session_id, user_agent=user_agent,
+            access_jti=await self.auth.get_jti(access_token), refresh_token=refresh_token,
+            old_refresh_token=request.cookies.get(app_settings.authjwt_refresh_cookie_key)
+        )
+        if not stored:
+            return ErrorName.InvalidRefreshToken
+
     async def logout(self, request: Request, user_agent: str) -> None:
         """string
         Осуществляет выход пользователя из системы (logout).
@@ -167,10 +271,13 @@ class BaseAuth(BaseRepository, BaseAuthJWT, CacheRedis):
         """
         user_data = await self.check_access_token()
         time_cache = user_data.get('exp', int(time())) - int(time())
-        await self._put_object_to_cache(obj=user_data.get('jti'), time_cache=time_cache)
-
         refresh_token = request.cookies.get(app_settings.authjwt_refresh_cookie_key)
-        await self._delete_object_from_cache(obj=refresh_token)
+        session_id = user_data.get('sid')
+        await self._put_and_delete_objects(
+            put_obj=user_data.get('jti'), time_cache=time_cache, put_namespace=DENYLIST,
+            delete_obj=refresh_token, delete_namespace=REFRESH_TOKENS,
+            session=(user_data.get('sub'), session_id) if session_id else None
+        )
 
         await self.jwt_logout()
 
@@ -181,6 +288,31 @@ class BaseAuth(BaseRepository, BaseAuthJWT, CacheRedis):
             result=True
         )
 
+    async def logout_all(self, request: Request, user_agent: str) -> None | ErrorName:
+        """
+        Выход со всех устройств: увеличивает поколение токенов пользователя,
+        все выпущенные ранее access и refresh токены становятся недействительными.
+
+        :param request: (Request) Объект запроса, содержащий cookies с refresh token.
+        :param user_agent: (str) Заголовок User-Agent для идентификации клиентского приложения.
+        :return:
+        Union[None, ErrorName]: None или ошибка проверки access token.
+        """
+        user_data = await self.get_info_from_access_token(user_agent)
+        if not isinstance(user_data, dict):
+            return user_data
+        await self._bump_generation(user_data.get('sub'))
+        refresh_token = request.cookies.get(app_settings.authjwt_refresh_cookie_key)
+        if refresh_token:
+            await self._delete_object_from_cache(obj=refresh_token, namespace=REFRESH_TOKENS)
+        await self.jwt_logout()
+        await self.manager_history.write_entry_history(
+            user_id=user_data.get('sub'),
+            user_agent=user_agent,
+            event_type=EventEnum.logout,
+            result=True
+        )
+
 
 class UserManage:
     '''
@@ -192,29 +324,44 @@ class UserManage:
         self.manager_role = manager_role
         self.manager_history = manager_history
 
-    async def get_history(self, user_agent: str):
+    async def get_history(
+            self, user_agent: str, history_filter: HistoryFilter, after: str | None = None,
+            limit: int | None = None, stream: bool = False
+    ):
         '''
         Метод для получения истории
 
         :param user_agent: (str) Заголовок User-Agent для идентификации клиентского приложения.
+        :param history_filter: (HistoryFilter) Фильтр по типу события, результату и времени.
+        :param after: (str | None) Курсор следующей страницы из предыдущего ответа.
+        :param limit: (int | None) Размер страницы, для потока - максимальное число строк.
+        :param stream: (bool) Вернуть всю историю после курсора потоком NDJSON вместо страницы.
         '''
 
         user_obj: User | ErrorName = await self.get_user_obj(user_agent)
         if not isinstance(user_obj, User):
             return user_obj
-        result = await self.manager_history.get_history(user_obj.id)
-        return result
-
-    async def change_level(self, user_agent: str, level_up=True):
+        try:
+            cursor = decode_cursor(after) if after else None
+        except ValueError:
+            return ErrorName.InvalidCursor
+        if stream:
+            return self.manager_history.stream_history(user_obj.id, history_filter, cursor, limit)
+        limit = min(limit or app_settings.history_page_size, app_settings.history_max_page_size)
+        return await self.manager_history.get_history(user_obj.id, history_filter, cursor, limit)
+
+    async def change_level(self, user_agent: str, request: Request, level_up=True):
         '''
         Метод для изменения уровня подписки пользователя
 
         :param user_agent: (str) Заголовок User-Agent для идентификации клиентского приложения.
+        :param request: (Request) Объект запроса, содержащий cookies с refresh token.
         :param level_up: (bool) Параметр для понижения уровня подписки при False или для повышения при True.
         '''
-        user_obj: User | ErrorName = await self.get_user_obj(user_agent)
-        if not isinstance(user_obj, User):
-            return user_obj
+        user_data = await self.manager_auth.get_info_from_access_token(user_agent)
+        if not isinstance(user_data, dict):
+            return user_data
+        user_obj: User = await self.manager_auth.get_obj_by_pk(User, user_data.get('sub'))
         role_id = user_obj.role_id
         role_obj = await self.manager_role.get_role(role_id)
         if level_up:
@@ -225,6 +372,8 @@ class UserManage:
         if role_obj_higher:
             user_obj.role_id = role_obj_higher.id
             await self.manager_auth.session.commit()
+            # текущая сессия сразу получает токены с новой ролью, остальные - при обновлении токенов
+            return await self.manager_auth.reissue_tokens(user_data, user_agent, role_obj_higher.id, request)
         else:
             return ErrorName.RoleDoesNotExist
 
@@ -237,10 +386,46 @@ class UserManage:
         user_obj: User | ErrorName = await self.get_user_obj(user_agent)
         if not isinstance(user_obj, User):
             return user_obj
-        if not user_obj.check_password(new_data.old_password):
+        if not await self.manager_auth.password_hasher.verify(user_obj.password, new_data.old_password):
             return ErrorName.InvalidPassword
-        user_obj.password = generate_password_hash(new_data.new_password)
+        user_obj.password = await self.manager_auth.password_hasher.hash(new_data.new_password)
         await self.manager_auth.session.commit()
+        # токены, выпущенные со старым паролем, больше не действуют
+        await self.manager_auth._bump_generation(str(user_obj.id))
+
+    async def get_sessions(self, user_agent: str) -> list[SessionInfo] | ErrorName:
+        '''
+        Метод для получения списка действующих сессий (устройств) пользователя.
+        :param user_agent: (str) Заголовок User-Agent для идентификации клиентского приложения.
+        '''
+
+        user_data = await self.manager_auth.get_info_from_access_token(user_agent)
+        if not isinstance(user_data, dict):
+            return user_data
+        sessions = await self.manager_auth._list_sessions(user_data.get('sub'))
+        return [
+            SessionInfo(
+                session_id=session_id,
+                user_agent=session_user_agent,
+                issued_at=datetime.fromtimestamp(issued_at, timezone.utc),
+                expires_at=datetime.fromtimestamp(expires_at, timezone.utc),
+                current=session_id == user_data.get('sid')
+            )
+            for session_id, expires_at, (session_user_agent, issued_at, *_) in sessions
+        ]
+
+    async def revoke_session(self, user_agent: str, session_id: str) -> None | ErrorName:
+        '''
+        Метод для завершения одной сессии пользователя: ее refresh токен гасится, access токен отзывается.
+        :param user_agent: (str) Заголовок User-Agent для идентификации клиентского приложения.
+        :param session_id: (str) Идентификатор сессии из списка сессий.
+        '''
+
+        user_data = await self.manager_auth.get_info_from_access_token(user_agent)
+        if not isinstance(user_data, dict):
+            return user_data
+        if not await self.manager_auth._revoke_session(user_data.get('sub'), session_id):
+            return ErrorName.SessionDoesNotExist
 
     async def get_user_data(self, user_agent: str):
         '''
@@ -0,0 +1,94 @@
+from collections import OrderedDict
+from hashlib import sha256
+from typing import Iterable
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import app_settings
+from core.metrics import metrics
+from models.entity import UserAgent
+
+
+def user_agent_hash(user_agent: str) -> bytes:
+    '''
+    Первые 16 байт sha256: то же значение считает миграция в Postgres (sha256 есть и там).
+    '''
+    return sha256(user_agent.encode()).digest()[:16]
+
+
+class UserAgentCache:
+    '''
+    LRU строк User-Agent -> id в user_agents. У пользователя несколько браузеров, поэтому почти все события
+    находят id в памяти и записываются в login_history без обращения к user_agents.
+    '''
+
+    def __init__(self, size: int):
+        self.size = size
+        self.ids: OrderedDict[str, int] = OrderedDict()
+
+    def get(self, user_agent: str) -> int | None:
+        user_agent_id = self.ids.get(user_agent)
+        if user_agent_id is not None:
+            self.ids.move_to_end(user_agent)
+        return user_agent_id
+
+    def put(self, user_agent: str, user_agent_id: int) -> None:
+        self.ids[user_agent] = user_agent_id
+        self.ids.move_to_end(user_agent)
+        if len(self.ids) > self.size:
+            self.ids.popitem(last=False)
+
+    async def resolve(self, session: AsyncSession, user_agents: Iterable[str]) -> dict[str, int]:
+        '''
+        Находит id строк, новые строки добавляет в user_agents. Строки, которых нет в памяти,
+        ищутся одним запросом, отсутствующие в таблице добавляются одним INSERT в отдельной транзакции.
+
+        :return:
+        dict: User-Agent -> id.
+        '''
+        ids, missing = {}, {}
+        for user_agent in dict.fromkeys(user_agents):
+            user_agent_id = self.get(user_agent)
+            if user_agent_id is None:
+                missing[user_agent_hash(user_agent)] = user_agent
+            else:
+                ids[user_agent] = user_agent_id
+        if not missing:
+            return ids
+        metrics.inc('user_agent_cache_misses_total', len(missing))
+        found = list(await session.execute(
+            select(UserAgent.id, UserAgent.hash).where(UserAgent.hash.in_(list(missing)))
+        ))
+        new = missing.keys() - {hash for _, hash in found}
+        if new:
+            # строку мог одновременно добавить другой воркер: ее id находится повторным SELECT
+            await session.execute(
+                insert(UserAgent.__table__).on_conflict_do_nothing(index_elements=['hash']),
+                [{'hash': hash, 'user_agent': missing[hash]} for hash in new]
+            )
+            # id попадают в память только после фиксации: откат записи истории не оставит в кеше несуществующий id
+            await session.commit()
+            found += list(await session.execute(
+                select(UserAgent.id, UserAgent.hash).where(UserAgent.hash.in_(list(new)))
+            ))
+        for user_agent_id, hash in found:
+            self.put(missing[hash], user_agent_id)
+            ids[missing[hash]] = user_agent_id
+        return ids
+
+
+async def with_user_agent_ids(session: AsyncSession, rows: list[dict]) -> list[dict]:
+    '''
+    Заменяет строку User-Agent (browser) в строках login_history (history_row) на id из user_agents.
+    Исходные строки не меняются: при ошибке записи они откладываются в файл со строкой User-Agent.
+    '''
+    ids = await user_agent_cache.resolve(session, (row['browser'] for row in rows))
+    return [
+        {**{key: value for key, value in row.items() if key != 'browser'}, 'user_agent_id': ids[row['browser']]}
+        for row in rows
+    ]
+
+
+user_agent_cache = UserAgentCache(size=app_settings.user_agent_cache_size)
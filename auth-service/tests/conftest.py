@@ -2,6 +2,7 @@ import asyncio
 from typing import AsyncGenerator
 
 import pytest
+from fakeredis import FakeServer, aioredis
 from httpx import AsyncClient
 from main import app
 
@@ -19,3 +20,11 @@ def event_loop(request):
 async def ac() -> AsyncGenerator[AsyncClient, None]:
     async with AsyncClient(app=app, base_url="http://test") as ac:
         yield ac
+
+
+@pytest.fixture(autouse=True)
+def fake_redis(monkeypatch):
+    """Redis приложения (db.redis) в каждом тесте - пустой fakeredis."""
+    redis = aioredis.FakeRedis(server=FakeServer())
+    monkeypatch.setattr('db.redis.redis', redis)
+    return redis
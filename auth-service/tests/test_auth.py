@@ -1,3 +1,4 @@
+import asyncio
 import time
 
 import pytest
@@ -10,7 +11,11 @@ from models.entity import User, Role
 from uuid import uuid4
 
 from schemas.entity import FieldFilter
-from services.auth_jwt import BaseAuthJWT
+from services.auth_jwt import BaseAuthJWT, user_agent_fingerprint
+from services.redis_cache import CacheRedis, REFRESH_TOKENS
+from db.redis import get_redis
+from main import app
+from fakeredis import FakeServer, aioredis
 
 START_URL = "/api/v1/auth/"
 TIME_ACCESS_TOKEN = 25
@@ -45,7 +50,7 @@ async def test_login(query_data, expected_answer, mock_get_user, ac: AsyncClient
 
     monkeypatch.setattr('services.user.BaseRepository.get_obj_by_attr_name', mock_get_obj_by_attr_name)
     monkeypatch.setattr('services.user.BaseRepository.create_obj', mock_return_null)
-    monkeypatch.setattr('services.user.CacheRedis._put_object_to_cache', mock_return_null)
+    monkeypatch.setattr('services.user.CacheRedis._store_session', mock_return_null)
 
     response = await ac.post(START_URL + "login/", json=query_data)
 
@@ -147,6 +152,18 @@ async def test_sign_up(query_data, expected_answer, mock_get_users, mock_get_rol
                 {'status': HTTPStatus.OK, 'response_body': {'jti': 'jti', 'user_agent': 'google', 'exp': TIME_ACCESS_TOKEN + int(time.time())}},
                 {'jti': str(uuid4()), 'user_agent': 'google', 'exp': TIME_ACCESS_TOKEN + int(time.time())},
                 False
+        ),
+        (
+                {'User-Agent': 'yandex'},
+                {'status': HTTPStatus.BAD_REQUEST, 'response_body': {'detail': 'подозрение на небезопасный вход'}},
+                {'jti': str(uuid4()), 'uaf': user_agent_fingerprint('google'), 'exp': TIME_ACCESS_TOKEN + int(time.time())},
+                False
+        ),
+        (
+                {'User-Agent': 'google'},
+                {'status': HTTPStatus.OK, 'response_body': {'jti': 'jti', 'uaf': user_agent_fingerprint('google'), 'exp': TIME_ACCESS_TOKEN + int(time.time())}},
+                {'jti': str(uuid4()), 'uaf': user_agent_fingerprint('google'), 'exp': TIME_ACCESS_TOKEN + int(time.time())},
+                False
         )
     ]
 )
@@ -213,10 +230,10 @@ async def test_refresh(user, expected_answer, input_headers, settings_test, ac:
     async def mock_return_null(*args, **kwargs):
         return None
 
-    monkeypatch.setattr('services.redis_cache.CacheRedis._object_from_cache', mock_object_from_cache)
-    monkeypatch.setattr('services.redis_cache.CacheRedis._delete_object_from_cache', mock_return_null)
-    monkeypatch.setattr('services.redis_cache.CacheRedis._put_object_to_cache', mock_return_null)
+    monkeypatch.setattr('services.redis_cache.CacheRedis._consume_object_from_cache', mock_object_from_cache)
+    monkeypatch.setattr('services.redis_cache.CacheRedis._store_session', mock_object_from_cache)
     monkeypatch.setattr('services.user.BaseRepository.create_obj', mock_return_null)
+    monkeypatch.setattr('services.user.BaseRepository.get_obj_by_pk', mock_return_null)
 
     user.id = uuid4()
     user_claims = {
@@ -245,3 +262,48 @@ async def test_refresh(user, expected_answer, input_headers, settings_test, ac:
     assert response.json() == expected_answer['response_body']
 
     ac.cookies.clear()
+
+
+async def test_login_deadline_exceeded(ac: AsyncClient, monkeypatch):
+    async def mock_slow_execute(*args, **kwargs):
+        await asyncio.sleep(1)
+
+    monkeypatch.setattr('sqlalchemy.ext.asyncio.AsyncSession.execute', mock_slow_execute)
+
+    response = await ac.post(START_URL + "login/", json={'login': 'admin', 'password': 'admin'},
+                             headers={'X-Request-Deadline-Ms': '0'})
+    assert response.status_code == HTTPStatus.GATEWAY_TIMEOUT
+
+    response = await ac.post(START_URL + "login/", json={'login': 'admin', 'password': 'admin'},
+                             headers={'X-Request-Deadline-Ms': '50'})
+    assert response.status_code == HTTPStatus.GATEWAY_TIMEOUT
+
+
+async def test_concurrent_refresh_only_one_wins(ac: AsyncClient, monkeypatch):
+    async def mock_return_null(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr('services.user.BaseRepository.create_obj', mock_return_null)
+    monkeypatch.setattr('services.user.BaseRepository.get_obj_by_pk', mock_return_null)
+    redis = aioredis.FakeRedis(server=FakeServer())
+    app.dependency_overrides[get_redis] = lambda: redis
+
+    user_claims = {'user_agent': 'google', 'is_admin': False}
+    access_token = await AuthJWT().create_access_token(subject=str(uuid4()), user_claims=user_claims)
+    user_claims['uuid_access'] = access_token.split('.')[-1]
+    refresh_token = await AuthJWT().create_refresh_token(subject=str(uuid4()), user_claims=user_claims)
+    await CacheRedis(redis)._put_object_to_cache(refresh_token, 60, namespace=REFRESH_TOKENS)
+
+    cookies = {'access_token_cookie': access_token, 'refresh_token_cookie': refresh_token}
+    try:
+        responses = await asyncio.gather(*[
+            ac.post(START_URL + "refresh/", headers={'User-Agent': 'google'}, cookies=cookies) for _ in range(5)
+        ])
+    finally:
+        app.dependency_overrides.pop(get_redis)
+        ac.cookies.clear()
+
+    statuses = sorted(response.status_code for response in responses)
+    assert statuses == [HTTPStatus.OK] + [HTTPStatus.UNPROCESSABLE_ENTITY] * 4
+    # в кеше остался только refresh токен победителя
+    assert len(await redis.keys('rt:*')) == 1
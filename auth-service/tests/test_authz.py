@@ -0,0 +1,158 @@
+import time
+from http import HTTPStatus
+from uuid import uuid4
+
+import jwt
+from fakeredis import FakeServer, aioredis
+from httpx import AsyncClient
+
+from db.redis import get_redis
+from main import app
+from models.entity import Role, User
+from services.role_snapshot import RoleAccess, role_snapshot
+
+START_URL = "/api/v1/authz/"
+
+
+async def test_content_access_without_db(ac: AsyncClient, monkeypatch):
+    role_id = str(uuid4())
+    claims = {'jti': str(uuid4()), 'user_agent': 'google', 'exp': int(time.time()) + 25,
+              'role': role_id, 'lvl': 0, 'max_year': 1980}
+
+    async def mock_check_access_token(*args, **kwargs):
+        return claims
+
+    async def mock_object_from_cache(*args, **kwargs):
+        return False
+
+    async def mock_return_null(*args, **kwargs):
+        return None
+
+    async def fail_execute(*args, **kwargs):
+        raise AssertionError('decision must not query the database')
+
+    monkeypatch.setattr('services.auth_jwt.BaseAuthJWT.check_access_token', mock_check_access_token)
+    monkeypatch.setattr('services.redis_cache.CacheRedis._object_from_cache', mock_object_from_cache)
+    monkeypatch.setattr('services.redis_cache.CacheRedis._put_object_to_cache', mock_return_null)
+    monkeypatch.setattr('sqlalchemy.ext.asyncio.AsyncSession.execute', fail_execute)
+    headers = {'User-Agent': 'google'}
+
+    response = await ac.get(START_URL + "content/", params={'year': 1975}, headers=headers)
+    assert response.json() == {'year': 1975, 'allowed': True}
+    response = await ac.post(START_URL + "content/", json={'years': [1980, 1981]}, headers=headers)
+    assert response.json() == [{'year': 1980, 'allowed': True}, {'year': 1981, 'allowed': False}]
+
+    # измененная роль действует сразу, без обновления токенов
+    monkeypatch.setitem(role_snapshot.roles, role_id, RoleAccess(lvl=0, max_year=2000))
+    response = await ac.get(START_URL + "content/", params={'year': 1995}, headers=headers)
+    assert response.json() == {'year': 1995, 'allowed': True}
+
+    response = await ac.get(START_URL + "content/", params={'year': 1975}, headers={'User-Agent': 'yandex'})
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+async def test_role_claims_in_tokens(ac: AsyncClient, monkeypatch):
+    user = User(login='admin', password='admin', first_name='dima', last_name='ivanov', role_id=uuid4(),
+                email='test@mail.ru', is_admin=False)
+    user.id = uuid4()
+
+    async def mock_get_obj_by_attr_name(*args, **kwargs):
+        return user
+
+    async def mock_return_null(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr('services.user.BaseRepository.get_obj_by_attr_name', mock_get_obj_by_attr_name)
+    monkeypatch.setattr('services.user.BaseRepository.create_obj', mock_return_null)
+    monkeypatch.setattr('services.user.BaseRepository.get_obj_by_pk', mock_get_obj_by_attr_name)
+    monkeypatch.setitem(role_snapshot.roles, str(user.role_id), RoleAccess(lvl=1, max_year=1990))
+    redis = aioredis.FakeRedis(server=FakeServer())
+    app.dependency_overrides[get_redis] = lambda: redis
+    headers = {'User-Agent': 'google'}
+    try:
+        response = await ac.post("/api/v1/auth/login/", headers=headers, json={'login': 'admin', 'password': 'admin'})
+        cookies = dict(response.cookies)
+        ac.cookies.clear()
+        claims = jwt.decode(cookies['access_token_cookie'], options={'verify_signature': False})
+        assert (claims['role'], claims['lvl'], claims['max_year']) == (str(user.role_id), 1, 1990)
+
+        # при обновлении токенов параметры роли берутся из текущей копии таблицы ролей
+        monkeypatch.setitem(role_snapshot.roles, str(user.role_id), RoleAccess(lvl=1, max_year=2005))
+        response = await ac.post("/api/v1/auth/refresh/", headers=headers, cookies=cookies)
+        claims = jwt.decode(response.cookies['access_token_cookie'], options={'verify_signature': False})
+        assert claims['max_year'] == 2005
+    finally:
+        app.dependency_overrides.pop(get_redis)
+        ac.cookies.clear()
+
+
+async def test_change_level_reissues_current_session(ac: AsyncClient, monkeypatch):
+    basic = Role(lvl=1, name_role='basic', description='', max_year=1990)
+    premium = Role(lvl=2, name_role='premium', description='', max_year=2005)
+    basic.id, premium.id = uuid4(), uuid4()
+    user = User(login='admin', password='admin', first_name='dima', last_name='ivanov', role_id=basic.id,
+                email='test@mail.ru', is_admin=False)
+    user.id = uuid4()
+
+    async def mock_get_obj_by_attr_name(self, model, *args, **kwargs):
+        return premium if model is Role else user
+
+    async def mock_get_obj_by_pk(*args, **kwargs):
+        return user
+
+    async def mock_get_role(*args, **kwargs):
+        return basic
+
+    async def mock_return_null(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr('services.user.BaseRepository.get_obj_by_attr_name', mock_get_obj_by_attr_name)
+    monkeypatch.setattr('services.user.BaseRepository.get_obj_by_pk', mock_get_obj_by_pk)
+    monkeypatch.setattr('services.user.BaseRepository.create_obj', mock_return_null)
+    monkeypatch.setattr('services.role.BaseRole.get_role', mock_get_role)
+    monkeypatch.setattr('sqlalchemy.ext.asyncio.AsyncSession.commit', mock_return_null)
+    monkeypatch.setitem(role_snapshot.roles, str(basic.id), RoleAccess(lvl=1, max_year=1990))
+    monkeypatch.setitem(role_snapshot.roles, str(premium.id), RoleAccess(lvl=2, max_year=2005))
+    headers = {'User-Agent': 'google'}
+    try:
+        cookies = {}
+        for device in ('laptop', 'phone'):
+            response = await ac.post("/api/v1/auth/login/", headers=headers, json={'login': 'admin', 'password': 'admin'})
+            cookies[device] = dict(response.cookies)
+            ac.cookies.clear()
+
+        response = await ac.post("/api/v1/profil/change-level/", headers=headers, cookies=cookies['laptop'],
+                                 json={'level_up': True})
+        assert response.status_code == HTTPStatus.OK
+        new_cookies = dict(response.cookies)
+        ac.cookies.clear()
+        claims = jwt.decode(new_cookies['access_token_cookie'], options={'verify_signature': False})
+        assert (claims['role'], claims['max_year']) == (str(premium.id), 2005)
+        response = await ac.get(START_URL + "content/", params={'year': 2000}, headers=headers, cookies=new_cookies)
+        assert response.json() == {'year': 2000, 'allowed': True}
+        # токены сессии со старой ролью больше не принимаются
+        response = await ac.get(START_URL + "content/", params={'year': 1980}, headers=headers,
+                                cookies=cookies['laptop'])
+        assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+        ac.cookies.clear()
+        response = await ac.post("/api/v1/auth/refresh/", headers=headers, cookies=cookies['laptop'])
+        assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+        ac.cookies.clear()
+
+        # другие сессии не завершаются и получают новую роль при обновлении токенов
+        response = await ac.get(START_URL + "content/", params={'year': 1980}, headers=headers,
+                                cookies=cookies['phone'])
+        assert response.json() == {'year': 1980, 'allowed': True}
+        ac.cookies.clear()
+        response = await ac.post("/api/v1/auth/refresh/", headers=headers, cookies=cookies['phone'])
+        claims = jwt.decode(response.cookies['access_token_cookie'], options={'verify_signature': False})
+        assert claims['max_year'] == 2005
+        ac.cookies.clear()
+
+        # refresh токен сессии уже погашен: новые токены не записаны и не выдаются
+        response = await ac.post("/api/v1/profil/change-level/", headers=headers, cookies=cookies['phone'],
+                                 json={'level_up': True})
+        assert response.status_code == HTTPStatus.UNAUTHORIZED
+        assert 'refresh_token_cookie' not in response.cookies
+    finally:
+        ac.cookies.clear()
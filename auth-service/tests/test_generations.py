@@ -0,0 +1,92 @@
+from http import HTTPStatus
+from uuid import uuid4
+
+from fakeredis import FakeServer, aioredis
+from httpx import AsyncClient
+
+from db.redis import get_redis
+from main import app
+from models.entity import User
+from services.generations import generation_cache
+from services.redis_cache import CacheRedis
+
+START_URL = "/api/v1/auth/"
+
+
+async def test_logout_all_revokes_every_session(ac: AsyncClient, monkeypatch):
+    user = User(login='admin', password='admin', first_name='dima', last_name='ivanov', role_id=uuid4(),
+                email='test@mail.ru', is_admin=False)
+    user.id = uuid4()
+
+    async def mock_get_obj_by_attr_name(*args, **kwargs):
+        return user
+
+    async def mock_return_null(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr('services.user.BaseRepository.get_obj_by_attr_name', mock_get_obj_by_attr_name)
+    monkeypatch.setattr('services.user.BaseRepository.create_obj', mock_return_null)
+    redis = aioredis.FakeRedis(server=FakeServer())
+    app.dependency_overrides[get_redis] = lambda: redis
+    headers = {'User-Agent': 'google'}
+    try:
+        sessions = []
+        for _ in range(2):
+            response = await ac.post(START_URL + "login/", headers=headers, json={'login': 'admin', 'password': 'admin'})
+            assert response.status_code == HTTPStatus.OK
+            sessions.append(dict(response.cookies))
+            ac.cookies.clear()
+
+        response = await ac.get(START_URL + "get_user/", headers=headers, cookies=sessions[1])
+        assert response.status_code == HTTPStatus.OK
+        assert response.json()['gen'] == 0
+
+        response = await ac.post(START_URL + "logout_all/", headers=headers, cookies=sessions[0])
+        assert response.status_code == HTTPStatus.OK
+        ac.cookies.clear()
+
+        response = await ac.get(START_URL + "get_user/", headers=headers, cookies=sessions[1])
+        assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+        response = await ac.post(START_URL + "refresh/", headers=headers, cookies=sessions[1])
+        assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+        assert await redis.get(f'gen:{user.id}') == b'1'
+
+        # новый вход выдает токены текущего поколения
+        response = await ac.post(START_URL + "login/", headers=headers, json={'login': 'admin', 'password': 'admin'})
+        response = await ac.get(START_URL + "get_user/", headers=headers, cookies=dict(response.cookies))
+        assert response.status_code == HTTPStatus.OK
+        assert response.json()['gen'] == 1
+    finally:
+        app.dependency_overrides.pop(get_redis)
+        ac.cookies.clear()
+
+
+async def test_login_after_bump_in_other_worker(ac: AsyncClient, monkeypatch, fake_redis):
+    user = User(login='admin', password='admin', first_name='dima', last_name='ivanov', role_id=uuid4(),
+                email='test@mail.ru', is_admin=False)
+    user.id = uuid4()
+
+    async def mock_get_obj_by_attr_name(*args, **kwargs):
+        return user
+
+    async def mock_return_null(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr('services.user.BaseRepository.get_obj_by_attr_name', mock_get_obj_by_attr_name)
+    monkeypatch.setattr('services.user.BaseRepository.create_obj', mock_return_null)
+    headers = {'User-Agent': 'google'}
+    try:
+        # другой воркер завершил все сессии, в кеше этого воркера осталось старое поколение
+        assert await CacheRedis(fake_redis)._bump_generation(str(user.id)) == 1
+        generation_cache.put(str(user.id), 0)
+
+        response = await ac.post(START_URL + "login/", headers=headers, json={'login': 'admin', 'password': 'admin'})
+        cookies = dict(response.cookies)
+        ac.cookies.clear()
+        # кеш обновился: новый токен выпущен с текущим поколением и остается действительным
+        generation_cache.entries.pop(str(user.id))
+        response = await ac.get(START_URL + "get_user/", headers=headers, cookies=cookies)
+        assert response.status_code == HTTPStatus.OK
+        assert response.json()['gen'] == 1
+    finally:
+        ac.cookies.clear()
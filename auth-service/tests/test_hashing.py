@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+from core.metrics import metrics
+from services.hashing import HashingBusy, PasswordHasher
+
+
+@pytest.fixture
+async def hasher():
+    hasher = PasswordHasher(workers=1, queue_size=0)
+    await hasher.start()
+    yield hasher
+    hasher.stop()
+
+
+async def test_hash_and_verify_in_pool(hasher: PasswordHasher):
+    hashed_before = metrics.histograms['password_hash_seconds'].count
+
+    password_hash = await hasher.hash('admin')
+
+    assert await hasher.verify(password_hash, 'admin')
+    assert not await hasher.verify(password_hash, 'admin2')
+    assert metrics.histograms['password_hash_seconds'].count == hashed_before + 3
+    assert metrics.histograms['password_hash_queue_wait_seconds'].count >= 3
+    assert hasher.pending == 0
+
+
+async def test_saturated_pool_rejects(hasher: PasswordHasher):
+    rejected_before = metrics.counters['password_hash_rejected_total']
+
+    results = await asyncio.gather(hasher.hash('admin'), hasher.hash('admin'), return_exceptions=True)
+
+    assert isinstance(results[0], str)
+    assert isinstance(results[1], HashingBusy)
+    assert metrics.counters['password_hash_rejected_total'] == rejected_before + 1
+    assert hasher.pending == 0
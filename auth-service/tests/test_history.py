@@ -0,0 +1,139 @@
+import asyncio
+from collections import namedtuple
+from datetime import datetime, timedelta
+from http import HTTPStatus
+from uuid import uuid4
+
+import orjson
+from httpx import AsyncClient
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import OperationalError
+
+from db.postgres import get_session
+from main import app
+from models.entity import EventEnum, User
+from schemas.entity import HistoryFilter
+from services.history import BaseHistory, decode_cursor, encode_cursor
+
+START_URL = "/api/v1/profil/"
+
+HistoryRow = namedtuple('HistoryRow', ['id', 'time', 'browser', 'user_id', 'result', 'event_type'])
+
+
+class FakeResult:
+    def __init__(self, rows: list, chunk: int, fail_after: int | None = None, delay: float = 0):
+        self.rows = rows
+        self.chunk = chunk
+        self.fail_after = fail_after
+        self.delay = delay
+
+    async def partitions(self):
+        for start in range(0, len(self.rows), self.chunk):
+            if start // self.chunk == self.fail_after:
+                raise OperationalError('FETCH', {}, OSError('connection reset'))
+            await asyncio.sleep(self.delay)
+            yield self.rows[start:start + self.chunk]
+
+
+class FakeSession:
+    def __init__(self, rows: list, fail_after: int | None = None, delay: float = 0):
+        self.rows = rows
+        self.fail_after = fail_after
+        self.delay = delay
+        self.queries = []
+
+    async def execute(self, query):
+        self.queries.append(query)
+        return self.rows
+
+    async def stream(self, query):
+        self.queries.append(query)
+        return FakeResult(self.rows, query.get_execution_options()['yield_per'], self.fail_after, self.delay)
+
+
+def test_cursor_and_keyset_query():
+    cursor = (datetime(2023, 8, 1, 14, 42, 8, 953124), uuid4())
+    assert decode_cursor(encode_cursor(*cursor)) == cursor
+
+    query = BaseHistory._history_query(uuid4(), HistoryFilter(event_type=EventEnum.login, result=False), cursor)
+    sql = str(query.compile(dialect=postgresql.dialect()))
+    # страница начинается с позиции курсора в индексе, без OFFSET
+    assert '(login_history.time, login_history.id) < (' in sql
+    # секции новее курсора отсекаются по ключу секционирования
+    assert 'login_history.time <=' in sql
+    assert sql.endswith('ORDER BY login_history.time DESC, login_history.id DESC')
+    assert 'login_history.event_type =' in sql and 'login_history.result =' in sql
+    assert 'OFFSET' not in sql
+
+
+async def test_history_pages_and_stream(ac: AsyncClient, monkeypatch):
+    user = User(login='admin', password='admin', first_name='dima', last_name='ivanov', role_id=uuid4(),
+                email='test@mail.ru', is_admin=False)
+    user.id = uuid4()
+    now = datetime.utcnow()
+    rows = [HistoryRow(uuid4(), now - timedelta(minutes=index), 'google', user.id, True, EventEnum.login)
+            for index in range(5)]
+
+    async def mock_info_from_access_token(*args, **kwargs):
+        return {'sub': str(user.id)}
+
+    async def mock_get_obj_by_pk(*args, **kwargs):
+        return user
+
+    monkeypatch.setattr('services.user.BaseAuth.get_info_from_access_token', mock_info_from_access_token)
+    monkeypatch.setattr('services.repository.BaseRepository.get_obj_by_pk', mock_get_obj_by_pk)
+    monkeypatch.setattr('services.history.app_settings.history_stream_chunk', 2)
+    session = FakeSession(rows[:3])
+    app.dependency_overrides[get_session] = lambda: session
+    try:
+        response = await ac.get(START_URL + "get_history/", params={'limit': 2})
+        assert response.status_code == HTTPStatus.OK
+        assert [item['id'] for item in response.json()] == [str(row.id) for row in rows[:2]]
+        # лишняя строка только показывает, что есть следующая страница
+        assert decode_cursor(response.headers['X-Next-Cursor']) == (rows[1].time, rows[1].id)
+        assert session.queries[-1]._limit == 3
+
+        response = await ac.get(START_URL + "get_history/", params={'after': 'not a cursor'})
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+
+        session.rows = rows
+        response = await ac.get(
+            START_URL + "get_history/", params={'after': encode_cursor(now, uuid4())},
+            headers={'Accept': 'application/x-ndjson'}
+        )
+        assert response.status_code == HTTPStatus.OK
+        assert response.headers['content-type'] == 'application/x-ndjson'
+        lines = [orjson.loads(line) for line in response.text.splitlines()]
+        assert [line['id'] for line in lines] == [str(row.id) for row in rows]
+        assert lines[0]['event_type'] == 'login'
+        # выгрузка ограничена своим бюджетом, а не бюджетом запроса
+        assert 'statement_timeout = 300000' in str(session.queries[-2])
+
+        # время с часовым поясом сравнивается с login_history.time как UTC без пояса
+        response = await ac.get(START_URL + "get_history/", params={'since': '2024-01-01T03:00:00+03:00'})
+        assert response.status_code == HTTPStatus.OK
+        since = session.queries[-1].compile(dialect=postgresql.dialect()).params['time_1']
+        assert since == datetime(2024, 1, 1) and since.tzinfo is None
+
+        # прерванная выгрузка заканчивается строкой с ошибкой и курсором продолжения
+        session.fail_after = 1
+        response = await ac.get(START_URL + "get_history/", headers={'Accept': 'application/x-ndjson'})
+        lines = [orjson.loads(line) for line in response.text.splitlines()]
+        assert [line['id'] for line in lines[:-1]] == [str(row.id) for row in rows[:2]]
+        assert lines[-1]['error'] == 'database'
+        assert decode_cursor(lines[-1]['after']) == (rows[1].time, rows[1].id)
+
+        # бюджет запроса меньше времени выгрузки: выгрузка не прерывается
+        session.fail_after, session.delay = None, 0.03
+        response = await ac.get(START_URL + "get_history/", headers={
+            'Accept': 'application/x-ndjson', 'X-Request-Deadline-Ms': '50'
+        })
+        assert [orjson.loads(line)['id'] for line in response.text.splitlines()] == [str(row.id) for row in rows]
+
+        monkeypatch.setattr('services.history.app_settings.history_stream_timeout', 0.05)
+        response = await ac.get(START_URL + "get_history/", headers={'Accept': 'application/x-ndjson'})
+        lines = [orjson.loads(line) for line in response.text.splitlines()]
+        assert lines[-1]['error'] == 'timeout'
+        assert len(lines) < len(rows) + 1
+    finally:
+        app.dependency_overrides.pop(get_session)
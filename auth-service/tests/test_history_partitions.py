@@ -0,0 +1,62 @@
+from datetime import date
+
+from services.history_partitions import add_months, create_partitions, drop_partitions, partition_name
+
+
+class FakeSession:
+    def __init__(self, partitions: list[str]):
+        self.partitions = partitions
+        self.statements = []
+        self.committed = False
+
+    async def execute(self, statement, params=None):
+        sql = str(statement)
+        if 'pg_inherits' in sql:
+            return [(name,) for name in self.partitions]
+        self.statements.append(sql)
+        if sql.startswith('CREATE TABLE'):
+            self.partitions.append(sql.split()[2])
+        if sql.startswith('DROP TABLE'):
+            self.partitions.remove(sql.split()[2])
+
+    async def commit(self):
+        self.committed = True
+
+
+def test_months():
+    assert add_months(date(2023, 11, 1), 3) == date(2024, 2, 1)
+    assert add_months(date(2023, 1, 1), -13) == date(2021, 12, 1)
+    assert partition_name(date(2023, 8, 1)) == 'login_history_y2023m08'
+
+
+async def test_create_future_partitions():
+    session = FakeSession(['login_history_y2023m11'])
+    created = await create_partitions(session, months_ahead=2, today=date(2023, 11, 20))
+    assert created == ['login_history_y2023m12', 'login_history_y2024m01']
+    assert session.statements[0].startswith('SELECT pg_advisory_xact_lock')
+    assert "PARTITION OF login_history FOR VALUES FROM ('2023-12-01') TO ('2024-01-01')" in session.statements[2]
+    assert session.committed
+
+    # секции уже есть: ни блокировки, ни DDL
+    session.statements.clear()
+    assert await create_partitions(session, months_ahead=2, today=date(2023, 11, 20)) == []
+    assert session.statements == []
+
+
+async def test_retention_drops_whole_partitions():
+    partitions = [partition_name(add_months(date(2023, 1, 1), offset)) for offset in range(12)]
+    session = FakeSession(list(partitions))
+
+    # хранится текущий месяц и 6 полных месяцев до него
+    assert await drop_partitions(session, keep_months=6, dry_run=True, today=date(2023, 12, 5)) == partitions[:5]
+    assert session.statements == []
+
+    dropped = await drop_partitions(session, keep_months=6, today=date(2023, 12, 5))
+    assert dropped == partitions[:5]
+    assert session.partitions == partitions[5:]
+    assert 'ALTER TABLE login_history DETACH PARTITION login_history_y2023m01' in session.statements
+    assert not any('DELETE' in sql for sql in session.statements)
+
+    session = FakeSession(list(partitions))
+    await drop_partitions(session, keep_months=6, detach=True, today=date(2023, 12, 5))
+    assert not any(sql.startswith('DROP TABLE') for sql in session.statements)
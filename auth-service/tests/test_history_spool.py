@@ -0,0 +1,159 @@
+import asyncio
+import os
+from collections import OrderedDict
+from uuid import uuid4
+
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from core.metrics import metrics
+from models.entity import EventEnum
+from services.history import BaseHistory
+from services.history_spool import HistorySpool, read_records
+from services.history_writer import history_row
+from services.user_agents import user_agent_cache
+
+
+@pytest.fixture(autouse=True)
+def user_agent_ids(monkeypatch):
+    # id строки User-Agent уже в памяти: запись истории не обращается к user_agents
+    monkeypatch.setattr(user_agent_cache, 'ids', OrderedDict(google=1))
+
+
+class FakeSession:
+    def __init__(self, inserted: dict, fail: bool = False, reject: set = frozenset()):
+        self.inserted = inserted
+        self.fail = fail
+        self.reject = reject
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def execute(self, statement, rows):
+        if self.fail:
+            raise OperationalError('INSERT', {}, OSError('connection refused'))
+        if any(row['id'] in self.reject for row in rows):
+            raise IntegrityError('INSERT', {}, ValueError('violates foreign key constraint'))
+        assert 'ON CONFLICT (id, time) DO NOTHING' in str(statement.compile(dialect=postgresql.dialect()))
+        for row in rows:
+            self.inserted.setdefault(row['id'], row)
+
+    async def commit(self):
+        pass
+
+
+@pytest.fixture
+def spool(tmp_path) -> HistorySpool:
+    return HistorySpool(directory=str(tmp_path), replay_interval=60, batch_size=2)
+
+
+def make_rows(count: int) -> list[dict]:
+    return [history_row(str(uuid4()), 'google', EventEnum.refresh, bool(index % 2)) for index in range(count)]
+
+
+def test_records_round_trip_and_corruption(spool: HistorySpool):
+    rows = make_rows(3)
+    spool.append(rows[:2])
+    spool.append(rows[2:])
+    assert read_records(spool.path) == (rows, 0)
+
+    with open(spool.path, 'r+b') as file:
+        data = bytearray(file.read())
+        # порча тела первой записи и недописанная запись в конце
+        data[10] ^= 0xFF
+        file.seek(0)
+        file.write(data + data[:12])
+    spooled, skipped = read_records(spool.path)
+    assert spooled == rows[1:]
+    assert skipped == 2
+
+
+async def test_replay_is_idempotent(spool: HistorySpool):
+    inserted = {}
+    rows = make_rows(5)
+    spool.append(rows)
+
+    # БД недоступна: файл остается до следующей попытки, новые события пишутся в новый файл
+    spool.session_factory = lambda: FakeSession(inserted, fail=True)
+    with pytest.raises(OperationalError):
+        await spool.replay()
+    spool.append(rows[:1])
+    assert len(os.listdir(spool.directory)) == 2
+
+    spool.session_factory = lambda: FakeSession(inserted)
+    replayed_before = metrics.counters['history_replayed_rows_total']
+    assert await spool.replay() == 6
+    assert metrics.counters['history_replayed_rows_total'] == replayed_before + 6
+    # повторная строка не дублируется
+    assert sorted(inserted) == sorted(row['id'] for row in rows)
+    assert os.listdir(spool.directory) == []
+    assert await spool.replay() == 0
+
+
+async def test_rejected_rows_go_to_dead_file(spool: HistorySpool):
+    inserted = {}
+    rows = make_rows(5)
+    spool.append(rows)
+    # пользователя второго и пятого события уже нет: их пакеты отклоняются целиком
+    spool.session_factory = lambda: FakeSession(inserted, reject={rows[1]['id'], rows[4]['id']})
+    dead_before = metrics.counters['history_spool_dead_rows_total']
+
+    assert await spool.replay() == 3
+    assert sorted(inserted) == sorted(row['id'] for row in (rows[0], rows[2], rows[3]))
+    assert read_records(spool.dead_path) == ([rows[1], rows[4]], 0)
+    assert metrics.counters['history_spool_dead_rows_total'] == dead_before + 2
+    # файл перенесен, отклоненные события больше не переносятся
+    assert os.listdir(spool.directory) == ['history.spool.dead']
+    assert await spool.replay() == 0
+
+
+async def test_history_write_falls_back_to_spool(tmp_path, monkeypatch):
+    async def mock_create_obj(*args, **kwargs):
+        raise OperationalError('INSERT', {}, OSError('connection refused'))
+
+    monkeypatch.setattr('services.history.history_spool.directory', str(tmp_path))
+    monkeypatch.setattr('services.history.BaseHistory.create_obj', mock_create_obj)
+    user_id = uuid4()
+
+    # ошибка БД не прерывает вход
+    await BaseHistory(session=None).write_entry_history(user_id, 'google', EventEnum.login, True)
+
+    spooled, _ = read_records(os.path.join(str(tmp_path), 'history.spool'))
+    assert [(row['user_id'], row['event_type']) for row in spooled] == [(user_id, EventEnum.login)]
+
+
+async def test_replay_task_survives_unexpected_errors(spool: HistorySpool, monkeypatch):
+    calls = []
+
+    async def failing_replay():
+        calls.append(1)
+        raise ValueError('unexpected')
+
+    monkeypatch.setattr(spool, 'replay_interval', 0.01)
+    monkeypatch.setattr(spool, 'replay', failing_replay)
+    errors_before = metrics.counters['history_replay_errors_total']
+    await spool.start(lambda: None)
+    await asyncio.sleep(0.05)
+    assert not spool.task.done()
+    await spool.stop()
+    assert len(calls) >= 2
+    assert metrics.counters['history_replay_errors_total'] - errors_before == len(calls)
+
+
+async def test_history_write_survives_unwritable_spool(tmp_path, monkeypatch):
+    async def mock_create_obj(*args, **kwargs):
+        raise OperationalError('INSERT', {}, OSError('connection refused'))
+
+    (tmp_path / 'spool').write_text('')
+    monkeypatch.setattr('services.history.history_spool.directory', str(tmp_path / 'spool' / 'auth'))
+    monkeypatch.setattr('services.history.BaseHistory.create_obj', mock_create_obj)
+    dropped_before = metrics.counters['history_spool_dropped_rows_total']
+
+    # ни БД, ни файл недоступны: вход все равно не прерывается
+    await BaseHistory(session=None).write_entry_history(uuid4(), 'google', EventEnum.login, True)
+
+    assert metrics.counters['history_spool_dropped_rows_total'] == dropped_before + 1
@@ -0,0 +1,131 @@
+import asyncio
+from collections import OrderedDict
+from uuid import uuid4
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from core.metrics import metrics
+from models.entity import EventEnum
+from services.history_spool import history_spool, read_records
+from services.history_writer import HistoryWriter, history_row
+from services.user_agents import user_agent_cache
+
+
+@pytest.fixture(autouse=True)
+def user_agent_ids(monkeypatch):
+    # id строки User-Agent уже в памяти: запись истории не обращается к user_agents
+    monkeypatch.setattr(user_agent_cache, 'ids', OrderedDict(google=1))
+
+
+class FakeSession:
+    def __init__(self, flushes: list, fail: bool = False, error: Exception | None = None):
+        self.flushes = flushes
+        self.fail = fail
+        self.error = error
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def execute(self, statement, rows):
+        if self.fail:
+            raise OperationalError('INSERT', {}, OSError('connection refused'))
+        if self.error is not None:
+            raise self.error
+        assert statement.table.name == 'login_history'
+        self.flushes.append(rows)
+
+    async def commit(self):
+        pass
+
+
+def submit(writer: HistoryWriter, count: int) -> None:
+    for _ in range(count):
+        assert writer.submit(history_row(str(uuid4()), 'google', EventEnum.login, True))
+
+
+async def test_flush_by_size_and_time():
+    flushes = []
+    writer = HistoryWriter(batch_size=3, flush_interval=0.05, queue_size=100)
+    await writer.start(lambda: FakeSession(flushes))
+
+    submit(writer, 4)
+    await asyncio.sleep(0.01)
+    # три события сразу, четвертое ждет flush_interval
+    assert [len(rows) for rows in flushes] == [3]
+    await asyncio.sleep(0.1)
+    assert [len(rows) for rows in flushes] == [3, 1]
+    assert flushes[1][0]['event_type'] is EventEnum.login
+    assert flushes[1][0]['user_agent_id'] == 1 and 'browser' not in flushes[1][0]
+    await writer.stop()
+
+
+async def test_stop_drains_queue():
+    flushes = []
+    writer = HistoryWriter(batch_size=100, flush_interval=60, queue_size=100)
+    await writer.start(lambda: FakeSession(flushes))
+    submit(writer, 5)
+    await writer.stop()
+    assert sum(len(rows) for rows in flushes) == 5
+    # после остановки события пишет вызывающий
+    assert not writer.submit(history_row(str(uuid4()), 'google', EventEnum.login, True))
+
+
+async def test_full_queue_and_flush_errors_go_to_spool(tmp_path, monkeypatch):
+    monkeypatch.setattr(history_spool, 'directory', str(tmp_path))
+    writer = HistoryWriter(batch_size=10, flush_interval=60, queue_size=2)
+    assert not writer.submit(history_row(str(uuid4()), 'google', EventEnum.login, True))
+
+    await writer.start(lambda: FakeSession([], fail=True))
+    full_before = metrics.counters['history_queue_full_total']
+    errors_before = metrics.counters['history_flush_errors_total']
+    rows = [history_row(str(uuid4()), 'google', EventEnum.login, True) for _ in range(3)]
+    for row in rows:
+        assert writer.submit(row)
+    # очередь заполнена, пока писатель не забрал события: третье событие сразу уходит в файл
+    assert metrics.counters['history_queue_full_total'] == full_before + 1
+    await writer.stop()
+    assert metrics.counters['history_flush_errors_total'] == errors_before + 1
+
+    spooled, skipped = read_records(history_spool.path)
+    assert skipped == 0
+    assert sorted(row['id'] for row in spooled) == sorted(row['id'] for row in rows)
+
+
+async def test_missing_user_agent_and_unexpected_errors(tmp_path, monkeypatch):
+    monkeypatch.setattr(history_spool, 'directory', str(tmp_path))
+    user_agent_cache.put('', 2)
+    # запрос без заголовка User-Agent
+    row = history_row(str(uuid4()), None, EventEnum.login, True)
+    assert row['browser'] == ''
+
+    flushes = []
+    sessions = iter([FakeSession(flushes, error=ValueError('unexpected')), FakeSession(flushes)])
+    writer = HistoryWriter(batch_size=1, flush_interval=60, queue_size=10)
+    await writer.start(lambda: next(sessions))
+    assert writer.submit(row)
+    await asyncio.sleep(0.01)
+    # неожиданная ошибка не останавливает запись: пакет отложен в файл, следующий записан
+    assert not writer.task.done()
+    assert writer.submit(history_row(str(uuid4()), None, EventEnum.logout, True))
+    await writer.stop()
+    assert [rows[0]['user_agent_id'] for rows in flushes] == [2]
+    assert [spooled['id'] for spooled in read_records(history_spool.path)[0]] == [row['id']]
+
+
+async def test_unwritable_spool_never_fails_submit(tmp_path, monkeypatch):
+    # каталог файла нельзя создать: на его месте обычный файл
+    (tmp_path / 'spool').write_text('')
+    monkeypatch.setattr(history_spool, 'directory', str(tmp_path / 'spool' / 'auth'))
+    dropped_before = metrics.counters['history_spool_dropped_rows_total']
+    writer = HistoryWriter(batch_size=10, flush_interval=60, queue_size=1)
+    await writer.start(lambda: FakeSession([], fail=True))
+
+    submit(writer, 3)
+    await writer.stop()
+    # строка из переполненной очереди и пакет с ошибкой записи в БД потеряны, но учтены
+    assert metrics.counters['history_spool_dropped_rows_total'] - dropped_before >= 2
+    assert not writer.spooling
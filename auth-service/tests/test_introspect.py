@@ -0,0 +1,88 @@
+from http import HTTPStatus
+from uuid import uuid4
+
+import pytest
+from async_fastapi_jwt_auth import AuthJWT
+from fakeredis import FakeServer, aioredis
+from httpx import AsyncClient
+
+from core.config import app_settings
+from db.redis import get_redis
+from main import app
+from services.auth_jwt import user_agent_fingerprint
+from services.redis_cache import CacheRedis
+
+START_URL = "/api/v1/auth/"
+SERVICE_HEADERS = {'X-Service-Token': 'service-secret'}
+
+
+@pytest.fixture(autouse=True)
+def introspect_token(monkeypatch):
+    monkeypatch.setattr(app_settings, 'introspect_token', 'service-secret')
+
+
+async def test_introspect_batch(ac: AsyncClient, monkeypatch):
+    redis = aioredis.FakeRedis(server=FakeServer())
+    cache = CacheRedis(redis)
+    app.dependency_overrides[get_redis] = lambda: redis
+    user_id, logged_out_user_id = str(uuid4()), str(uuid4())
+    claims = {'uaf': user_agent_fingerprint('google'), 'is_admin': False}
+    valid = await AuthJWT().create_access_token(subject=user_id, user_claims=claims)
+    revoked = await AuthJWT().create_access_token(subject=user_id, user_claims=claims)
+    await cache._put_object_to_cache(await AuthJWT().get_jti(revoked), 60)
+    old_generation = await AuthJWT().create_access_token(subject=logged_out_user_id, user_claims=claims)
+    await cache._bump_generation(logged_out_user_id)
+    refresh = await AuthJWT().create_refresh_token(subject=user_id, user_claims=claims)
+
+    commands = []
+    execute = redis.pipeline().__class__.execute
+
+    async def count_execute(pipe, *args, **kwargs):
+        commands.append(len(pipe.command_stack))
+        return await execute(pipe, *args, **kwargs)
+
+    monkeypatch.setattr(redis.pipeline().__class__, 'execute', count_execute)
+    try:
+        response = await ac.post(START_URL + "introspect/", headers=SERVICE_HEADERS, json={'tokens': [
+            {'token': valid, 'user_agent': 'google'},
+            {'token': valid, 'user_agent': 'yandex'},
+            {'token': revoked, 'user_agent': 'google'},
+            {'token': old_generation, 'user_agent': 'google'},
+            {'token': refresh, 'user_agent': 'google'},
+            {'token': 'not.a.token', 'user_agent': 'google'},
+        ]})
+    finally:
+        app.dependency_overrides.pop(get_redis)
+
+    assert response.status_code == HTTPStatus.OK
+    results = response.json()
+    assert results[0]['active'] and results[0]['claims']['sub'] == user_id
+    assert [(result['active'], result['error']) for result in results[1:]] == [
+        (False, 'UnsafeEntry'),
+        (False, 'InvalidAccessToken'),
+        (False, 'InvalidAccessToken'),
+        (False, 'InvalidAccessToken'),
+        (False, 'InvalidAccessToken'),
+    ]
+    # одно обращение к Redis на весь пакет
+    assert len(commands) == 1
+
+
+async def test_introspect_batch_size_limit(ac: AsyncClient):
+    tokens = [{'token': 'token'}] * (app_settings.introspect_batch_size + 1)
+    response = await ac.post(START_URL + "introspect/", headers=SERVICE_HEADERS, json={'tokens': tokens})
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+async def test_introspect_requires_service_token(ac: AsyncClient, monkeypatch):
+    response = await ac.post(START_URL + "introspect/", json={'tokens': []})
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+    response = await ac.post(START_URL + "introspect/", headers={'X-Service-Token': 'guess'}, json={'tokens': []})
+    assert response.status_code == HTTPStatus.FORBIDDEN
+    response = await ac.post(START_URL + "introspect/", headers=SERVICE_HEADERS, json={'tokens': []})
+    assert response.status_code == HTTPStatus.OK
+
+    # токен сервисов не задан: пакетная проверка отключена
+    monkeypatch.setattr(app_settings, 'introspect_token', None)
+    response = await ac.post(START_URL + "introspect/", headers=SERVICE_HEADERS, json={'tokens': []})
+    assert response.status_code == HTTPStatus.FORBIDDEN
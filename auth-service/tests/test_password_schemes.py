@@ -0,0 +1,53 @@
+from http import HTTPStatus
+from uuid import uuid4
+
+from httpx import AsyncClient
+from werkzeug.security import generate_password_hash
+
+from models.entity import User
+from services.password_schemes import Argon2Scheme, PasswordSchemes, WerkzeugScheme, password_schemes
+
+START_URL = "/api/v1/auth/"
+
+
+def test_legacy_werkzeug_hash_verifies_and_needs_rehash():
+    legacy_hash = generate_password_hash('admin')
+
+    assert password_schemes.verify(legacy_hash, 'admin')
+    assert not password_schemes.verify(legacy_hash, 'admin2')
+    assert password_schemes.needs_rehash(legacy_hash)
+
+
+def test_argon2_outdated_parameters_need_rehash():
+    weak = Argon2Scheme(time_cost=1, memory_cost=8192, parallelism=1)
+    schemes = PasswordSchemes(
+        [Argon2Scheme(time_cost=2, memory_cost=8192, parallelism=1), WerkzeugScheme()], default='argon2id'
+    )
+
+    assert schemes.verify(weak.hash('admin'), 'admin')
+    assert schemes.needs_rehash(weak.hash('admin'))
+    assert not schemes.needs_rehash(schemes.hash('admin'))
+    assert not schemes.verify('unknown$hash', 'admin')
+
+
+async def test_login_rehashes_legacy_password(ac: AsyncClient, monkeypatch):
+    user = User(login='admin', password=None, first_name='dima', last_name='ivanov', role_id=uuid4(),
+                email='test@mail.ru', is_admin=False, password_hash=generate_password_hash('admin'))
+    user.id = uuid4()
+
+    async def mock_get_obj_by_attr_name(*args, **kwargs):
+        return user
+
+    async def mock_return_null(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr('services.user.BaseRepository.get_obj_by_attr_name', mock_get_obj_by_attr_name)
+    monkeypatch.setattr('services.user.BaseRepository.create_obj', mock_return_null)
+    monkeypatch.setattr('services.user.CacheRedis._store_session', mock_return_null)
+
+    response = await ac.post(START_URL + "login/", json={'login': 'admin', 'password': 'admin'})
+
+    assert response.status_code == HTTPStatus.OK
+    assert user.password.startswith('$argon2id$')
+    assert password_schemes.verify(user.password, 'admin')
+    ac.cookies.clear()
@@ -0,0 +1,72 @@
+from http import HTTPStatus
+from uuid import uuid4
+
+import pytest
+from fakeredis import FakeServer, aioredis
+from httpx import AsyncClient
+
+from core.config import app_settings
+from core.metrics import metrics
+from depends import get_rate_limiter
+from main import app
+from models.entity import User
+from services.rate_limit import RateLimiter
+
+START_URL = "/api/v1/auth/"
+
+
+@pytest.fixture
+def rate_limiter():
+    rate_limiter = RateLimiter(aioredis.FakeRedis(server=FakeServer()))
+    app.dependency_overrides[get_rate_limiter] = lambda: rate_limiter
+    yield rate_limiter
+    app.dependency_overrides.pop(get_rate_limiter)
+
+
+async def test_sliding_window(rate_limiter: RateLimiter):
+    limits = [('login:admin', 2, 60), ('login_ip:127.0.0.1', 10, 60)]
+
+    assert await rate_limiter.hit('login', limits) == 0
+    assert await rate_limiter.hit('login', limits) == 0
+    retry_after = await rate_limiter.hit('login', limits)
+
+    assert 0 < retry_after <= 60
+    # отклоненная попытка не занимает место в окнах
+    assert await rate_limiter.redis.zcard('rate_limit:login_ip:127.0.0.1') == 2
+    assert await rate_limiter.hit('login', [('login:other', 2, 60), ('login_ip:127.0.0.1', 10, 60)]) == 0
+
+
+async def test_redis_unavailable_allows():
+    server = FakeServer()
+    server.connected = False
+    errors_before = metrics.counters['rate_limit_errors_total']
+
+    assert await RateLimiter(aioredis.FakeRedis(server=server)).hit('login', [('login:admin', 1, 60)]) == 0
+    assert metrics.counters['rate_limit_errors_total'] == errors_before + 1
+
+
+async def test_login_rejected_before_db(rate_limiter: RateLimiter, ac: AsyncClient, monkeypatch):
+    calls = []
+
+    async def mock_get_obj_by_attr_name(*args, **kwargs):
+        calls.append(args)
+        return User(login='admin', password='admin', first_name='dima', last_name='ivanov', role_id=uuid4(),
+                    email='test@mail.ru', is_admin=False)
+
+    async def mock_return_null(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr('services.user.BaseRepository.get_obj_by_attr_name', mock_get_obj_by_attr_name)
+    monkeypatch.setattr('services.user.BaseRepository.create_obj', mock_return_null)
+    monkeypatch.setattr('services.user.CacheRedis._store_session', mock_return_null)
+    monkeypatch.setattr(app_settings, 'login_attempts_per_login', 1)
+    rejected_before = metrics.counters['rate_limit_rejected_total:login']
+
+    response = await ac.post(START_URL + "login/", json={'login': 'admin', 'password': 'admin2'})
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+    response = await ac.post(START_URL + "login/", json={'login': 'admin', 'password': 'admin'})
+    assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    assert 0 < int(response.headers['retry-after']) <= app_settings.login_window
+    assert len(calls) == 1
+    assert metrics.counters['rate_limit_rejected_total:login'] == rejected_before + 1
@@ -0,0 +1,63 @@
+import asyncio
+from uuid import uuid4
+
+import pytest
+from fakeredis import FakeServer, aioredis
+
+from core.metrics import metrics
+from services.redis_cache import CacheRedis, DENYLIST, cache_key, denylist_keys
+from services.revocation_filter import BloomFilter, RevocationFilter, revocation_filter
+
+
+async def wait_for(condition, timeout: float = 2):
+    for _ in range(int(timeout / 0.02)):
+        if condition():
+            return
+        await asyncio.sleep(0.02)
+    pytest.fail('condition not reached')
+
+
+def test_bloom_filter():
+    bloom = BloomFilter(capacity=1000, error_rate=0.001)
+    members = [uuid4().bytes for _ in range(1000)]
+    for member in members:
+        bloom.add(member)
+
+    assert all(member in bloom for member in members)
+    assert sum(uuid4().bytes in bloom for _ in range(10000)) < 100
+
+
+async def test_revocations_reach_other_workers():
+    server = FakeServer()
+    revoked_before_start = str(uuid4())
+    await CacheRedis(aioredis.FakeRedis(server=server))._put_object_to_cache(revoked_before_start, 60)
+    worker = RevocationFilter(capacity=1000, error_rate=0.001, rebuild_interval=0.2)
+    await worker.start(aioredis.FakeRedis(server=server), denylist_keys)
+    try:
+        await wait_for(lambda: worker.ready)
+        assert worker.might_contain(cache_key(revoked_before_start, DENYLIST))
+        assert not worker.might_contain(cache_key(str(uuid4()), DENYLIST))
+
+        # отзыв в другом воркере приходит через pub/sub
+        revoked = str(uuid4())
+        await CacheRedis(aioredis.FakeRedis(server=server))._put_object_to_cache(revoked, 60)
+        await wait_for(lambda: cache_key(revoked, DENYLIST) in worker.filter)
+
+        # истекший ключ пропадает после пересборки
+        expiring = cache_key(str(uuid4()), DENYLIST)
+        await worker.redis.set(expiring, b'1', px=100)
+        worker.add(expiring)
+        await wait_for(lambda: expiring not in worker.filter)
+        assert worker.might_contain(cache_key(revoked, DENYLIST))
+    finally:
+        await worker.stop()
+    assert not worker.ready
+
+
+async def test_filter_miss_skips_redis(monkeypatch):
+    monkeypatch.setattr(revocation_filter, 'ready', True)
+    negatives_before = metrics.counters['denylist_filter_negative_total']
+
+    # redis=None: обращение к Redis упало бы с ошибкой
+    assert not await CacheRedis(None)._object_from_cache(str(uuid4()))
+    assert metrics.counters['denylist_filter_negative_total'] == negatives_before + 1
@@ -0,0 +1,93 @@
+from http import HTTPStatus
+from uuid import uuid4
+
+from fakeredis import FakeServer, aioredis
+from httpx import AsyncClient
+
+from db.redis import get_redis
+from main import app
+from models.entity import User
+from services.redis_cache import CacheRedis
+
+START_URL = "/api/v1/auth/"
+PROFIL_URL = "/api/v1/profil/"
+
+
+async def test_store_session_replaces_refresh_token_once():
+    cache = CacheRedis(aioredis.FakeRedis(server=FakeServer()))
+    user_id = str(uuid4())
+
+    assert await cache._store_session(user_id, 'sid', 'google', 'jti-1', 'refresh.token.1')
+    assert await cache._store_session(user_id, 'sid', 'google', 'jti-2', 'refresh.token.2',
+                                      old_refresh_token='refresh.token.1')
+    # повторное погашение того же токена ничего не меняет
+    assert not await cache._store_session(user_id, 'sid', 'google', 'jti-3', 'refresh.token.3',
+                                          old_refresh_token='refresh.token.1')
+
+    sessions = await cache._list_sessions(user_id)
+    assert [(session_id, info[0], info[2]) for session_id, _, info in sessions] == [('sid', 'google', 'jti-2')]
+    assert await cache._consume_object_from_cache('refresh.token.2', namespace='rt')
+    assert not await cache._consume_object_from_cache('refresh.token.3', namespace='rt')
+
+
+async def test_list_and_revoke_sessions(ac: AsyncClient, monkeypatch):
+    user = User(login='admin', password='admin', first_name='dima', last_name='ivanov', role_id=uuid4(),
+                email='test@mail.ru', is_admin=False)
+    user.id = uuid4()
+
+    async def mock_get_obj_by_attr_name(*args, **kwargs):
+        return user
+
+    async def mock_return_null(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr('services.user.BaseRepository.get_obj_by_attr_name', mock_get_obj_by_attr_name)
+    monkeypatch.setattr('services.user.BaseRepository.get_obj_by_pk', mock_get_obj_by_attr_name)
+    monkeypatch.setattr('services.user.BaseRepository.create_obj', mock_return_null)
+    redis = aioredis.FakeRedis(server=FakeServer())
+    app.dependency_overrides[get_redis] = lambda: redis
+    laptop, phone = {'User-Agent': 'laptop'}, {'User-Agent': 'phone'}
+    try:
+        cookies = {}
+        for headers in (laptop, phone):
+            response = await ac.post(START_URL + "login/", headers=headers, json={'login': 'admin', 'password': 'admin'})
+            assert response.status_code == HTTPStatus.OK
+            cookies[headers['User-Agent']] = dict(response.cookies)
+            ac.cookies.clear()
+
+        response = await ac.get(PROFIL_URL + "sessions/", headers=laptop, cookies=cookies['laptop'])
+        assert response.status_code == HTTPStatus.OK
+        sessions = {item['user_agent']: item for item in response.json()}
+        assert sessions.keys() == {'laptop', 'phone'}
+        assert sessions['laptop']['current'] and not sessions['phone']['current']
+
+        # обновление токенов сохраняет сессию
+        response = await ac.post(START_URL + "refresh/", headers=laptop, cookies=cookies['laptop'])
+        assert response.status_code == HTTPStatus.OK
+        cookies['laptop'] = dict(response.cookies)
+        ac.cookies.clear()
+        response = await ac.get(PROFIL_URL + "sessions/", headers=laptop, cookies=cookies['laptop'])
+        assert {item['session_id'] for item in response.json()} == {item['session_id'] for item in sessions.values()}
+
+        response = await ac.delete(
+            PROFIL_URL + f"sessions/{sessions['phone']['session_id']}/", headers=laptop, cookies=cookies['laptop']
+        )
+        assert response.status_code == HTTPStatus.OK
+        response = await ac.delete(
+            PROFIL_URL + f"sessions/{sessions['phone']['session_id']}/", headers=laptop, cookies=cookies['laptop']
+        )
+        assert response.status_code == HTTPStatus.NOT_FOUND
+
+        # access и refresh токены завершенной сессии больше не действуют
+        response = await ac.get(START_URL + "get_user/", headers=phone, cookies=cookies['phone'])
+        assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+        response = await ac.post(START_URL + "refresh/", headers=phone, cookies=cookies['phone'])
+        assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+        ac.cookies.clear()
+
+        response = await ac.get(START_URL + "logout/", headers=laptop, cookies=cookies['laptop'])
+        assert response.status_code == HTTPStatus.OK
+        assert await CacheRedis(redis)._list_sessions(str(user.id)) == []
+    finally:
+        app.dependency_overrides.pop(get_redis)
+        ac.cookies.clear()
@@ -0,0 +1,112 @@
+from http import HTTPStatus
+from uuid import uuid4
+
+import jwt
+from async_fastapi_jwt_auth import AuthJWT
+from cryptography.hazmat.primitives import serialization
+from fakeredis import FakeServer, aioredis
+from httpx import AsyncClient
+
+from db.redis import get_redis
+from main import app
+from models.entity import User
+from services.signing_keys import KeyRing, SigningKey, generate_key
+
+START_URL = "/api/v1/auth/"
+
+
+def load_ring(keys_dir, active_kid) -> KeyRing:
+    return KeyRing.from_dir(str(keys_dir), active_kid)
+
+
+async def test_jwks_cache_headers(tmp_path, ac: AsyncClient, monkeypatch):
+    generate_key(str(tmp_path), 'ed-1')
+    generate_key(str(tmp_path), 'rsa-1', 'RS256')
+    ring = load_ring(tmp_path, 'ed-1')
+    monkeypatch.setattr('services.signing_keys.key_ring', ring)
+
+    response = await ac.get(START_URL + "jwks/")
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers['cache-control'] == 'public, max-age=300'
+    keys = {key['kid']: key for key in response.json()['keys']}
+    assert keys['ed-1']['alg'] == 'EdDSA' and keys['ed-1']['kty'] == 'OKP'
+    assert keys['rsa-1']['alg'] == 'RS256' and keys['rsa-1']['kty'] == 'RSA'
+    assert not any('d' in key for key in keys.values())
+    assert jwt.PyJWK(keys['ed-1']).key.public_bytes_raw() == ring.get('ed-1').public_key.public_bytes_raw()
+
+    response = await ac.get(START_URL + "jwks/", headers={'If-None-Match': response.headers['etag']})
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+
+
+async def test_key_rotation(tmp_path, ac: AsyncClient, monkeypatch):
+    user = User(login='admin', password='admin', first_name='dima', last_name='ivanov', role_id=uuid4(),
+                email='test@mail.ru', is_admin=False)
+    user.id = uuid4()
+
+    async def mock_get_obj_by_attr_name(*args, **kwargs):
+        return user
+
+    async def mock_return_null(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr('services.user.BaseRepository.get_obj_by_attr_name', mock_get_obj_by_attr_name)
+    monkeypatch.setattr('services.user.BaseRepository.get_obj_by_pk', mock_get_obj_by_attr_name)
+    monkeypatch.setattr('services.user.BaseRepository.create_obj', mock_return_null)
+    redis = aioredis.FakeRedis(server=FakeServer())
+    app.dependency_overrides[get_redis] = lambda: redis
+    headers = {'User-Agent': 'google'}
+    generate_key(str(tmp_path), 'key-1')
+    monkeypatch.setattr('services.signing_keys.key_ring', load_ring(tmp_path, 'key-1'))
+    try:
+        response = await ac.post(START_URL + "login/", headers=headers, json={'login': 'admin', 'password': 'admin'})
+        old_cookies = dict(response.cookies)
+        ac.cookies.clear()
+        assert jwt.get_unverified_header(old_cookies['access_token_cookie']) == {
+            'alg': 'EdDSA', 'kid': 'key-1', 'typ': 'JWT'
+        }
+
+        # новый ключ подписывает, старый еще проверяет выпущенные им токены
+        generate_key(str(tmp_path), 'key-2')
+        monkeypatch.setattr('services.signing_keys.key_ring', load_ring(tmp_path, 'key-2'))
+        response = await ac.get(START_URL + "get_user/", headers=headers, cookies=old_cookies)
+        assert response.status_code == HTTPStatus.OK
+        response = await ac.post(START_URL + "refresh/", headers=headers, cookies=old_cookies)
+        assert response.status_code == HTTPStatus.OK
+        new_cookies = dict(response.cookies)
+        ac.cookies.clear()
+        assert jwt.get_unverified_header(new_cookies['access_token_cookie'])['kid'] == 'key-2'
+
+        # старый ключ удален
+        (tmp_path / 'key-1.pem').unlink()
+        monkeypatch.setattr('services.signing_keys.key_ring', load_ring(tmp_path, 'key-2'))
+        response = await ac.get(START_URL + "get_user/", headers=headers, cookies=old_cookies)
+        assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+        response = await ac.get(START_URL + "get_user/", headers=headers, cookies=new_cookies)
+        assert response.status_code == HTTPStatus.OK
+
+        # токены, подписанные SECRET_KEY, принимаются, пока это не выключено
+        legacy_token = await AuthJWT().create_access_token(subject=str(user.id), user_claims={'user_agent': 'google'})
+        legacy_cookies = {'access_token_cookie': legacy_token}
+        response = await ac.get(START_URL + "get_user/", headers=headers, cookies=legacy_cookies)
+        assert response.status_code == HTTPStatus.OK
+        monkeypatch.setattr('core.config.app_settings.jwt_accept_secret_key', False)
+        response = await ac.get(START_URL + "get_user/", headers=headers, cookies=legacy_cookies)
+        assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+    finally:
+        app.dependency_overrides.pop(get_redis)
+        ac.cookies.clear()
+
+
+def test_public_key_only_verifies(tmp_path):
+    private_path = generate_key(str(tmp_path), 'old')
+    key = SigningKey.from_file(private_path)
+    (tmp_path / 'old.pub').write_bytes(key.public_key.public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    ))
+    private_path.unlink()
+    generate_key(str(tmp_path), 'new')
+
+    ring = load_ring(tmp_path, 'new')
+    assert ring.get('old').private_key is None
+    assert ring.get('old').jwk == key.jwk
@@ -0,0 +1,40 @@
+from services.user_agents import UserAgentCache, user_agent_hash
+
+
+class FakeSession:
+    def __init__(self, table: dict[bytes, int]):
+        self.table = table
+        self.statements = []
+        self.commits = 0
+
+    async def execute(self, statement, rows=None):
+        self.statements.append(str(statement).split()[0])
+        if rows is not None:
+            for row in rows:
+                self.table.setdefault(row['hash'], len(self.table) + 1)
+            return None
+        hashes = statement.whereclause.right.value
+        return [(self.table[hash], hash) for hash in hashes if hash in self.table]
+
+    async def commit(self):
+        self.commits += 1
+
+
+async def test_resolve_batches_misses_and_caches_ids():
+    session = FakeSession({user_agent_hash('google'): 1})
+    cache = UserAgentCache(size=2)
+
+    ids = await cache.resolve(session, ['google', 'yandex', 'google'])
+    assert ids == {'google': 1, 'yandex': 2}
+    # один SELECT на все строки, INSERT только новых, SELECT их id
+    assert session.statements == ['SELECT', 'INSERT', 'SELECT']
+    assert session.commits == 1
+
+    session.statements.clear()
+    assert await cache.resolve(session, ['google', 'yandex']) == ids
+    assert session.statements == []
+
+    # самая давно использованная строка вытесняется
+    await cache.resolve(session, ['safari'])
+    assert cache.get('google') is None
+    assert cache.get('yandex') == 2